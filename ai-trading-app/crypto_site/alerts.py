@@ -0,0 +1,86 @@
+# alerts.py
+# Avaliação dos alertas de preço, separada da rota para poder ser usada pelo refresher e pelo replay.
+# Os alertas são comparados com o máximo/mínimo desde a última avaliação (buffer do market_data),
+# e não só com o último fecho, para apanhar wicks entre polls. Antes do email o alerta é
+# reclamado com um UPDATE condicional: se dois processos o virem disparar, só um envia.
+# Alertas criados depois da última passagem são comparados só com os preços desde a sua criação.
+import time
+from flask_mail import Message
+from extensions import db, mail
+from models import PriceAlert
+from metrics import track_upstream, record_error
+from usercache import users as user_cache
+import market_data
+from orders import _epoch
+
+CONSUMER = 'alerts'
+_last_pass = {} # símbolo -> epoch da última leitura take_range neste processo
+
+def send_alert_email(alert, price):
+    msg = Message(f"🔔 Alerta de Preço: {alert.symbol}", recipients=[alert.owner.email])
+    msg.body = f"O preço de {alert.symbol} atingiu o teu alvo de ${alert.target_price}.\nPreço Atual: ${price:,.2f}\n\nBons trades,\nEquipa FlowTrade."
+    with track_upstream('smtp'):
+        mail.send(msg)
+
+def trigger_price(alert, low, high):
+    # Preço que cruzou o alvo (None se não cruzou)
+    if alert.condition == 'above' and high >= alert.target_price:
+        return high
+    if alert.condition == 'below' and low <= alert.target_price:
+        return low
+    return None
+
+def _set_active(alert, active):
+    # UPDATE condicional (is_active = not active): True se mudou o estado nesta chamada.
+    # O ORM não o vê: a contagem de alertas ativos na cache do utilizador é avisada à parte.
+    user_cache.changed(alert.user_id)
+    return db.session.execute(
+        db.update(PriceAlert).where(PriceAlert.id == alert.id, PriceAlert.is_active.is_(not active))
+        .values(is_active=active).execution_options(synchronize_session=False)).rowcount == 1
+
+def evaluate_alerts(store=None, active_alerts=None, notify=send_alert_email):
+    # Devolve a lista de (alerta, preço) disparados
+    store = store or market_data.prices
+    if active_alerts is None:
+        active_alerts = PriceAlert.query.filter_by(is_active=True).all()
+    # Uma leitura de máximo/mínimo por símbolo (não por alerta)
+    now, ranges, recent = time.time(), {}, {}
+    for sym in {a.symbol for a in active_alerts}:
+        ranges[sym] = (store.take_range(sym, CONSUMER), _last_pass.get(sym))
+        _last_pass[sym] = now
+    fired = []
+    for alert in active_alerts:
+        window, last = ranges[alert.symbol]
+        created = _epoch(alert.created_at)
+        if last is None or created > last:
+            # Criado depois da última passagem (ou sem passagem neste processo): o intervalo do
+            # consumidor pode ter wicks de antes do alerta existir. Um range_since por minuto.
+            key = (alert.symbol, created - created % 60)
+            if key not in recent:
+                recent[key] = store.range_since(alert.symbol, created)
+            window = recent[key]
+        if window is None:
+            continue
+        price = trigger_price(alert, *window)
+        if price is None:
+            continue
+        # Reclamar (e gravar) antes do email: outro processo que o veja disparar já não o apanha
+        claimed = _set_active(alert, False)
+        db.session.commit()
+        if not claimed:
+            continue
+        try:
+            notify(alert, price)
+        except Exception as e:
+            record_error(f"check_alerts[{alert.symbol}]", e)
+            # O alerta volta a ficar ativo e o intervalo volta ao buffer: dispara na próxima
+            # passagem mesmo que o preço já tenha revertido
+            _set_active(alert, True)
+            db.session.commit()
+            store.return_range(alert.symbol, CONSUMER, window)
+            continue
+        fired.append((alert, price))
+    return fired
+
+def active_alert_symbols():
+    return [sym for (sym,) in db.session.query(PriceAlert.symbol).filter_by(is_active=True).distinct()]
@@ -3,28 +3,49 @@
 #CURRENT VERSION: 2.0 APLHA
 import os
 import json
-import feedparser
-from flask import Flask, render_template, jsonify, request, redirect, url_for, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, Response
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 from flask_login import login_user, login_required, logout_user, current_user
 from flask_mail import Message
 from itsdangerous import URLSafeTimedSerializer
-import yfinance as yf
-import requests
 import time
 import io
-from PIL import Image
 from models import PriceAlert
-from datetime import datetime, date
+from datetime import datetime
 
 # --- IMPORTAÇÕES LOCAIS (A nova organização) ---
 from extensions import db, login_manager, mail, cache
-from models import User, Watchlist, Portfolio, Transaction
+from models import User, Watchlist, Portfolio, Order, CopySubscription
+from lazy_imports import yf, requests, feedparser, Image # Carregados só no primeiro uso
+import metrics
+import market_data
+from metrics import track_upstream, record_error
+from alerts import evaluate_alerts, active_alert_symbols
+import orders
+import trading
+import copytrade
+import rebalance
+import ledger
+import risk
+import optimizer
+import decoder
+import archive
+import assets
+import responses
+import coins
+import charts
+import movers
+import jobs
+import dbrouting
+import usercache
+import snapshot
+import profiler
+from coins import yahoo_symbol
 from utils import (
-    get_stock_price, get_user_badges, get_market_sentiment, 
+    lookup_price, get_user_badges, get_market_sentiment, 
     get_market_movers, get_top_cryptos, get_quick_ticker_data, 
-    smart_format, client # Cliente AI importado do utils
+    smart_format, get_ai_client # Cliente AI criado on-demand no utils
 )
 
 # Configuração Inicial
@@ -41,24 +62,86 @@ app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
 
 # Base de Dados
-database_url = os.getenv("DATABASE_URL", "sqlite:///db.sqlite")
-if database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+def normalize_database_url(url):
+    return url.replace("postgres://", "postgresql://", 1) if url.startswith("postgres://") else url
+
+database_url = normalize_database_url(os.getenv("DATABASE_URL", "sqlite:///db.sqlite"))
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dbrouting.engine_options(database_url) # DB_POOL_* no ambiente
+# Réplica de leitura (opcional) para as rotas @dbrouting.read_only; REPLICA_LAG_SECONDS depois de
+# uma escrita o mesmo cliente volta a ler da principal (read-your-writes)
+replica_url = os.getenv("DATABASE_REPLICA_URL")
+if replica_url:
+    replica_url = normalize_database_url(replica_url)
+    app.config['SQLALCHEMY_BINDS'] = {dbrouting.REPLICA: {'url': replica_url, **dbrouting.engine_options(replica_url)}}
+app.config['REPLICA_LAG_SECONDS'] = int(os.getenv("REPLICA_LAG_SECONDS", "10"))
+# Cache do utilizador autenticado e das quotas (usercache.py); 0 desliga
+app.config['USER_CACHE_TTL'] = int(os.getenv("USER_CACHE_TTL", "30"))
+# Intervalo de gravação em lote dos contadores de AI (0 = grava a cada análise)
+app.config['QUOTA_FLUSH_SECONDS'] = int(os.getenv("QUOTA_FLUSH_SECONDS", "5"))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Métricas Prometheus em /metrics (desligadas por defeito)
+app.config['METRICS_ENABLED'] = os.getenv("METRICS_ENABLED", "0") == "1"
+
+# Universo do otimizador de carteiras (/generate_portfolio)
+app.config['STRATEGY_UNIVERSE'] = os.getenv("STRATEGY_UNIVERSE", "BTC,ETH,SOL,BNB,XRP,ADA,AVAX,LINK,DOT,LTC").split(",")
+
+# Universo dos movimentos do mercado (/crypto, home): segue-se a variação 24h de todos pelo feed de preços
+app.config['MOVERS_UNIVERSE'] = [s for s in os.getenv("MOVERS_UNIVERSE", "").split(",") if s] or \
+    [symbol for symbol, _ in coins.KNOWN if symbol not in coins.STABLECOINS]
+
+# Arquivo Parquet das transações antigas (flask --app app archive-transactions)
+app.config['TX_ARCHIVE_DIR'] = os.getenv("TX_ARCHIVE_DIR", os.path.join(app.instance_path, "tx_archive"))
+app.config['TX_ARCHIVE_AGE_DAYS'] = int(os.getenv("TX_ARCHIVE_AGE_DAYS", "90"))
+
+# /api/check_alerts é global: os polls dos browsers dentro deste intervalo reutilizam a última verificação
+app.config['ALERT_CHECK_INTERVAL'] = int(os.getenv("ALERT_CHECK_INTERVAL", "15"))
+
+# Refresher de preços em background (segundos; 0 = desligado, os alertas correm via /api/check_alerts;
+# ligado, o /api/check_alerts só devolve o resultado publicado pelo líder)
+app.config['PRICE_REFRESH_INTERVAL'] = int(os.getenv("PRICE_REFRESH_INTERVAL", "0"))
+# Notícias em background (segundos; 0 = desligado, cada worker vai aos feeds quando a cache expira)
+app.config['NEWS_REFRESH_INTERVAL'] = int(os.getenv("NEWS_REFRESH_INTERVAL", "0"))
+# Tarefas em background com um só líder por deploy (jobs.py): advisory locks no Postgres,
+# ficheiros de lock em JOB_LOCK_DIR nas outras BDs
+app.config['JOB_LEASE_SECONDS'] = int(os.getenv("JOB_LEASE_SECONDS", "30"))
+app.config['JOB_LOCK_DIR'] = os.getenv("JOB_LOCK_DIR", os.path.join(app.instance_path, "locks"))
+# Snapshot do estado de mercado para arranques quentes (snapshot.py): gravado a cada
+# SNAPSHOT_INTERVAL segundos (0 = desligado) e restaurado se tiver menos de SNAPSHOT_MAX_AGE
+app.config['SNAPSHOT_INTERVAL'] = int(os.getenv("SNAPSHOT_INTERVAL", "0"))
+app.config['SNAPSHOT_DIR'] = os.getenv("SNAPSHOT_DIR", os.path.join(app.instance_path, "snapshot"))
+app.config['SNAPSHOT_MAX_AGE'] = int(os.getenv("SNAPSHOT_MAX_AGE", "900"))
+# Profiler por amostragem para admins (profiler.py): cada worker vê uma sessão nova em até
+# PROFILE_POLL_SECONDS (0 = só o worker que a recebeu); header X-Profile amostra um pedido
+app.config['PROFILE_POLL_SECONDS'] = int(os.getenv("PROFILE_POLL_SECONDS", "2"))
+app.config['PROFILE_MAX_SECONDS'] = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+app.config['PROFILE_REQUEST_HZ'] = int(os.getenv("PROFILE_REQUEST_HZ", "1000"))
+
 # --- INICIALIZAR EXTENSÕES ---
 db.init_app(app)
 login_manager.init_app(app)
 login_manager.login_view = 'login_page'
 mail.init_app(app)
 cache.init_app(app)
+metrics.init_app(app, cache)
+copytrade.fanout.init_app(app)
+archive.store.init_app(app)
+movers.tracker.init_app(app)
+jobs.coordinator.init_app(app)
+dbrouting.init_app(app)
+usercache.users.init_app(app)
+usercache.ai_quota.init_app(app)
+snapshot.market.init_app(app)
+profiler.sampler.init_app(app) # /admin/profile
+assets.pipeline.init_app(app) # nomes com hash no url_for('static') depois do build-assets
+responses.init_app(app) # orjson, ETag/304 e gzip nas respostas JSON
 
 token_serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    return usercache.users.get(int(user_id)) # sem SELECT enquanto a entrada estiver na cache
 
 # --- ROTAS PRINCIPAIS ---
 
@@ -75,7 +158,9 @@ def home():
 @cache.cached(timeout=60)
 def crypto_page():
     gainers, losers = get_market_movers()
-    return render_template('crypto.html', market_data=get_top_cryptos(limit=20), gainers=gainers, losers=losers, active_page='crypto')
+    return render_template('crypto.html', market_data=get_top_cryptos(limit=20), gainers=gainers, losers=losers,
+                           volume_leaders=movers.tracker.volume_leaders(3), new_highs=movers.tracker.new_highs(3),
+                           new_lows=movers.tracker.new_lows(3), active_page='crypto')
 
 @app.context_processor
 def inject_user_plan():
@@ -222,8 +307,9 @@ def forgot_password():
             link = url_for('reset_password', token=token, _external=True)
             msg = Message('Recuperar Password', recipients=[email])
             msg.body = f'Clica para mudar a password: {link}'
-            try: mail.send(msg)
-            except: pass
+            try:
+                with track_upstream('smtp'): mail.send(msg)
+            except Exception as e: record_error("forgot_password", e)
             flash('Email de recuperação enviado!', 'success')
         else: flash('Email não encontrado.', 'error')
         return redirect(url_for('login_page'))
@@ -243,23 +329,22 @@ def reset_password(token):
         return redirect(url_for('login_page'))
     return render_template('reset_password.html', token=token)
 
+# Análises de AI por dia (AI Vision e gerações novas do Market Decoder, quota partilhada)
+AI_LIMITS = {'Starter': 0, 'Pro': 5, 'Ultra': 9999}
+
 # --- ROTA: AI CHART VISION ---
 @app.route('/ai/vision', methods=['GET', 'POST'])
 @login_required
 def ai_vision_page():
     # --- LÓGICA DE LIMITES ---
-    LIMITS = {'Starter': 0, 'Pro': 5, 'Ultra': 9999}
     # Se o plano não for reconhecido, assume 0
-    user_limit = LIMITS.get(current_user.plan_type, 0)
+    user_limit = AI_LIMITS.get(current_user.plan_type, 0)
     
-    # Verificar e Resetar contador diário
-    if current_user.last_ai_usage != date.today():
-        current_user.ai_usage_count = 0
-        current_user.last_ai_usage = date.today()
-        db.session.commit()
+    # Análises de hoje (o contador recomeça sozinho quando muda o dia)
+    used = usercache.ai_quota.used(current_user)
 
     # Calcular restantes
-    remaining = user_limit - current_user.ai_usage_count
+    remaining = user_limit - used
 
     # --- MÉTODO GET (Mostrar Página) ---
     if request.method == 'GET':
@@ -272,7 +357,7 @@ def ai_vision_page():
     # --- MÉTODO POST (Upload Imagem) ---
     
     # 1. Verificar Limites antes de processar
-    if current_user.ai_usage_count >= user_limit:
+    if used >= user_limit:
         return jsonify({'error': 'Limite diário atingido. Faz upgrade para Ultra!'})
 
     if 'chart_image' not in request.files:
@@ -304,19 +389,22 @@ def ai_vision_page():
         """
 
         # 4. Enviar para a AI
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[prompt, image]
-        )
+        client = get_ai_client()
+        if client is None:
+            return jsonify({'error': 'Serviço de AI indisponível.'})
+        with track_upstream('gemini'):
+            response = client.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=[prompt, image]
+            )
         
         # 5. SUCESSO: Incrementar contador
-        current_user.ai_usage_count += 1
-        db.session.commit()
+        usercache.ai_quota.add(current_user.id) # gravado em lote na BD
         
         return jsonify({'status': 'success', 'analysis': response.text})
 
     except Exception as e:
-        print(f"Erro AI Vision: {e}")
+        record_error("ai_vision", e)
         return jsonify({'error': 'Erro ao analisar a imagem. Tenta novamente.'})
 
 # --- PAPER TRADING (SIMULADOR) ---
@@ -325,7 +413,7 @@ def ai_vision_page():
 @login_required
 def paper_trading():
     portfolio_items = Portfolio.query.filter_by(user_id=current_user.id).all()
-    transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.timestamp.desc()).limit(10).all()
+    transactions = archive.store.rows(current_user.id, newest_first=True, limit=10)
     
     total_portfolio_value = 0
     enriched_portfolio = []
@@ -333,19 +421,20 @@ def paper_trading():
     allocation_data = []
 
     # Batch Download para performance
-    tickers_to_fetch = [f"{item.symbol}-USD" if not item.symbol.endswith("-USD") else item.symbol for item in portfolio_items]
-    symbols_map = {item.symbol: (f"{item.symbol}-USD" if not item.symbol.endswith("-USD") else item.symbol) for item in portfolio_items}
+    symbols_map = {item.symbol: yahoo_symbol(item.symbol) for item in portfolio_items}
+    tickers_to_fetch = list(symbols_map.values())
     
     live_prices = {}
     if tickers_to_fetch:
         try:
-            data = yf.download(tickers_to_fetch, period="1d", interval="1d", progress=False, threads=True, group_by='ticker')
+            with track_upstream('yahoo'):
+                data = yf.download(tickers_to_fetch, period="1d", interval="1d", progress=False, threads=True, group_by='ticker')
             for symbol in tickers_to_fetch:
                 try:
                     price = data['Close'].iloc[-1] if len(tickers_to_fetch) == 1 else data[symbol]['Close'].iloc[-1]
                     if float(price) > 0: live_prices[symbol] = float(price)
-                except: pass
-        except: pass
+                except Exception as e: record_error(f"paper_trading[{symbol}]", e)
+        except Exception as e: record_error("paper_trading", e)
 
     for item in portfolio_items:
         yf_symbol = symbols_map.get(item.symbol)
@@ -372,14 +461,16 @@ def paper_trading():
         allocation_labels.append("Cash")
         allocation_data.append(round(current_user.virtual_balance, 2))
 
+    open_orders = Order.query.filter_by(user_id=current_user.id, status='OPEN').order_by(Order.created_at.desc()).all()
+
     return render_template('paper_trading.html', portfolio=enriched_portfolio, transactions=transactions,
                            net_worth=net_worth, alloc_labels=json.dumps(allocation_labels),
-                           alloc_data=json.dumps(allocation_data), active_page='paper_trading')
+                           alloc_data=json.dumps(allocation_data), open_orders=open_orders, active_page='paper_trading')
 
 @app.route('/paper_trading/trade', methods=['POST'])
 @login_required
 def execute_trade():
-    symbol = request.form.get('symbol', '').upper().strip()
+    symbol = coins.canonical(request.form.get('symbol'))
     action = request.form.get('action')
     trade_mode = request.form.get('trade_mode')
     
@@ -387,53 +478,129 @@ def execute_trade():
     except: return redirect(url_for('paper_trading'))
     if input_value <= 0: return redirect(url_for('paper_trading'))
 
-    price = get_stock_price(f"{symbol}-USD")
-    if not price: 
-        price = get_stock_price(symbol)
-        if not price:
-            flash('Moeda não encontrada.', 'error')
-            return redirect(url_for('paper_trading'))
+    # Símbolos que o Yahoo já recusou não voltam a ir à rede durante INVALID_TTL
+    if coins.registry.is_invalid(symbol):
+        price, unknown = None, True
+    else:
+        price, unknown = lookup_price(yahoo_symbol(symbol))
+    if not price:
+        coins.registry.mark_invalid(symbol, transient=not unknown)
+        flash('Moeda não encontrada.' if unknown else 'Preço indisponível de momento, tenta novamente.', 'error')
+        return redirect(url_for('paper_trading'))
+    coins.registry.remember(symbol)
 
     amount = input_value / price if trade_mode == 'fiat' else input_value
-    cost = amount * price
 
+    # Saldo e posição são alterados com UPDATEs condicionais (trading.py): seguro com vários workers
+    # Os seguidores (modo "seguir") são atualizados em background pelo copytrade.fanout
     if action == 'BUY':
-        if current_user.virtual_balance >= cost:
-            current_user.virtual_balance -= cost
-            pos = Portfolio.query.filter_by(user_id=current_user.id, symbol=symbol).first()
-            if pos:
-                total_old = pos.amount * pos.avg_price
-                new_amt = pos.amount + amount
-                pos.avg_price = (total_old + cost) / new_amt
-                pos.amount = new_amt
-            else:
-                db.session.add(Portfolio(user_id=current_user.id, symbol=symbol, amount=amount, avg_price=price))
-            db.session.add(Transaction(user_id=current_user.id, symbol=symbol, type=action, price=price, amount=amount, total_value=cost))
-            db.session.commit()
+        if trading.buy(current_user.id, symbol, amount, price):
+            copytrade.on_leader_trade(current_user.id, symbol, action, amount, price)
             flash(f'Comprado!', 'success')
         else:
             flash('Saldo insuficiente.', 'error')
 
     elif action == 'SELL':
-        pos = Portfolio.query.filter_by(user_id=current_user.id, symbol=symbol).first()
-        if pos and pos.amount >= (amount * 0.99999):
-            current_user.virtual_balance += cost
-            pos.amount -= amount
-            if pos.amount <= 0.000001: db.session.delete(pos)
-            db.session.add(Transaction(user_id=current_user.id, symbol=symbol, type=action, price=price, amount=amount, total_value=cost))
-            db.session.commit()
+        if trading.sell(current_user.id, symbol, amount, price):
+            copytrade.on_leader_trade(current_user.id, symbol, action, amount, price)
             flash(f'Vendido!', 'success')
         else:
             flash('Moedas insuficientes.', 'error')
     return redirect(url_for('paper_trading'))
 
+@app.route('/api/symbols')
+def symbol_search():
+    # Sugestões para a caixa de símbolo (prefixo do símbolo ou do nome), a partir da trie em memória
+    try: limit = min(int(request.args.get('limit', coins.MAX_SUGGESTIONS)), coins.MAX_SUGGESTIONS)
+    except ValueError: limit = coins.MAX_SUGGESTIONS
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify([])
+    return jsonify([{'symbol': c.symbol, 'name': c.name, 'icon': c.icon, 'tradingview': c.tradingview}
+                    for c in coins.registry.search(query, limit)])
+
+# --- ORDENS PENDENTES (LIMIT / STOP / OCO) ---
+
+@app.route('/paper_trading/order', methods=['POST'])
+@login_required
+def place_order():
+    symbol = coins.canonical(request.form.get('symbol'))
+    side = request.form.get('side')
+    order_type = request.form.get('order_type')
+    try:
+        amount = float(request.form.get('amount'))
+        price = float(request.form.get('price'))
+        stop_price = float(request.form.get('stop_price') or 0)
+    except:
+        flash('Valores inválidos.', 'error')
+        return redirect(url_for('paper_trading'))
+
+    try:
+        orders.place_orders(current_user.id, symbol, side, order_type, amount, price, stop_price)
+        flash('Ordem colocada! Será executada quando o preço lá chegar.', 'success')
+    except ValueError as e:
+        flash(str(e), 'error')
+    return redirect(url_for('paper_trading'))
+
+@app.route('/paper_trading/order/cancel/<int:id>')
+@login_required
+def cancel_order(id):
+    order = Order.query.get_or_404(id)
+    if order.user_id == current_user.id:
+        orders.cancel_order(order)
+        flash('Ordem cancelada.', 'success')
+    return redirect(url_for('paper_trading'))
+
+# --- REBALANCEAMENTO (PESOS-ALVO) ---
+
+@app.route('/paper_trading/rebalance', methods=['POST'])
+@login_required
+def rebalance_portfolio():
+    data = request.get_json(silent=True) or {}
+    try:
+        weights = rebalance.parse_targets(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    positions = dict(db.session.execute(
+        db.select(Portfolio.symbol, Portfolio.amount).where(Portfolio.user_id == current_user.id)).all())
+    symbols = set(positions) | set(weights)
+    try:
+        prices = market_data.refresh(symbols) if symbols else {} # um só download para todos os símbolos
+    except Exception as e:
+        record_error("rebalance_prices", e)
+        return jsonify({'error': 'Serviço de cotações indisponível.'}), 503
+    missing = sorted(s for s in symbols if not prices.get(s))
+    if missing:
+        return jsonify({'error': f"Sem cotação para: {', '.join(missing)}"}), 400
+
+    sells, buys, equity = rebalance.plan(positions, current_user.virtual_balance, weights, prices)
+    trades = [{'symbol': s, 'side': side, 'amount': q, 'price': p, 'value': q * p}
+              for side, fills in (('SELL', sells), ('BUY', buys)) for s, q, p in fills]
+    if data.get('dry_run'):
+        return jsonify({'status': 'preview', 'equity': equity, 'trades': trades})
+
+    try:
+        if not rebalance.execute(current_user.id, sells, buys):
+            db.session.rollback()
+            return jsonify({'error': 'A carteira mudou entretanto ou o saldo não chega. Tenta outra vez.'}), 409
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        record_error("rebalance_portfolio", e)
+        return jsonify({'error': 'Erro ao executar.'}), 500
+
+    for t in trades:
+        copytrade.on_leader_trade(current_user.id, t['symbol'], t['side'], t['amount'], t['price'])
+    return jsonify({'status': 'ok', 'equity': equity, 'trades': trades})
+
 @app.route('/paper_trading/reset')
 @login_required
 def reset_account():
-    current_user.virtual_balance = 10000.0
-    Portfolio.query.filter_by(user_id=current_user.id).delete()
-    Transaction.query.filter_by(user_id=current_user.id).delete()
+    open_ids = trading.reset_account(current_user.id)
     db.session.commit()
+    orders.engine.discard(open_ids)
+    archive.store.purge(current_user.id)
     flash('Conta reiniciada!', 'success')
     return redirect(url_for('paper_trading'))
 
@@ -449,31 +616,33 @@ def copy_trade_preview(target_username):
     total_cost_to_copy = 0.0
     target_assets = []
     
-    tickers_to_fetch = [f"{item.symbol}-USD" for item in target_user.portfolio]
+    tickers_to_fetch = [yahoo_symbol(item.symbol) for item in target_user.portfolio]
     live_prices = {}
     if tickers_to_fetch:
         try:
-            data = yf.download(tickers_to_fetch, period="1d", interval="1d", progress=False, threads=True, group_by='ticker')
+            with track_upstream('yahoo'):
+                data = yf.download(tickers_to_fetch, period="1d", interval="1d", progress=False, threads=True, group_by='ticker')
             for item in target_user.portfolio:
-                sym = f"{item.symbol}-USD"
+                sym = yahoo_symbol(item.symbol)
                 try:
                     price = data['Close'].iloc[-1] if len(tickers_to_fetch) == 1 else data[sym]['Close'].iloc[-1]
                     live_prices[sym] = float(price)
                 except: live_prices[sym] = item.avg_price
-        except: pass
+        except Exception as e: record_error("copy_trade_prices", e)
 
     for item in target_user.portfolio:
-        price = live_prices.get(f"{item.symbol}-USD", item.avg_price)
+        price = live_prices.get(yahoo_symbol(item.symbol), item.avg_price)
         cost = item.amount * price
         total_cost_to_copy += cost
         target_assets.append({'symbol': item.symbol, 'amount': item.amount, 'current_price': price, 'cost': cost})
 
     my_equity = current_user.virtual_balance + sum([i.amount * i.avg_price for i in current_user.portfolio])
     badges = get_user_badges(target_user)
+    subscription = CopySubscription.query.filter_by(follower_id=current_user.id, leader_id=target_user.id, is_active=True).first()
 
     return render_template('copy_confirm.html', target=target_user, target_assets=target_assets,
                            total_cost=total_cost_to_copy, my_cash=current_user.virtual_balance,
-                           my_equity=my_equity, badges=badges)
+                           my_equity=my_equity, badges=badges, subscription=subscription)
 
 @app.route('/copy_trade/execute/<target_username>', methods=['POST'])
 @login_required
@@ -481,59 +650,39 @@ def copy_trade_execute(target_username):
     target_user = User.query.filter_by(username=target_username).first_or_404()
     action_type = request.form.get('action_type')
     
-    tickers_to_fetch = [f"{item.symbol}-USD" for item in target_user.portfolio]
+    tickers_to_fetch = [yahoo_symbol(item.symbol) for item in target_user.portfolio]
     live_prices = {}
     if tickers_to_fetch:
         try:
-            data = yf.download(tickers_to_fetch, period="1d", interval="1d", progress=False, threads=True, group_by='ticker')
+            with track_upstream('yahoo'):
+                data = yf.download(tickers_to_fetch, period="1d", interval="1d", progress=False, threads=True, group_by='ticker')
             for item in target_user.portfolio:
-                sym = f"{item.symbol}-USD"
+                sym = yahoo_symbol(item.symbol)
                 try:
                     price = data['Close'].iloc[-1] if len(tickers_to_fetch) == 1 else data[sym]['Close'].iloc[-1]
                     live_prices[sym] = float(price)
                 except: live_prices[sym] = item.avg_price
-        except: pass
+        except Exception as e: record_error("copy_trade_prices", e)
 
-    cost_needed = 0.0
-    orders = []
-    for item in target_user.portfolio:
-        price = live_prices.get(f"{item.symbol}-USD", item.avg_price)
-        cost = item.amount * price
-        cost_needed += cost
-        orders.append({'symbol': item.symbol, 'amount': item.amount, 'price': price, 'cost': cost})
+    fills = [(item.symbol, item.amount, live_prices.get(yahoo_symbol(item.symbol), item.avg_price)) for item in target_user.portfolio]
 
     try:
+        # Tudo em lote e num só commit: nº de idas à BD constante, seja qual for o tamanho da carteira
         if action_type == 'sell_and_buy':
-            liq_val = 0
-            for item in current_user.portfolio:
-                liq_val += (item.amount * item.avg_price)
-                db.session.add(Transaction(user_id=current_user.id, symbol=item.symbol, type="SELL", price=item.avg_price, amount=item.amount, total_value=item.amount*item.avg_price))
-                db.session.delete(item)
-            current_user.virtual_balance += liq_val
-            db.session.commit()
-
-        if current_user.virtual_balance < cost_needed:
+            trading.liquidate(current_user.id) # ao preço médio, como antes
+
+        # O débito total é um único UPDATE condicional; se falhar não se vende nem compra nada
+        if not trading.buy_many(current_user.id, fills):
+            db.session.rollback()
             flash("Saldo insuficiente.", "error")
             return redirect(url_for('copy_trade_preview', target_username=target_username))
 
-        for order in orders:
-            current_user.virtual_balance -= order['cost']
-            existing = Portfolio.query.filter_by(user_id=current_user.id, symbol=order['symbol']).first()
-            if existing:
-                total_old = existing.amount * existing.avg_price
-                new_amt = existing.amount + order['amount']
-                existing.avg_price = (total_old + order['cost']) / new_amt
-                existing.amount = new_amt
-            else:
-                db.session.add(Portfolio(user_id=current_user.id, symbol=order['symbol'], amount=order['amount'], avg_price=order['price']))
-            
-            db.session.add(Transaction(user_id=current_user.id, symbol=order['symbol'], type="BUY", price=order['price'], amount=order['amount'], total_value=order['cost']))
-
         db.session.commit()
         flash("Cópia realizada com sucesso!", "success")
         return redirect(url_for('paper_trading'))
-    except:
+    except Exception as e:
         db.session.rollback()
+        record_error("copy_trade_execute", e)
         flash("Erro ao executar.", "error")
         return redirect(url_for('home'))
 
@@ -541,11 +690,116 @@ def copy_trade_execute(target_username):
 
 @app.route('/history')
 @login_required
+@dbrouting.read_only
 def history_page():
-    transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.timestamp.desc()).all()
+    transactions = archive.store.rows(current_user.id, newest_first=True) # tabela + arquivo
     return render_template('history.html', transactions=transactions, active_page='history')
 
+@app.route('/api/performance/<username>')
+@login_required
+def performance_api(username):
+    # Série de património e P&L (FIFO/LIFO/custo médio) a partir do replay das transações.
+    # O ledger guarda checkpoints diários: só as transações de hoje são reprocessadas.
+    user = User.query.filter_by(username=username).first_or_404()
+    try:
+        return jsonify(ledger.performance(user.id))
+    except Exception as e:
+        db.session.rollback()
+        record_error("performance_api", e)
+        return jsonify({'error': 'Erro ao calcular o desempenho.'})
+
+@app.route('/generate_portfolio', methods=['POST'])
+@login_required
+def generate_portfolio():
+    # Alocação ótima para o perfil de risco (optimizer.py), no formato da crypto_strategy.html
+    data = request.get_json(silent=True) or {}
+    try:
+        capital = float(data.get('capital'))
+        if capital <= 0: raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Capital inválido.'}), 400
+    profile = data.get('risk')
+    if profile not in optimizer.PROFILES:
+        return jsonify({'error': f"Perfil de risco inválido ({', '.join(optimizer.PROFILES)})."}), 400
+    try:
+        return jsonify(optimizer.allocate(app.config['STRATEGY_UNIVERSE'], profile, capital))
+    except ValueError as e:
+        return jsonify({'error': str(e)})
+    except Exception as e:
+        record_error("generate_portfolio", e)
+        return jsonify({'error': 'Erro ao otimizar a carteira.'})
+
+@app.route('/decode_market', methods=['POST'])
+@login_required
+def decode_market():
+    # Resposta da AI em streaming (SSE): o browser mostra os fragmentos à medida que chegam (decoder.py)
+    data = request.get_json(silent=True) or {}
+    user_id, limit = current_user.id, AI_LIMITS.get(current_user.plan_type, 0)
+    def charge():
+        # Só as gerações novas gastam quota (respostas em cache e partilhadas não); se a geração
+        # falhar a análise é devolvida
+        key = usercache.ai_quota.charge(user_id, limit)
+        if key is None:
+            raise PermissionError('Limite diário de AI atingido. Faz upgrade para Ultra!')
+        return lambda: usercache.ai_quota.refund(key)
+    try:
+        events = decoder.stream(data.get('question'), get_ai_client(), app.config['STRATEGY_UNIVERSE'], charge=charge)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 429
+    except ConnectionError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        record_error("decode_market", e)
+        return jsonify({'error': 'Erro na AI.'}), 500
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/risk')
+@login_required
+def risk_api():
+    # VaR/CVaR, volatilidade, beta, correlações e Monte Carlo da carteira atual (risk.py).
+    # Sem @read_only: o market_data.daily_closes grava os dias em falta na tabela daily_price.
+    try:
+        paths = min(max(int(request.args.get('paths', risk.DEFAULT_PATHS)), 1000), risk.MAX_REQUEST_PATHS)
+        horizon = min(max(int(request.args.get('horizon', 30)), 1), risk.MAX_HORIZON)
+        confidence = 0.99 if request.args.get('confidence') == '0.99' else 0.95
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos.'})
+    try:
+        return jsonify(risk.report(current_user.id, paths=paths, horizon=horizon, confidence=confidence))
+    except Exception as e:
+        record_error("risk_api", e)
+        return jsonify({'error': 'Erro ao calcular o risco.'})
+
+# --- GRÁFICOS (SÉRIES PRÓPRIAS, REDUZIDAS À LARGURA DO GRÁFICO) ---
+
+@app.route('/api/chart/<symbol>')
+@login_required
+def chart_api(symbol):
+    # ?range=1d|7d|1m|3m|1y|5y &width=<pixels> &series=close|ohlcv &format=json|delta
+    try:
+        return jsonify(charts.chart(symbol, request.args.get('range', '1d'), request.args.get('width'),
+                                    request.args.get('series', 'close'), request.args.get('format', 'json')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/sparklines')
+@login_required
+def sparklines_api():
+    # Linhas de todos os símbolos pedidos (?symbols=BTC,ETH) ou da watchlist, numa só resposta
+    symbols = [s for s in request.args.get('symbols', '').split(',') if s.strip()]
+    if not symbols:
+        symbols = [w.symbol for w in Watchlist.query.filter_by(user_id=current_user.id)]
+    rng = request.args.get('range', '1d')
+    try:
+        return jsonify({'range': rng, 'series': charts.sparklines(symbols, rng, request.args.get('width'))})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/leaderboard')
+@dbrouting.read_only
 def leaderboard_page():
     users = User.query.all()
     
@@ -553,13 +807,14 @@ def leaderboard_page():
     all_tickers = set()
     for u in users:
         for item in u.portfolio:
-            all_tickers.add(f"{item.symbol}-USD")
+            all_tickers.add(yahoo_symbol(item.symbol))
             
     # 2. Batch Download dos preços atuais (Rápido)
     live_prices = {}
     if all_tickers:
         try:
-            data = yf.download(list(all_tickers), period="1d", interval="1d", progress=False, group_by='ticker')
+            with track_upstream('yahoo'):
+                data = yf.download(list(all_tickers), period="1d", interval="1d", progress=False, group_by='ticker')
             for sym in all_tickers:
                 try:
                     # Se for só uma moeda a estrutura é diferente
@@ -568,18 +823,14 @@ def leaderboard_page():
                     else:
                         price = data[sym]['Close'].iloc[-1]
                     live_prices[sym] = float(price)
-                except: pass
-        except: pass
+                except Exception as e: record_error(f"leaderboard[{sym}]", e)
+        except Exception as e: record_error("leaderboard", e)
 
     # 3. Calcular Net Worth Real usando os preços live
     leaderboard_data = []
     for u in users:
-        portfolio_value = 0.0
-        for item in u.portfolio:
-            # Usa o preço live. Se falhar, usa o avg_price como fallback
-            price = live_prices.get(f"{item.symbol}-USD", item.avg_price)
-            portfolio_value += (item.amount * price)
-            
+        # Usa o preço live. Se falhar, usa o avg_price como fallback
+        portfolio_value = market_data.portfolio_value(u.portfolio, lambda s: live_prices.get(yahoo_symbol(s)))
         nw = u.virtual_balance + portfolio_value
         
         leaderboard_data.append({
@@ -594,8 +845,36 @@ def leaderboard_page():
     leaderboard_data.sort(key=lambda x: x['net_worth'], reverse=True)
     return render_template('leaderboard.html', ranking=leaderboard_data, active_page='leaderboard')
 
+# --- MODO SEGUIR (copy trading automático) ---
+
+@app.route('/copy_trade/follow/<target_username>', methods=['POST'])
+@login_required
+def copy_trade_follow(target_username):
+    target_user = User.query.filter_by(username=target_username).first_or_404()
+    try: ratio = float(request.form.get('ratio') or 1.0)
+    except:
+        flash("Rácio inválido.", "error")
+        return redirect(url_for('copy_trade_preview', target_username=target_username))
+
+    try:
+        copytrade.follow(current_user.id, target_user.id, ratio)
+        flash(f"A seguir {target_user.username}! Os próximos trades serão replicados na tua conta "
+              "(em melhor esforço: um trade feito durante um reinício do servidor pode não ser copiado).", "success")
+    except ValueError as e:
+        flash(str(e), "error")
+    return redirect(url_for('copy_trade_preview', target_username=target_username))
+
+@app.route('/copy_trade/unfollow/<target_username>')
+@login_required
+def copy_trade_unfollow(target_username):
+    target_user = User.query.filter_by(username=target_username).first_or_404()
+    copytrade.unfollow(current_user.id, target_user.id)
+    flash(f"Deixaste de seguir {target_user.username}.", "success")
+    return redirect(url_for('copy_trade_preview', target_username=target_username))
+
 @app.route('/trader/<username>')
 @login_required
+@dbrouting.read_only
 def public_profile(username):
     user = User.query.filter_by(username=username).first_or_404()
     
@@ -603,7 +882,7 @@ def public_profile(username):
     tickers = []
     symbols_map = {}
     for item in user.portfolio:
-        yf_symbol = f"{item.symbol}-USD" if not item.symbol.endswith("-USD") else item.symbol
+        yf_symbol = yahoo_symbol(item.symbol)
         tickers.append(yf_symbol)
         symbols_map[item.symbol] = yf_symbol
 
@@ -612,7 +891,8 @@ def public_profile(username):
     if tickers:
         try:
             # group_by='ticker' é usado para tentar manter estrutura
-            data = yf.download(tickers, period="1d", interval="1d", progress=False, group_by='ticker')
+            with track_upstream('yahoo'):
+                data = yf.download(tickers, period="1d", interval="1d", progress=False, group_by='ticker')
             
             for sym in tickers:
                 val_price = None
@@ -625,15 +905,15 @@ def public_profile(username):
                         # TENTATIVA 2: Aceder direto (Estrutura Plana: Close)
                         # Acontece às vezes se o yfinance simplificar a resposta
                         val_price = data['Close'].iloc[-1]
-                    except: 
-                        pass # Falhou tudo
+                    except Exception as e:
+                        record_error(f"public_profile[{sym}]", e) # Falhou tudo
                 
                 # Se encontrámos um preço válido, guardamos
                 if val_price is not None and float(val_price) > 0:
                     live_prices[sym] = float(val_price)
                     
         except Exception as e:
-            print(f"Erro ao baixar preços no perfil: {e}")
+            record_error("public_profile", e)
 
     # 3. Calcular Património
     portfolio_value = 0.0
@@ -658,11 +938,14 @@ def public_profile(username):
     net_worth = user.virtual_balance + portfolio_value
     pnl_pct = ((net_worth - 10000) / 10000) * 100
     
+    followers = CopySubscription.query.filter_by(leader_id=user.id, is_active=True).count()
+
     return render_template('public_profile.html', 
                            trader=user, 
                            net_worth=net_worth, 
                            pnl=pnl_pct, 
                            portfolio=portfolio_display, 
+                           followers=followers,
                            badges=get_user_badges(user))
 
 @app.route('/profile')
@@ -725,7 +1008,7 @@ def toggle_watchlist(symbol):
         LIMITS = {'Starter': 3, 'Pro': 10, 'Ultra': 999}
         limit = LIMITS.get(current_user.plan_type, 3)
 
-        count = Watchlist.query.filter_by(user_id=current_user.id).count()
+        count = usercache.users.count(current_user.id, 'watchlist')
         
         if count >= limit:
             if count >= limit:
@@ -747,17 +1030,18 @@ def watchlist_page():
     
     if favorites:
         # Criar lista de tickers para o Yahoo Finance (Ex: ['BTC-USD', 'ETH-USD'])
-        symbols_list = [f"{f.symbol.upper()}-USD" for f in favorites]
+        symbols_list = [yahoo_symbol(f.symbol) for f in favorites]
         
         try:
             # 2. Baixar dados (Tentativa otimizada)
             if len(symbols_list) > 0:
                 # Baixa apenas o último dia
-                data = yf.download(symbols_list, period="1d", progress=False)
+                with track_upstream('yahoo'):
+                    data = yf.download(symbols_list, period="1d", progress=False)
                 
                 for f in favorites:
                     sym = f.symbol.upper()
-                    yf_sym = f"{sym}-USD"
+                    yf_sym = yahoo_symbol(sym)
                     
                     try:
                         # Lógica para extrair preço (funciona para 1 ou várias moedas)
@@ -784,20 +1068,29 @@ def watchlist_page():
                             'icon': 'fa-brands fa-bitcoin' if sym == 'BTC' else 'fa-solid fa-coins' # Ícone genérico se não tiveres a função
                         })
                     except Exception as e:
-                        print(f"Erro ao processar {sym}: {e}")
+                        record_error(f"watchlist[{sym}]", e)
                         # Adiciona item com erro para o user poder apagar
                         watchlist_data.append({
                             'symbol': sym, 'price': 'Erro', 'change': '---', 'color': 'text-muted', 'icon': 'fa-solid fa-circle-exclamation'
                         })
 
         except Exception as e:
-            print(f"Erro Geral Watchlist: {e}")
+            record_error("watchlist", e)
 
     return render_template('watchlist.html', coins=watchlist_data, active_page='watchlist')
 
 @app.route('/api/news')
-@cache.cached(timeout=300) 
+@responses.cached_json(timeout=300)
 def get_crypto_news():
+    # Com o job de notícias ligado, só o líder vai aos feeds; os outros workers leem o que ele publicou
+    interval = app.config['NEWS_REFRESH_INTERVAL']
+    if interval > 0:
+        published = jobs.coordinator.result('news', max_age=interval * 3)
+        if published is not None:
+            return published
+    return fetch_crypto_news()
+
+def fetch_crypto_news():
     news = []
     # Lista de fontes (Se uma falhar, tenta a próxima)
     rss_feeds = [
@@ -813,7 +1106,8 @@ def get_crypto_news():
 
     for url in rss_feeds:
         try:
-            response = requests.get(url, headers=headers, timeout=5)
+            with track_upstream('rss'):
+                response = requests.get(url, headers=headers, timeout=5)
             if response.status_code == 200:
                 feed = feedparser.parse(response.content)
                 if feed.entries:
@@ -825,7 +1119,7 @@ def get_crypto_news():
                         })
                     break # Se funcionou, paramos de procurar
         except Exception as e:
-            print(f"Erro ao ler RSS {url}: {e}")
+            record_error(f"rss[{url}]", e)
             continue
 
     return {"news": news}
@@ -840,9 +1134,11 @@ def analyze_user_coin():
         ticker_in = data.get('ticker', '').strip().upper()
         investment = float(data.get('investment', 0) or 0)
         
-        yf_ticker = f"{ticker_in}-USD"
+        yf_ticker = yahoo_symbol(ticker_in)
         stock = yf.Ticker(yf_ticker)
-        curr = stock.fast_info.last_price
+        with track_upstream('yahoo'):
+            curr = stock.fast_info.last_price
+            prev_close = stock.fast_info.previous_close
         
         if not curr: return jsonify({"error": "Moeda não encontrada"})
         
@@ -857,20 +1153,24 @@ def analyze_user_coin():
         return jsonify({
             "ticker": ticker_in,
             "current_price": smart_format(curr),
-            "verdict": "Compra" if curr > stock.fast_info.previous_close else "Neutro",
+            "verdict": "Compra" if curr > prev_close else "Neutro",
             "explanation": "Análise técnica baseada em momentum e volume.",
             "risk_level": "Médio",
             "plan": {
                 "entry": smart_format(curr), 
                 "stop": smart_format(stop), 
-                "target": smart_format(target)
+                "target": smart_format(target),
+                "stop_raw": stop, # Para criar a ordem OCO no simulador
+                "target_raw": target
             },
             "math": {
                 "potential_profit": f"${pot_profit:,.2f}", # <--- Valor calculado
                 "roi": f"{roi}%"                            # <--- ROI preenchido
             }
         })
-    except: return jsonify({"error": "Erro na análise"})
+    except Exception as e:
+        record_error("analyze_user_coin", e)
+        return jsonify({"error": "Erro na análise"})
 
 
 # --- ROTA PRINCIPAL DAS FERRAMENTAS ---
@@ -891,16 +1191,18 @@ def time_machine_calc():
         amount = float(data.get('amount', 100))
         date_str = data.get('date') # Formato YYYY-MM-DD
         
-        yf_symbol = f"{symbol}-USD"
+        yf_symbol = yahoo_symbol(symbol)
         stock = yf.Ticker(yf_symbol)
         
         # Obter preço histórico
-        hist = stock.history(start=date_str, end=None)
+        with track_upstream('yahoo'):
+            hist = stock.history(start=date_str, end=None)
         if hist.empty:
             return jsonify({'error': 'Dados não encontrados para esta data.'})
             
         old_price = hist['Close'].iloc[0]
-        current_price = stock.fast_info.last_price
+        with track_upstream('yahoo'):
+            current_price = stock.fast_info.last_price
         
         # Cálculos
         crypto_amount = amount / old_price
@@ -926,7 +1228,7 @@ def create_alert():
     # LIMITES ALERTAS
     LIMITS = {'Starter': 1, 'Pro': 5, 'Ultra': 999}
     limit = LIMITS.get(current_user.plan_type, 1)
-    count = PriceAlert.query.filter_by(user_id=current_user.id, is_active=True).count()
+    count = usercache.users.count(current_user.id, 'alerts')
 
     if count >= limit:
         flash(f"Limite de {limit} alertas atingido. Faz upgrade para criar mais.", "error")
@@ -953,54 +1255,36 @@ def delete_alert(id):
         db.session.commit()
     return redirect(url_for('crypto_tools_page'))
 
-# --- ROTINA DE VERIFICAÇÃO DE ALERTAS (Chamada via JS) ---
+# --- ROTINA DE VERIFICAÇÃO DE ALERTAS E ORDENS (Chamada via JS) ---
+def tracked_symbols():
+    # Símbolos que o refresher tem de acompanhar: alertas ativos + ordens pendentes + universo dos movers
+    return set(active_alert_symbols()) | set(orders.engine.symbols()) | movers.tracker.universe
+
 @app.route('/api/check_alerts')
+@responses.cached_json(timeout=app.config['ALERT_CHECK_INTERVAL'])
 def check_alerts_routine():
+    # Com o refresher ligado quem verifica é o líder da tarefa 'prices' (uma vez por deploy):
+    # os workers só mostram a última verificação publicada
+    if app.config['PRICE_REFRESH_INTERVAL'] > 0:
+        return jobs.coordinator.result('alerts') or {'status': 'scheduled'}
+
     # 1. Buscar todos os alertas ativos
     active_alerts = PriceAlert.query.filter_by(is_active=True).all()
-    if not active_alerts: return jsonify({'status': 'no_alerts'})
+    order_symbols = orders.engine.symbols()
+    if not active_alerts and not order_symbols: return {'status': 'no_alerts'}
     
-    # 2. Agrupar moedas para baixar preços de uma vez (Batch)
-    symbols = set([f"{a.symbol}-USD" for a in active_alerts])
-    if not symbols: return jsonify({'status': 'ok'})
+    # 2. Atualizar a camada de preços de uma vez (Batch) e avaliar contra ela
+    symbols = set([a.symbol for a in active_alerts]) | set(order_symbols)
+    if not symbols: return {'status': 'ok'}
     
     try:
-        data = yf.download(list(symbols), period="1d", interval="1m", progress=False, group_by='ticker')
-        triggered_count = 0
-        
-        for alert in active_alerts:
-            sym_key = f"{alert.symbol}-USD"
-            try:
-                # Obter preço atual
-                if len(symbols) == 1: price = data['Close'].iloc[-1]
-                else: price = data[sym_key]['Close'].iloc[-1]
-                
-                price = float(price)
-                triggered = False
-                
-                # Verificar condição
-                if alert.condition == 'above' and price >= alert.target_price:
-                    triggered = True
-                elif alert.condition == 'below' and price <= alert.target_price:
-                    triggered = True
-                    
-                if triggered:
-                    # Enviar Email
-                    user = User.query.get(alert.user_id)
-                    msg = Message(f"🔔 Alerta de Preço: {alert.symbol}", recipients=[user.email])
-                    msg.body = f"O preço de {alert.symbol} atingiu o teu alvo de ${alert.target_price}.\nPreço Atual: ${price:,.2f}\n\nBons trades,\nEquipa FlowTrade."
-                    mail.send(msg)
-                    
-                    # Desativar alerta (ou remover)
-                    alert.is_active = False
-                    triggered_count += 1
-                    
-            except Exception as e: continue
-            
-        if triggered_count > 0: db.session.commit()
-        return jsonify({'status': 'checked', 'triggered': triggered_count})
+        market_data.refresh(symbols)
+        fired = evaluate_alerts(active_alerts=active_alerts) if active_alerts else []
+        filled = orders.engine.run()
+        return {'status': 'checked', 'triggered': len(fired), 'orders_filled': len(filled)}
         
     except Exception as e:
+        record_error("check_alerts", e)
         return jsonify({'error': str(e)})
 
 
@@ -1019,19 +1303,23 @@ def crypto_snapshot_page():
         if check:
             is_favorited = True
     except Exception as e:
-        print(f"Erro DB Watchlist: {e}")
+        record_error("snapshot_watchlist", e)
     # -----------------------------------------------
 
     try:
-        stock = yf.Ticker(f"{ticker}-USD")
+        stock = yf.Ticker(yahoo_symbol(ticker))
         
         # Buscar histórico
-        hist = stock.history(period="1mo")
+        with track_upstream('yahoo'):
+            hist = stock.history(period="1mo")
         
         if hist.empty: return redirect(url_for('crypto_page'))
 
         current_price = hist['Close'].iloc[-1]
         prev_close = hist['Close'].iloc[-2]
+        # Preço intradiário do buffer em memória, se estiver fresco (sem ir à rede)
+        intraday = market_data.prices.intraday_stats(ticker)
+        if intraday: current_price = intraday['last']
         change = ((current_price - prev_close)/prev_close)*100
         
         volume = hist['Volume'].iloc[-1]
@@ -1062,7 +1350,7 @@ def crypto_snapshot_page():
                                is_favorited=is_favorited) # <--- AGORA O HTML JÁ RECEBE A INFO
                                
     except Exception as e: 
-        print(f"Erro snapshot: {e}")
+        record_error("crypto_snapshot", e)
         return redirect(url_for('crypto_page'))
 
 @app.route('/crypto/details/<ticker>')
@@ -1071,12 +1359,13 @@ def crypto_details(ticker):
     return redirect(url_for('crypto_snapshot_page', ticker=ticker))
 
 @app.route('/get_recommendations', methods=['GET'])
-@cache.cached(timeout=300)
+@responses.cached_json(timeout=300)
 def get_recommendations():
     candidates = ['BTC-USD', 'ETH-USD', 'SOL-USD', 'BNB-USD', 'XRP-USD', 'ADA-USD', 'AVAX-USD', 'DOT-USD', 'MATIC-USD', 'LINK-USD', 'DOGE-USD', 'SHIB-USD', 'PEPE-USD']
     recommendations = []
     try:
-        data = yf.download(candidates, period="7d", interval="1d", progress=False, group_by='ticker')
+        with track_upstream('yahoo'):
+            data = yf.download(candidates, period="7d", interval="1d", progress=False, group_by='ticker')
         for symbol in candidates:
             try:
                 hist = data if len(candidates)==1 else data[symbol]
@@ -1113,13 +1402,17 @@ def get_recommendations():
                          "tag": tag,
                          "roi": roi_label,
                          "target": smart_format(target), # <--- Agora enviamos o Target
-                         "stop": smart_format(stop)      # <--- E o Stop
+                         "stop": smart_format(stop),     # <--- E o Stop
+                         "target_raw": float(target),    # Valores numéricos para a ordem OCO
+                         "stop_raw": float(stop)
                      })
             except: continue
             
         recommendations.sort(key=lambda x: abs(x['change_raw']), reverse=True)
-        return jsonify(recommendations[:9])
-    except: return jsonify([])
+        return recommendations[:9]
+    except Exception as e:
+        record_error("get_recommendations", e)
+        return []
 
 
 # --- ROTAS ESTÁTICAS ---
@@ -1138,15 +1431,58 @@ def screener_page(): return render_template('screener.html', active_page='screen
 @app.route('/ai')
 def ai_page(): return render_template('ai.html', active_page='ai')
 @app.route('/risk')
+@login_required
 def risk_page(): return render_template('risk.html', active_page='risk')
 @app.route('/legal/terms')
 def terms_page(): return render_template('legal_terms.html')
 @app.route('/legal/privacy')
 def privacy_page(): return render_template('legal_privacy.html')
 
+# --- TAREFAS EM BACKGROUND ---
+# Arrancadas por worker (gunicorn post_fork) ou no servidor de desenvolvimento, nunca no import.
+# Todos os workers se candidatam, mas cada tarefa só corre no líder (jobs.coordinator); os
+# restantes aplicam o resultado publicado.
+
+def refresh_prices_job():
+    # Líder: atualiza os buffers, avalia alertas e ordens (uma vez por deploy: um email por alerta)
+    # e publica as últimas barras
+    symbols = tracked_symbols()
+    if symbols:
+        market_data.refresh(symbols)
+    fired = evaluate_alerts()
+    filled = orders.engine.run()
+    jobs.coordinator.publish('prices', market_data.recent_bars(symbols))
+    jobs.coordinator.publish('alerts', {'status': 'checked', 'triggered': len(fired), 'orders_filled': len(filled)})
+
+def follow_prices_job():
+    published = jobs.coordinator.result('prices')
+    if published:
+        market_data.apply_bars(published)
+
+def refresh_news_job():
+    jobs.coordinator.publish('news', fetch_crypto_news())
+
+def save_snapshot_job():
+    snapshot.market.save()
+
+def start_background_jobs():
+    if app.config['SNAPSHOT_INTERVAL'] > 0:
+        # Primeiro os últimos dados conhecidos (servidos já), depois os refreshers atualizam-nos
+        snapshot.market.load()
+        jobs.coordinator.every('snapshot', app.config['SNAPSHOT_INTERVAL'], save_snapshot_job, local=True)
+    if app.config['PRICE_REFRESH_INTERVAL'] > 0:
+        jobs.coordinator.every('prices', app.config['PRICE_REFRESH_INTERVAL'], refresh_prices_job, follow_prices_job)
+    if app.config['NEWS_REFRESH_INTERVAL'] > 0:
+        jobs.coordinator.every('news', app.config['NEWS_REFRESH_INTERVAL'], refresh_news_job)
+    jobs.coordinator.start()
+    profiler.sampler.watch()
+
 if __name__ == '__main__':
     print("--- A INICIAR SERVIDOR ---")
     with app.app_context():
         db.create_all()
+    # Com o reloader do modo debug só o processo filho arranca as tarefas
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_jobs()
     # Usa porta 5001 para evitar conflitos de porta presa
     app.run(debug=True, port=5001, host='0.0.0.0', threaded=True)
\ No newline at end of file
@@ -0,0 +1,178 @@
+# archive.py
+# Arquivo frio das transações: as linhas com mais de TX_ARCHIVE_AGE_DAYS saem da tabela
+# `transaction` para ficheiros Parquet (zstd) particionados por utilizador e mês:
+#
+#   <TX_ARCHIVE_DIR>/user_id=42/month=2024-03/part-<primeiro id>-<último id>.parquet
+#
+# O job corre com `flask --app app archive-transactions [--days N]` (ex: cron diário). As leituras
+# (histórico, ledger, badges) passam por transactions()/count(), que juntam a tabela quente com o
+# arquivo: o utilizador é a diretoria, o intervalo de tempo corta meses inteiros e o resto é
+# filtrado pelas estatísticas dos row groups. Uma transação presente nos dois lados (job
+# interrompido entre escrever o ficheiro e apagar as linhas) aparece uma só vez: a chave é
+# (id, timestamp), porque numa BD SQLite criada antes do AUTOINCREMENT um id arquivado pode
+# voltar a ser usado por uma transação nova. Um ficheiro do arquivo nunca é substituído.
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+import click
+from lazy_imports import pd, pa, pq, ds
+from extensions import db
+from models import Transaction
+
+COLUMNS = ['id', 'timestamp', 'symbol', 'type', 'price', 'amount', 'total_value']
+COMPRESSION = 'zstd'
+
+def _month(ts):
+    return ts.strftime('%Y-%m')
+
+def _month_start(ts):
+    return datetime(ts.year, ts.month, 1)
+
+def _next_month(ts):
+    return datetime(ts.year + ts.month // 12, ts.month % 12 + 1, 1)
+
+class TransactionArchive:
+    def __init__(self, root=None, age_days=90):
+        self.root = root
+        self.age_days = age_days
+
+    def init_app(self, app):
+        self.root = app.config['TX_ARCHIVE_DIR']
+        self.age_days = app.config['TX_ARCHIVE_AGE_DAYS']
+
+        @app.cli.command('archive-transactions')
+        @click.option('--days', type=int, default=None, help="Idade mínima (dias) das transações a arquivar.")
+        def archive_command(days):
+            # Move as transações antigas para o arquivo Parquet
+            moved = self.tier(days)
+            click.echo(f"{sum(moved.values())} transações arquivadas em {len(moved)} partições ({self.root}).")
+
+    def _user_dir(self, user_id):
+        return os.path.join(self.root, f"user_id={int(user_id)}")
+
+    # --- ESCRITA (JOB) ---
+
+    def _write(self, user_id, month, frame):
+        # Escreve para um ficheiro temporário e renomeia: nunca fica um Parquet a meio no arquivo
+        path = os.path.join(self._user_dir(user_id), f"month={month}")
+        os.makedirs(path, exist_ok=True)
+        name = f"part-{frame['id'].iloc[0]}-{frame['id'].iloc[-1]}"
+        tmp = os.path.join(path, f".{uuid.uuid4().hex}.tmp")
+        table = pa.Table.from_pandas(frame[COLUMNS], preserve_index=False)
+        pq.write_table(table, tmp, compression=COMPRESSION)
+        try:
+            final = os.path.join(path, f"{name}.parquet")
+            try:
+                os.link(tmp, final) # falha se já existir (ao contrário do os.replace)
+            except FileExistsError:
+                existing = pq.read_table(final, columns=['id', 'timestamp'])
+                if existing.equals(table.select(['id', 'timestamp'])):
+                    return # repetição de um job interrompido: o ficheiro já tem estas linhas
+                # Mesmo intervalo de ids com outras transações (ids reutilizados): ficheiro novo
+                os.link(tmp, os.path.join(path, f"{name}-{uuid.uuid4().hex[:8]}.parquet"))
+        finally:
+            os.remove(tmp)
+
+    def tier(self, age_days=None):
+        # Arquiva tudo o que é mais antigo que `age_days`, um mês de cada vez (memória limitada
+        # a um mês de transações). Em cada mês: escreve os ficheiros, depois apaga as linhas.
+        # Devolve {(user_id, 'AAAA-MM'): nº de transações arquivadas}.
+        cutoff = datetime.utcnow() - timedelta(days=self.age_days if age_days is None else age_days)
+        moved = {}
+        oldest = db.session.execute(db.select(db.func.min(Transaction.timestamp))).scalar()
+        month = _month_start(oldest) if oldest else None
+        while month is not None and month < cutoff:
+            end = min(_next_month(month), cutoff)
+            in_range = (Transaction.timestamp >= month) & (Transaction.timestamp < end)
+            rows = db.session.execute(db.select(Transaction.user_id, *(getattr(Transaction, c) for c in COLUMNS))
+                                      .where(in_range).order_by(Transaction.user_id, Transaction.id)).all()
+            if rows:
+                frame = pd.DataFrame(rows, columns=['user_id'] + COLUMNS)
+                frame['timestamp'] = pd.to_datetime(frame['timestamp']).astype('datetime64[us]')
+                for user_id, part in frame.groupby('user_id', sort=False):
+                    self._write(user_id, _month(month), part)
+                    moved[(int(user_id), _month(month))] = len(part)
+                # Só as linhas lidas (uma inserida entretanto com timestamp antigo fica para a próxima)
+                db.session.execute(db.delete(Transaction).where(in_range, Transaction.id <= int(frame['id'].max()))
+                                   .execution_options(synchronize_session=False))
+                db.session.commit()
+            month = _next_month(month)
+        return moved
+
+    def purge(self, user_id):
+        # Apaga o arquivo de um utilizador (reset da conta)
+        shutil.rmtree(self._user_dir(user_id), ignore_errors=True)
+
+    # --- LEITURA ---
+
+    def _dataset(self, user_id, start=None, end=None):
+        # Dataset Parquet do utilizador (None se não houver nada no intervalo) + filtro de tempo.
+        # Os meses fora do intervalo são cortados pelo nome da diretoria, sem abrir ficheiros.
+        path = self._user_dir(user_id)
+        if not self.root or not os.path.isdir(path):
+            return None, None
+        first = _month(start) if start is not None else ''
+        last = _month(end) if end is not None else '~'
+        files = [os.path.join(d.path, f) for d in os.scandir(path) if first <= d.name[6:] <= last
+                 for f in os.listdir(d.path) if f.endswith('.parquet')] # sem os .tmp de escritas a meio
+        if not files:
+            return None, None
+        dataset = ds.dataset(files, format='parquet', partition_base_dir=path,
+                             partitioning=ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive'))
+        expr = None
+        if start is not None:
+            expr = ds.field('timestamp') >= pd.Timestamp(start)
+        if end is not None:
+            until = ds.field('timestamp') < pd.Timestamp(end)
+            expr = until if expr is None else expr & until
+        return dataset, expr
+
+    def _archived(self, user_id, start=None, end=None):
+        dataset, expr = self._dataset(user_id, start, end)
+        if dataset is None:
+            return pd.DataFrame(columns=COLUMNS)
+        return dataset.to_table(columns=COLUMNS, filter=expr).to_pandas()
+
+    def _hot(self, user_id, start=None, end=None, newest_first=False, limit=None):
+        order = (Transaction.timestamp.desc(), Transaction.id.desc()) if newest_first else (Transaction.timestamp, Transaction.id)
+        query = db.select(*(getattr(Transaction, c) for c in COLUMNS)).where(Transaction.user_id == user_id).order_by(*order)
+        if start is not None:
+            query = query.where(Transaction.timestamp >= start)
+        if end is not None:
+            query = query.where(Transaction.timestamp < end)
+        if limit is not None:
+            query = query.limit(limit)
+        return pd.DataFrame(db.session.execute(query).all(), columns=COLUMNS)
+
+    def transactions(self, user_id, start=None, end=None, newest_first=False, limit=None):
+        # Transações do utilizador em [start, end) vindas da tabela e do arquivo, por ordem cronológica
+        # (ou da mais recente com newest_first). Com `limit` e a tabela quente a chegar para o
+        # preencher, o arquivo (sempre mais antigo) nem é lido.
+        hot = self._hot(user_id, start, end, newest_first, limit)
+        if limit is not None and newest_first and len(hot) >= limit:
+            frame = hot
+        else:
+            cold = self._archived(user_id, start, end)
+            frame = pd.concat([f for f in (cold, hot) if len(f)], ignore_index=True) if len(cold) else hot
+            frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+            frame = frame.drop_duplicates(['id', 'timestamp'], keep='last')
+            frame = frame.sort_values(['timestamp', 'id'], ascending=not newest_first, ignore_index=True)
+            if limit is not None:
+                frame = frame.head(limit)
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+        return frame
+
+    def rows(self, user_id, start=None, end=None, newest_first=False, limit=None):
+        # Igual a transactions(), como lista de namedtuples (tx.symbol, tx.timestamp...) para os templates
+        frame = self.transactions(user_id, start, end, newest_first, limit)
+        return list(frame.itertuples(index=False, name='ArchivedTransaction'))
+
+    def count(self, user_id):
+        # Nº total de transações (COUNT na tabela + metadados dos ficheiros, sem ler linhas)
+        hot = db.session.execute(db.select(db.func.count()).select_from(Transaction)
+                                 .where(Transaction.user_id == user_id)).scalar()
+        dataset, _ = self._dataset(user_id)
+        return hot + (dataset.count_rows() if dataset is not None else 0)
+
+store = TransactionArchive()
@@ -0,0 +1,197 @@
+# assets.py
+# Pipeline dos ficheiros estáticos: `flask --app app build-assets` copia static/ para static/dist/
+# com o hash do conteúdo no nome (style.css -> style.3f2a9c1b4e5d.css) e gera as variantes
+# pré-comprimidas (gzip e, com o pacote `brotli` instalado, br) dos ficheiros de texto e as
+# variantes WebP/AVIF das imagens. Um .avif feito à mão ao lado da imagem (gradient2.avif)
+# é usado em vez de gerar outro.
+#
+# Com o manifest presente, url_for('static', filename='style.css') passa a dar o nome com hash
+# e a rota /static serve a melhor variante para o Accept-Encoding/Accept do browser, com cache
+# imutável de um ano. Sem build (desenvolvimento) tudo continua como antes.
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import click
+from flask import request, send_from_directory
+from lazy_imports import Image
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+TEXT_TYPES = {'.css', '.js', '.svg', '.json', '.txt'}
+RASTER_TYPES = {'.png', '.jpg', '.jpeg'}
+IMAGE_VARIANTS = (('image/avif', '.avif', {'quality': 60}), ('image/webp', '.webp', {'quality': 80, 'method': 6}))
+ENCODINGS = ('br', 'gzip') # ordem de preferência
+MAX_AGE = 31536000 # 1 ano: o nome muda quando o conteúdo muda
+CSS_URL = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def _fingerprint(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+class AssetPipeline:
+    def __init__(self):
+        self.static_dir = None
+        self.dist_dir = None
+        self.files = {} # nome lógico -> nome com hash
+        self.entries = {} # nome com hash -> {'type', 'encodings': {...}, 'images': [...]}
+
+    def init_app(self, app):
+        self.static_dir = app.static_folder
+        self.dist_dir = os.path.join(app.static_folder, DIST)
+        self.load()
+        app.url_defaults(self._url_defaults)
+        app.view_functions['static'] = self._wrap(app.view_functions['static'])
+
+        @app.cli.command('build-assets')
+        def build_command():
+            # Gera static/dist/ e o manifest (correr no deploy, antes de arrancar o gunicorn)
+            manifest = self.build()
+            click.echo(f"{len(manifest['files'])} ficheiros em {self.dist_dir}"
+                       + ("" if brotli else " (sem brotli: só variantes gzip)"))
+
+    def load(self):
+        path = os.path.join(self.dist_dir, MANIFEST)
+        if not os.path.exists(path):
+            self.files, self.entries = {}, {}
+            return
+        with open(path) as f:
+            manifest = json.load(f)
+        self.files, self.entries = manifest['files'], manifest['entries']
+
+    # --- BUILD ---
+
+    def _sources(self):
+        # Ficheiros de static/ (sem a dist); imagens primeiro, porque o CSS aponta para elas
+        names = [os.path.relpath(os.path.join(d, f), self.static_dir).replace(os.sep, '/')
+                 for d, dirs, files in os.walk(self.static_dir) for f in files
+                 if os.path.relpath(d, self.static_dir).split(os.sep)[0] != DIST]
+        return sorted(names, key=lambda n: (os.path.splitext(n)[1] in TEXT_TYPES, n))
+
+    def _rewrite_css(self, name, text, files):
+        # url('gradient3.jpg') -> url('gradient3.<hash>.jpg'), relativo à pasta do CSS
+        base = os.path.dirname(name)
+        def replace(match):
+            quote, target = match.groups()
+            if ':' in target or target.startswith(('/', '#')):
+                return match.group(0)
+            logical = os.path.normpath(os.path.join(base, target)).replace(os.sep, '/')
+            if logical not in files:
+                return match.group(0)
+            return f"url({quote}{os.path.relpath(files[logical], base or '.').replace(os.sep, '/')}{quote})"
+        return CSS_URL.sub(replace, text)
+
+    def _write(self, name, data):
+        path = os.path.join(self.dist_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _image_variants(self, name, hashed, data):
+        # [[mime, ficheiro], ...] da mais pequena para a maior; só ficam as que ganham ao original
+        stem, ext = os.path.splitext(name)
+        out = []
+        for mime, suffix, options in IMAGE_VARIANTS:
+            existing = os.path.join(self.static_dir, stem + suffix)
+            if os.path.exists(existing):
+                with open(existing, 'rb') as f:
+                    encoded = f.read()
+            else:
+                try:
+                    buffer = io.BytesIO()
+                    Image.open(io.BytesIO(data)).save(buffer, format=suffix[1:].upper(), **options)
+                    encoded = buffer.getvalue()
+                except Exception as e: # Pillow sem suporte para o formato
+                    click.echo(f"{name}: sem variante {suffix} ({e})")
+                    continue
+            if len(encoded) < len(data):
+                variant = os.path.splitext(hashed)[0] + suffix
+                self._write(variant, encoded)
+                out.append((len(encoded), mime, variant))
+        return [[mime, variant] for _, mime, variant in sorted(out)]
+
+    def _encodings(self, hashed, data):
+        out = {}
+        compressed = {'gzip': gzip.compress(data, 9, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(data, quality=11)
+        for encoding, blob in compressed.items():
+            if len(blob) < len(data):
+                suffix = '.br' if encoding == 'br' else '.gz'
+                self._write(hashed + suffix, blob)
+                out[encoding] = hashed + suffix
+        return out
+
+    def build(self):
+        # Os ficheiros de builds anteriores ficam (páginas já em cache ainda apontam para eles) e o
+        # manifest só é substituído no fim: um build a meio nunca é usado
+        os.makedirs(self.dist_dir, exist_ok=True)
+        files, entries = {}, {}
+        for name in self._sources():
+            with open(os.path.join(self.static_dir, name), 'rb') as f:
+                data = f.read()
+            ext = os.path.splitext(name)[1].lower()
+            if ext == '.css':
+                data = self._rewrite_css(name, data.decode('utf-8'), files).encode('utf-8')
+            hashed = _fingerprint(name, data)
+            self._write(hashed, data)
+            files[name] = hashed
+            entries[hashed] = {
+                'type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                'encodings': self._encodings(hashed, data) if ext in TEXT_TYPES else {},
+                'images': self._image_variants(name, hashed, data) if ext in RASTER_TYPES else [],
+            }
+        manifest = {'files': files, 'entries': entries}
+        tmp = os.path.join(self.dist_dir, MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.dist_dir, MANIFEST))
+        self.files, self.entries = files, entries
+        return manifest
+
+    # --- SERVIR ---
+
+    def _url_defaults(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.files:
+            values['filename'] = self.files[values['filename']]
+
+    def _accepts(self, header, value):
+        # Só conta se o browser o pedir explicitamente (um */* não quer dizer que saiba ler AVIF)
+        return any(item == value and quality > 0 for item, quality in header)
+
+    def _wrap(self, default_view):
+        def static(filename):
+            entry = self.entries.get(filename)
+            if entry is None:
+                return default_view(filename=filename)
+            served, encoding, vary = filename, None, None
+            if entry['images']:
+                vary = 'Accept'
+                mimetype, served = next(((mime, f) for mime, f in entry['images']
+                                         if self._accepts(request.accept_mimetypes, mime)), (entry['type'], filename))
+            else:
+                mimetype = entry['type']
+                if entry['encodings']:
+                    vary = 'Accept-Encoding'
+                    encoding = next((e for e in ENCODINGS if e in entry['encodings']
+                                     and self._accepts(request.accept_encodings, e)), None)
+                    served = entry['encodings'][encoding] if encoding else filename
+            response = send_from_directory(self.dist_dir, served, mimetype=mimetype, max_age=MAX_AGE)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            if vary:
+                response.vary.add(vary)
+            response.cache_control.immutable = True
+            response.cache_control.public = True
+            return response
+        return static
+
+pipeline = AssetPipeline()
@@ -0,0 +1 @@
+# bench/ - scripts de benchmark e profiling (correr a partir de crypto_site: python -m bench.<script>)
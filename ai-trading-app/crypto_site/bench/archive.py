@@ -0,0 +1,98 @@
+# bench/archive.py
+# Arquivo Parquet das transações (archive.py): tamanho da tabela quente e latência das leituras
+# (/history, últimos 30 dias, replay completo do ledger) antes e depois de arquivar.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.archive
+#   python -m bench.archive --users 500 --transactions 1000 --age-days 30
+#
+# Confirma que a união tabela + arquivo devolve exatamente as mesmas transações que antes.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.harness import load_app, login_client, summarize
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do arquivo Parquet das transações")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=500, help="Transações por utilizador (espalhadas por ~1 ano)")
+    parser.add_argument("--age-days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    archive_dir = tempfile.mkdtemp(prefix="flowtrade-archive-")
+    site = load_app(metrics=False, TX_ARCHIVE_DIR=archive_dir)
+    import archive
+    from models import Transaction, LedgerCheckpoint
+    market = FakeMarket(seed=4, latency_ms=0)
+    restore = install(market, site)
+    db = site.db
+    hours = max(1, 365 * 24 // args.transactions)
+
+    with site.app.app_context():
+        user_ids = seed(db, market, users=args.users, positions=0, alerts=0, watchlist=0, transactions=0)
+        now = datetime.utcnow()
+        rows = []
+        for uid in user_ids:
+            for n in range(args.transactions):
+                px = 100.0 + n % 7
+                rows.append({'user_id': uid, 'symbol': 'BTC', 'type': 'BUY' if n % 3 else 'SELL', 'price': px,
+                             'amount': 0.01, 'total_value': 0.01 * px, 'timestamp': now - timedelta(hours=n * hours)})
+        db.session.execute(db.insert(Transaction), rows)
+        db.session.commit()
+
+    uid = user_ids[len(user_ids) // 2]
+    client = login_client(site, uid)
+    since = datetime.utcnow() - timedelta(days=30)
+
+    def measure(label):
+        with site.app.app_context():
+            hot = db.session.execute(db.select(db.func.count()).select_from(Transaction)).scalar()
+            full = archive.store.transactions(uid)
+            stats = {
+                'history': timed(lambda: client.get('/history'), args.repeat),
+                'last_30d': timed(lambda: archive.store.transactions(uid, start=since), args.repeat),
+                'recent_10': timed(lambda: archive.store.rows(uid, newest_first=True, limit=10), args.repeat),
+            }
+            def full_replay():
+                db.session.execute(db.delete(LedgerCheckpoint))
+                db.session.commit()
+                return client.get(f'/api/performance/trader{user_ids.index(uid)}').get_json()
+            perf = full_replay()
+            stats['ledger_full_replay'] = timed(full_replay, max(1, args.repeat // 4))
+        print(f"\n== {label}: {hot:,} linhas na tabela quente ==")
+        for key, s in stats.items():
+            print(f"  {key:<20} p50 {s['p50_ms']:8.1f} ms   p90 {s['p90_ms']:8.1f} ms")
+        return full, perf
+
+    before, perf_before = measure("antes")
+    with site.app.app_context():
+        start = time.perf_counter()
+        moved = archive.store.tier(args.age_days)
+        elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(archive_dir) for f in files)
+    print(f"\nArquivadas {sum(moved.values()):,} transações em {len(moved):,} partições: {elapsed:.2f} s, "
+          f"{size / 1e6:.1f} MB em Parquet")
+    after, perf_after = measure("depois")
+
+    restore()
+    ok = before.equals(after) and perf_before == perf_after
+    print("\nOK" if ok else "\nFALHA: a união tabela + arquivo não bate com o histórico original")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# bench/charts.py
+# API de gráficos (/api/chart, /api/sparklines): tempo do LTTB, bytes por formato (json/delta,
+# com e sem gzip), fidelidade da redução (extremos preservados, delta == json) e sparklines de
+# uma watchlist inteira num só pedido (um download ao Yahoo) em vez de um pedido por símbolo.
+# Confirma também que pedidos sem dados não custam downloads: anónimos, símbolos fora do
+# coins.registry e séries vazias repetidas (cache curta), tanto no /api/chart como nas sparklines.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.charts
+#   python -m bench.charts --watchlist 20 --width 800
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from bench.harness import load_app, login_client
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+def decode_delta(values, scale):
+    return np.cumsum(values) / 10 ** scale
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da API de gráficos")
+    parser.add_argument("--watchlist", type=int, default=12, help="Símbolos na watchlist")
+    parser.add_argument("--width", type=int, default=600)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latência do Yahoo falso")
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    import charts
+    market = FakeMarket(seed=5, latency_ms=args.latency_ms, latency_jitter=0.0)
+    restore = install(market, site)
+    with site.app.app_context():
+        user_ids = seed(site.db, market, users=1, positions=0, alerts=0, watchlist=args.watchlist, transactions=0)
+    client = login_client(site, user_ids[0])
+    failures = []
+
+    # 1) LTTB
+    print("=== LTTB ===")
+    rng = np.random.default_rng(1)
+    for n, width in ((1440, args.width), (100_000, 2000)):
+        x = np.arange(n, dtype=float)
+        y = np.cumsum(rng.normal(size=n))
+        keep, ms = timed(lambda: charts.lttb(x, y, width), repeat=5)
+        kept = y[keep]
+        # os extremos caem sempre num balde: o LTTB tem de os manter (é o que o olho vê)
+        ok = np.isclose(kept.max(), y.max()) and np.isclose(kept.min(), y.min()) and len(keep) == width
+        print(f"{n:>7} -> {width:<5} {ms:8.2f} ms   extremos preservados: {'sim' if ok else 'NÃO'}")
+        if not ok:
+            failures.append(f"lttb {n}->{width}")
+
+    # 2) Bytes por formato
+    print("\n=== /api/chart/BTC (1d) ===")
+    print(f"{'pedido':<28} {'pontos':>7} {'bytes':>8} {'gzip':>8} {'ms':>8}")
+    payloads = {}
+    for series in ('close', 'ohlcv'):
+        for fmt in ('json', 'delta'):
+            url = f"/api/chart/BTC?range=1d&width={args.width}&series={series}&format={fmt}"
+            cold = time.perf_counter()
+            raw = client.get(url)
+            cold = (time.perf_counter() - cold) * 1000
+            gz = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            payloads[(series, fmt)] = raw.json
+            print(f"{series + '/' + fmt:<28} {raw.json['points']:>7} {len(raw.get_data()):>8} "
+                  f"{len(gz.get_data()):>8} {cold:>8.1f}")
+    _, warm = timed(lambda: client.get(f"/api/chart/BTC?range=1d&width={args.width}"))
+    print(f"{'close/json (cache)':<28} {'':>7} {'':>8} {'':>8} {warm:>8.2f}")
+    plain, delta = payloads[('close', 'json')], payloads[('close', 'delta')]
+    if not (np.allclose(decode_delta(delta['c'], delta['scale']['c']), plain['c'])
+            and np.array_equal(np.cumsum(delta['t']), plain['t'])):
+        failures.append("delta != json")
+
+    # 3) Sparklines da watchlist
+    print(f"\n=== Sparklines ({args.watchlist} símbolos, Yahoo a {args.latency_ms:.0f} ms) ===")
+    import market_data
+    with site.app.app_context():
+        site.cache.clear()
+    market_data.prices.clear()
+    calls = market.calls.get('yahoo', 0)
+    resp, ms = timed(lambda: client.get("/api/sparklines?range=1d&width=100"), repeat=1)
+    series = resp.json['series']
+    print(f"lote (frio)       {ms:8.1f} ms   {market.calls['yahoo'] - calls} pedidos ao Yahoo   "
+          f"{sum(len(v) for v in series.values())} pontos")
+    if len(series) != args.watchlist or any(len(v) != 100 for v in series.values()) or market.calls['yahoo'] - calls != 1:
+        failures.append("sparklines")
+    _, ms = timed(lambda: client.get("/api/sparklines?range=1d&width=100"))
+    print(f"lote (cache)      {ms:8.2f} ms")
+    with site.app.app_context():
+        site.cache.clear()
+    market_data.prices.clear()
+    calls = market.calls.get('yahoo', 0)
+    start = time.perf_counter()
+    for sym in series:
+        client.get(f"/api/chart/{sym}?range=1d&width=100")
+    print(f"1 pedido/símbolo  {(time.perf_counter() - start) * 1000:8.1f} ms   {market.calls['yahoo'] - calls} pedidos ao Yahoo")
+    resp = client.get("/api/sparklines?range=1y&width=100")
+    print(f"lote 1y (diário)  {len(resp.json['series'])} símbolos, {sum(len(v) for v in resp.json['series'].values())} pontos")
+
+    # 4) Pedidos que não podem custar downloads: anónimos, símbolos fora do registo e séries vazias
+    anonymous = site.app.test_client().get("/api/chart/BTC").status_code
+    calls = market.calls['yahoo']
+    junk = client.get("/api/chart/NOTACOIN123").status_code
+    import coins
+    coins.registry.remember('NODATA') # no registo (aprendido), sem dados no Yahoo falso
+    for _ in range(5):
+        empty = client.get("/api/chart/NODATA?range=1d").json
+    downloads = market.calls['yahoo'] - calls
+    print(f"\nanónimo: {anonymous} | fora do registo: {junk} | série vazia x5: {downloads} pedido(s) ao Yahoo")
+    if anonymous != 302 or junk != 400 or empty['points'] or downloads != 1:
+        failures.append("pedidos sem dados")
+    # O mesmo nas sparklines: lixo fica de fora sem download, NODATA só vai ao Yahoo uma vez por intervalo (1d e 1y)
+    calls = market.calls['yahoo']
+    for _ in range(5):
+        junk = client.get("/api/sparklines?symbols=JUNKA,JUNKB,JUNKC").json['series']
+    junk_downloads = market.calls['yahoo'] - calls
+    calls = market.calls['yahoo']
+    for rng in ('1d', '1y'):
+        for _ in range(3):
+            empty = client.get(f"/api/sparklines?symbols=NODATA&range={rng}").json['series']
+    empty_downloads = market.calls['yahoo'] - calls
+    print(f"sparklines fora do registo x5: {junk_downloads} pedido(s) ao Yahoo | "
+          f"NODATA 1d/1y x3: {empty_downloads} pedido(s) ao Yahoo")
+    if junk or junk_downloads or empty != {'NODATA': []} or empty_downloads != 2:
+        failures.append("sparklines sem dados")
+
+    restore()
+    print("\nOK" if not failures else f"\nFALHOU: {', '.join(failures)}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
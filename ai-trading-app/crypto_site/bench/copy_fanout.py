@@ -0,0 +1,137 @@
+# bench/copy_fanout.py
+# Benchmark do modo "seguir" (copytrade.py): latência do pedido do líder, latência do fan-out
+# (trade do líder -> fills de todos os seguidores gravados) e throughput em fills/s.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.copy_fanout
+#   python -m bench.copy_fanout --followers 10000 --trades 20 --batch-size 2000 --json fanout.json
+#
+# O pedido do líder com 10k seguidores deve custar o mesmo que sem seguidores: o fan-out
+# corre na thread do worker. No fim verifica-se o saldo de cada seguidor contra as transações.
+import argparse
+import json
+import random
+import sys
+import time
+
+from bench.harness import load_app, login_client, summarize, git_revision
+from bench.fake_market import FakeMarket, install
+
+SYMBOL = 'BTC'
+PRICE = 60000.0
+INITIAL_BALANCE = 10000.0
+
+def leader_trades(client, trades, rng, between=None):
+    # Alterna compras e vendas parciais; devolve as latências do pedido do líder (ms).
+    # between() corre entre trades, fora da medição (ex: esperar que a fila esvazie)
+    samples = []
+    for i in range(trades):
+        if i % 2 == 0:
+            data = {'symbol': SYMBOL, 'action': 'BUY', 'trade_mode': 'units', 'amount': str(rng.uniform(0.01, 0.05))}
+        else:
+            data = {'symbol': SYMBOL, 'action': 'SELL', 'trade_mode': 'units', 'amount': str(rng.uniform(0.001, 0.01))}
+        start = time.perf_counter()
+        resp = client.post('/paper_trading/trade', data=data)
+        samples.append((time.perf_counter() - start) * 1000)
+        if resp.status_code != 302:
+            raise RuntimeError(f"Trade do líder falhou: HTTP {resp.status_code}")
+        if between:
+            between()
+    return samples
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do fan-out do copy trading")
+    parser.add_argument("--followers", type=int, default=10000)
+    parser.add_argument("--trades", type=int, default=20, help="Trades do líder")
+    parser.add_argument("--batch-size", type=int, help="Seguidores por transação (copytrade.BATCH_SIZE)")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    import copytrade
+    from models import User, CopySubscription, Transaction
+    if args.batch_size:
+        copytrade.BATCH_SIZE = args.batch_size
+
+    market = FakeMarket(seed=args.seed)
+    market.set_price(SYMBOL, PRICE)
+    restore = install(market, site)
+    rng = random.Random(args.seed)
+
+    with site.app.app_context():
+        db = site.db
+        db.session.execute(db.insert(User), [
+            {'username': 'leader', 'email': 'leader@bench.local', 'password': 'x', 'virtual_balance': 1e9},
+            {'username': 'solo', 'email': 'solo@bench.local', 'password': 'x', 'virtual_balance': 1e9}]
+            + [{'username': f"f{i}", 'email': f"f{i}@bench.local", 'password': 'x', 'virtual_balance': INITIAL_BALANCE}
+               for i in range(args.followers)])
+        leader_id, solo_id = 1, 2
+        db.session.execute(db.insert(CopySubscription), [
+            {'follower_id': uid, 'leader_id': leader_id, 'ratio': round(rng.uniform(0.1, 2.0), 2), 'is_active': True}
+            for uid in range(3, args.followers + 3)])
+        db.session.commit()
+
+    print(f"{args.followers} seguidores | {args.trades} trades do líder | lote {copytrade.BATCH_SIZE}")
+
+    # 1) Líder sem seguidores (referência)
+    solo = leader_trades(login_client(site, solo_id), args.trades, random.Random(args.seed))
+    copytrade.fanout.wait()
+    copytrade.fanout.latencies.clear()
+    fills_before = copytrade.fanout.fills
+
+    # 2) Líder com seguidores: os pedidos não esperam pelo fan-out
+    start = time.perf_counter()
+    with_followers = leader_trades(login_client(site, leader_id), args.trades, random.Random(args.seed))
+    submitted = time.perf_counter()
+    copytrade.fanout.wait()
+    done = time.perf_counter()
+    restore()
+
+    fills = copytrade.fanout.fills - fills_before
+    fanout_ms = [s * 1000 for s in copytrade.fanout.latencies]
+    throughput = fills / (done - start) if done > start else 0.0
+
+    # 3) Líder com seguidores, esperando que a fila esvazie entre trades: custo do próprio pedido,
+    #    sem a concorrência (GIL / lock de escrita do SQLite) do fan-out no mesmo processo
+    restore = install(market, site)
+    spaced = leader_trades(login_client(site, leader_id), args.trades, random.Random(args.seed + 1),
+                           between=copytrade.fanout.wait)
+    restore()
+    total_fills = copytrade.fanout.fills - fills_before
+
+    results = {
+        "leader_request_no_followers": summarize(solo),
+        "leader_request_with_followers": summarize(with_followers),
+        "leader_request_fanout_idle": summarize(spaced),
+        "fanout_latency": summarize(fanout_ms),
+    }
+
+    print(f"\n{'':32}{'p50 ms':>10}{'p90 ms':>10}{'max ms':>10}")
+    for name, s in results.items():
+        print(f"{name:32}{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    print(f"\nFills: {fills} em {done - start:.2f}s -> {throughput:,.0f} fills/s "
+          f"(fila vazia {(done - submitted) * 1000:.0f} ms depois do último trade do líder)")
+
+    # Invariante: saldo de cada seguidor = inicial - compras + vendas
+    with site.app.app_context():
+        db = site.db
+        flows = dict(db.session.execute(
+            db.select(Transaction.user_id, db.func.sum(db.case((Transaction.type == 'BUY', -Transaction.total_value),
+                                                               else_=Transaction.total_value)))
+            .where(Transaction.user_id > solo_id).group_by(Transaction.user_id)).all())
+        bad = [uid for uid, bal in db.session.execute(db.select(User.id, User.virtual_balance).where(User.id > solo_id))
+               if abs(bal - (INITIAL_BALANCE + flows.get(uid, 0.0))) > 1e-6 * INITIAL_BALANCE or bal < 0]
+        tx_count = db.session.execute(db.select(db.func.count()).select_from(Transaction).where(Transaction.user_id > solo_id)).scalar()
+    ok = not bad and tx_count == total_fills
+    print(f"Transações dos seguidores: {tx_count} | saldos inconsistentes: {len(bad)}")
+    print("OK" if ok else "FALHA")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"revision": git_revision(), "args": vars(args), "fills": fills, "fills_per_s": throughput,
+                       "results": results}, f, indent=2)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# bench/copy_trade.py
+# Idas à BD e latência do copy trade em função do tamanho da carteira copiada.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.copy_trade
+#   python -m bench.copy_trade --sizes 5 50 200 --repeat 5
+#
+# O caminho em lote (trading.buy_many / trading.liquidate) deve ter um nº de statements
+# constante: a coluna "statements" não pode crescer com o nº de ativos.
+import argparse
+import sys
+import time
+
+from sqlalchemy import event
+
+from bench.harness import load_app, login_client, summarize
+from bench.fake_market import FakeMarket, install
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do copy trade em lote")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 200], help="Nº de ativos do líder")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    from models import User, Portfolio
+    universe = [f"C{i:03d}" for i in range(max(args.sizes))]
+    market = FakeMarket(seed=3, universe=universe)
+    restore = install(market, site)
+
+    statements = []
+    with site.app.app_context():
+        @event.listens_for(site.db.engine, "before_cursor_execute")
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.split(None, 1)[0].upper())
+
+    print(f"{'ativos':>7} {'modo':>13} {'statements':>11} {'p50 ms':>9} {'max ms':>9}")
+    failures = []
+    for size in args.sizes:
+        with site.app.app_context():
+            db = site.db
+            db.session.execute(db.insert(User), [{'username': f"leader{size}", 'email': f"leader{size}@bench.local", 'password': "x",
+                                                  'virtual_balance': 0.0},
+                                                 {'username': f"follower{size}", 'email': f"follower{size}@bench.local", 'password': "x",
+                                                  'virtual_balance': 1e12}])
+            leader_id, follower_id = db.session.execute(
+                db.select(User.id).where(User.username.in_([f"leader{size}", f"follower{size}"])).order_by(User.id)).scalars().all()
+            db.session.execute(db.insert(Portfolio), [{'user_id': leader_id, 'symbol': sym, 'amount': 1.0, 'avg_price': 10.0}
+                                                      for sym in universe[:size]])
+            db.session.commit()
+        client = login_client(site, follower_id)
+
+        for mode in ('buy_only', 'sell_and_buy'):
+            samples, counts = [], []
+            for _ in range(args.repeat):
+                statements.clear()
+                start = time.perf_counter()
+                resp = client.post(f'/copy_trade/execute/leader{size}', data={'action_type': mode})
+                samples.append((time.perf_counter() - start) * 1000)
+                counts.append(len(statements))
+                if resp.status_code != 302:
+                    failures.append(f"{size}/{mode}: HTTP {resp.status_code}")
+            s = summarize(samples)
+            print(f"{size:>7} {mode:>13} {max(counts):>11} {s['p50_ms']:>9.1f} {s['max_ms']:>9.1f}")
+
+    restore()
+    for f in failures:
+        print(f"FALHA: {f}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# bench/db_routing.py
+# Encaminhamento leitura/escrita (dbrouting.py) com duas BDs SQLite locais: a "réplica" é uma cópia
+# da principal feita com a API de backup do SQLite (replicate()), por isso fica atrasada até à
+# próxima cópia, como uma réplica real. Conta as instruções SQL que cada engine recebe e confirma:
+#   - as rotas @read_only leem da réplica;
+#   - logo a seguir a um trade o mesmo cliente lê da principal (vê o trade), outro cliente continua
+#     na réplica; passado REPLICA_LAG_SECONDS volta tudo à réplica;
+#   - o /api/risk (grava o histórico diário em falta) fica todo na principal.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.db_routing
+#   python -m bench.db_routing --users 500 --lag 1
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from bench.harness import load_app, login_client
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+READ_ROUTES = ['/leaderboard', '/trader/trader1', '/history']
+
+def replicate(primary, replica):
+    # "Replicação": cópia consistente da principal para a réplica
+    src, dst = sqlite3.connect(primary), sqlite3.connect(replica)
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do encaminhamento leitura/escrita")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--lag", type=int, default=2, help="REPLICA_LAG_SECONDS")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="flowtrade-routing-")
+    primary, replica = os.path.join(workdir, "primary.sqlite"), os.path.join(workdir, "replica.sqlite")
+    site = load_app(db_path=primary, metrics=False, DATABASE_REPLICA_URL=f"sqlite:///{replica}",
+                    REPLICA_LAG_SECONDS=args.lag, DB_POOL_SIZE=4, DB_MAX_OVERFLOW=8)
+    import dbrouting
+    market = FakeMarket(seed=6, latency_ms=0)
+    restore = install(market, site)
+    with site.app.app_context():
+        user_ids = seed(site.db, market, users=args.users, positions=3, alerts=0, watchlist=0, transactions=20)
+        engines = {'principal': site.db.engines[None], 'réplica': site.db.engines[dbrouting.REPLICA]}
+    replicate(primary, replica)
+    print(f"pool principal: {engines['principal'].pool.status()}")
+
+    counts = {name: 0 for name in engines}
+    for name, engine in engines.items():
+        event.listen(engine, "before_cursor_execute", lambda *a, name=name: counts.__setitem__(name, counts[name] + 1))
+    def measure(client, method, url, **kwargs):
+        before = dict(counts)
+        resp = getattr(client, method)(url, **kwargs)
+        return resp, {name: counts[name] - before[name] for name in counts}
+
+    alice, bob = login_client(site, user_ids[0]), login_client(site, user_ids[1])
+    failures = []
+    print(f"\n{'pedido':<44} {'principal':>9} {'réplica':>8}")
+    def row(label, delta):
+        print(f"{label:<44} {delta['principal']:>9} {delta['réplica']:>8}")
+
+    # 1) Rotas só de leitura
+    for url in READ_ROUTES:
+        resp, delta = measure(alice, 'get', url)
+        row(f"GET {url}", delta)
+        if resp.status_code != 200 or delta['réplica'] == 0:
+            failures.append(url)
+
+    # 2) Trade e leitura imediata (réplica ainda sem o trade)
+    before_rows = alice.get('/history').data.count(b'<tr style')
+    resp, delta = measure(alice, 'post', '/paper_trading/trade',
+                          data={'symbol': 'BTC', 'action': 'BUY', 'trade_mode': 'fiat', 'amount': '100'})
+    row("POST /paper_trading/trade", delta)
+    resp, delta = measure(alice, 'get', '/history')
+    rows = resp.data.count(b'<tr style')
+    row("GET /history (quem escreveu, logo a seguir)", delta)
+    if delta['réplica'] or rows != before_rows + 1:
+        failures.append("read-your-writes")
+    resp, delta = measure(bob, 'get', '/leaderboard')
+    row("GET /leaderboard (outro cliente)", delta)
+    if delta['réplica'] == 0:
+        failures.append("outro cliente na principal")
+
+    # 3) Passado o atraso (e com a réplica em dia), quem escreveu volta à réplica
+    time.sleep(args.lag + 0.1)
+    replicate(primary, replica)
+    resp, delta = measure(alice, 'get', '/history')
+    row(f"GET /history (após {args.lag}s, réplica em dia)", delta)
+    if delta['réplica'] == 0 or resp.data.count(b'<tr style') != before_rows + 1:
+        failures.append("regresso à réplica")
+
+    # 4) Rota que grava pelo caminho (daily_price): nada na réplica
+    resp, delta = measure(bob, 'get', '/api/risk?paths=1000')
+    row("GET /api/risk?paths=1000", delta)
+    if resp.status_code != 200 or delta['réplica']:
+        failures.append("/api/risk na réplica")
+
+    restore()
+    print("\nOK" if not failures else f"\nFALHOU: {', '.join(failures)}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# bench/decoder.py
+# Market Decoder (/decode_market) contra o cliente Gemini falso (bench.fake_market.FakeGenaiClient):
+# tempo até ao primeiro fragmento vs resposta completa, cache da pergunta normalizada,
+# pedidos iguais em simultâneo (um só pedido ao Gemini) e invalidação quando chega uma barra nova.
+# Confirma também a quota: sem login não há resposta e o plano Starter (0 análises) só recebe
+# respostas que já estão em cache; uma geração que falha não gasta quota.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.decoder
+#   python -m bench.decoder --concurrency 32 --first-token-ms 400 --token-ms 40
+import argparse
+import json
+import sys
+import threading
+import time
+
+from bench.harness import load_app, login_client
+from bench.fake_market import FakeMarket, FakeGenaiClient, install
+from bench.seed import seed
+
+def ask(client, question):
+    # (ms até ao 1º fragmento, ms até ao fim, texto, evento final)
+    start = time.perf_counter()
+    resp = client.post('/decode_market', json={'question': question}, buffered=False)
+    first, text, final = None, "", {}
+    for raw in resp.response:
+        for event in raw.decode().split("\n\n"):
+            if not event.startswith("data: "):
+                continue
+            data = json.loads(event[6:])
+            if 'text' in data:
+                first = first or (time.perf_counter() - start) * 1000
+                text += data['text']
+            else:
+                final = data
+    resp.close()
+    return first or 0.0, (time.perf_counter() - start) * 1000, text, final
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do Market Decoder em streaming")
+    parser.add_argument("--concurrency", type=int, default=16, help="Pedidos iguais em simultâneo")
+    parser.add_argument("--first-token-ms", type=float, default=300.0, help="Latência do Gemini até ao 1º fragmento")
+    parser.add_argument("--token-ms", type=float, default=30.0, help="Latência entre fragmentos")
+    parser.add_argument("--words", type=int, default=120)
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    import decoder
+    import market_data
+    market = FakeMarket(seed=9, latency_ms=args.first_token_ms, latency_jitter=0.0)
+    restore = install(market, site, genai_client=FakeGenaiClient(market, words=args.words, token_latency_ms=args.token_ms))
+    from models import User
+    with site.app.app_context():
+        ultra, starter, pro = seed(site.db, market, users=3, positions=0, alerts=0, watchlist=0, transactions=0)
+        site.db.session.get(User, ultra).plan_type = 'Ultra'
+        site.db.session.get(User, starter).plan_type = 'Starter'
+        site.db.session.get(User, pro).plan_type = 'Pro'
+        site.db.session.commit()
+    client = login_client(site, ultra)
+    market_data.refresh(['BTC', 'ETH', 'SOL']) # contexto já em memória: mede-se só a AI
+    failures = []
+
+    print(f"{'cenário':<34} {'1º fragmento ms':>16} {'total ms':>10} {'gemini':>7}")
+    def row(label, first, total, calls):
+        print(f"{label:<34} {first:>16.1f} {total:>10.1f} {calls:>7}")
+
+    # 1) Miss vs hit (a mesma pergunta escrita de outra forma)
+    calls = market.calls.get('gemini', 0)
+    first, total, text, final = ask(client, "Porque é que o Bitcoin caiu hoje?")
+    row("miss (streaming)", first, total, market.calls['gemini'] - calls)
+    if final.get('cached') is not False or not text:
+        failures.append(f"miss: {final}")
+    calls = market.calls['gemini']
+    first, total, cached_text, final = ask(client, "  porque é que o BITCOIN caiu hoje  ")
+    row("hit (pergunta normalizada)", first, total, market.calls['gemini'] - calls)
+    if final.get('cached') is not True or cached_text != text:
+        failures.append(f"hit: {final}")
+
+    # 2) Pedidos iguais em simultâneo
+    calls = market.calls['gemini']
+    results = [None] * args.concurrency
+    def worker(i):
+        results[i] = ask(login_client(site, ultra), "O que se passa com a Solana?")
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = (time.perf_counter() - start) * 1000
+    upstream = market.calls['gemini'] - calls
+    row(f"{args.concurrency} iguais em simultâneo (wall)", max(r[0] for r in results), wall, upstream)
+    if upstream != 1 or len({r[2] for r in results}) != 1:
+        failures.append(f"dedup: {upstream} pedidos ao Gemini, {len({r[2] for r in results})} respostas distintas")
+
+    # 3) Barra nova do BTC: a resposta em cache deixa de servir
+    ring = market_data.prices.ring('BTC')
+    market_data.prices.update('BTC', ring.last_close * 1.01, ts=ring.last_ts + 60)
+    calls = market.calls['gemini']
+    first, total, _, final = ask(client, "Porque é que o Bitcoin caiu hoje?")
+    row("barra nova (cache invalidada)", first, total, market.calls['gemini'] - calls)
+    if final.get('cached') is not False:
+        failures.append(f"invalidação: {final}")
+
+    # 4) Quota: anónimo redirecionado para o login, Starter só com respostas em cache
+    anonymous = site.app.test_client().post('/decode_market', json={'question': "e o ETH?"}).status_code
+    free = login_client(site, starter)
+    calls = market.calls['gemini']
+    refused = free.post('/decode_market', json={'question': "Vale a pena comprar ETH?"}).status_code
+    _, _, _, final = ask(free, "Porque é que o Bitcoin caiu hoje?")
+    print(f"\nanónimo: {anonymous} | Starter, pergunta nova: {refused} | Starter, em cache: "
+          f"{'ok' if final.get('cached') else final} | gemini: {market.calls['gemini'] - calls}")
+    if anonymous != 302 or refused != 429 or not final.get('cached') or market.calls['gemini'] != calls:
+        failures.append("quota")
+
+    # 5) Geração que falha não gasta quota; o Pro fica no limite ao fim de AI_LIMITS['Pro'] análises
+    import usercache
+    pro_client, limit = login_client(site, pro), site.AI_LIMITS['Pro']
+    market.failure_rate = 1.0
+    _, _, _, failed = ask(pro_client, "Pergunta que falha?")
+    market.failure_rate = 0.0
+    with site.app.app_context():
+        after_failure = usercache.ai_quota.used(site.db.session.get(User, pro))
+    answered = [ask(pro_client, f"Pergunta nova número {i}?")[3].get('done') for i in range(limit)]
+    over = pro_client.post('/decode_market', json={'question': "Mais uma pergunta?"}).status_code
+    print(f"Pro: erro {'ok' if 'error' in failed else failed}, quota depois do erro: {after_failure} | "
+          f"{sum(map(bool, answered))}/{limit} respondidas, a seguinte: {over}")
+    if 'error' not in failed or after_failure != 0 or not all(answered) or over != 429:
+        failures.append("quota com erros")
+
+    restore()
+    decoder.clear()
+    for f in failures:
+        print(f"FALHA: {f}")
+    print("OK" if not failures else "")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
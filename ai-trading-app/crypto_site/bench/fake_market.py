@@ -0,0 +1,279 @@
+# bench/fake_market.py
+# Fornecedor de mercado falso para benchmarks offline.
+# Substitui yf.download / yf.Ticker / yf.Tickers, os feeds RSS, a API Fear & Greed,
+# o cliente genai e o envio de emails, com latência e taxa de falhas configuráveis.
+#
+#   market = FakeMarket(seed=42, latency_ms=20, failure_rate=0.01)
+#   restore = install(market, site)   # site = módulo app já importado (opcional)
+#   ...
+#   restore()
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import coins
+
+DEFAULT_UNIVERSE = [
+    'BTC', 'ETH', 'SOL', 'BNB', 'XRP', 'DOGE', 'ADA', 'AVAX', 'TRX', 'LINK',
+    'DOT', 'LTC', 'BCH', 'SHIB', 'MATIC', 'PEPE', 'ATOM', 'NEAR', 'UNI', 'XLM',
+]
+
+# Preços de referência aproximados (o resto é derivado do hash do símbolo)
+BASE_PRICES = {'BTC': 65000.0, 'ETH': 3200.0, 'SOL': 150.0, 'BNB': 580.0, 'XRP': 0.55,
+               'DOGE': 0.12, 'ADA': 0.45, 'SHIB': 0.000018, 'PEPE': 0.0000095}
+
+PERIOD_ROWS = {'1d': 1, '2d': 2, '5d': 5, '7d': 7, '1mo': 30, '3mo': 90, '6mo': 180, '1y': 365}
+
+# Ids do Yahoo com sufixo numérico (coins.YAHOO_IDS) -> símbolo
+FROM_YAHOO = {yahoo: symbol for symbol, yahoo in coins.YAHOO_IDS.items()}
+# O Yahoo falso tem dados do universo (posições, alertas do seed) e de todas as moedas do
+# coins.KNOWN, que a app pede sem passar pelo seed (movers, ticker)
+LISTED = {symbol for symbol, _ in coins.KNOWN}
+
+class UpstreamError(RuntimeError):
+    pass
+
+def _stable_int(*parts):
+    digest = hashlib.sha256("|".join(map(str, parts)).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+class FakeMarket:
+    def __init__(self, seed=42, latency_ms=0.0, failure_rate=0.0, universe=None, latency_jitter=0.5):
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.universe = set(universe or DEFAULT_UNIVERSE)
+        self.overrides = {} # símbolo -> último preço forçado (usado pelo replay)
+        self.calls = {}     # fornecedor -> nº de chamadas
+        self.sent_mail = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # --- LATÊNCIA / FALHAS ---
+
+    def _upstream(self, provider):
+        with self._lock:
+            self.calls[provider] = self.calls.get(provider, 0) + 1
+            fail = self._rng.random() < self.failure_rate
+            jitter = 1 + self.latency_jitter * (self._rng.random() * 2 - 1)
+        if self.latency_ms:
+            time.sleep(self.latency_ms * jitter / 1000.0)
+        if fail:
+            raise UpstreamError(f"{provider}: falha simulada")
+
+    # --- PREÇOS ---
+
+    @staticmethod
+    def clean(symbol):
+        # Aceita o que a app manda ao Yahoo ("BTC-USD", "PEPE24478-USD") e devolve o símbolo
+        return FROM_YAHOO.get(symbol.upper()) or coins.canonical(symbol)
+
+    def listed(self, symbol):
+        sym = self.clean(symbol)
+        return sym in self.universe or sym in LISTED
+
+    def base_price(self, symbol):
+        sym = self.clean(symbol)
+        if sym in BASE_PRICES:
+            return BASE_PRICES[sym]
+        return 1 + (_stable_int(self.seed, sym) % 50000) / 100.0
+
+    def set_price(self, symbol, price):
+        self.overrides[self.clean(symbol)] = float(price)
+
+    def bars(self, symbol, rows, freq='1D'):
+        sym = self.clean(symbol)
+        rng = np.random.default_rng(_stable_int(self.seed, sym, rows, freq))
+        vol = 0.002 if freq == '1min' else 0.03
+        rets = rng.normal(0.0, vol, rows)
+        close = self.base_price(sym) * np.exp(np.cumsum(rets))
+        if sym in self.overrides:
+            close = close * (self.overrides[sym] / close[-1])
+        open_ = np.concatenate(([close[0] / np.exp(rets[0])], close[:-1]))
+        spread = np.abs(rng.normal(0.0, vol / 2, rows))
+        high = np.maximum(open_, close) * (1 + spread)
+        low = np.minimum(open_, close) * (1 - spread)
+        volume = rng.integers(10_000, 5_000_000, rows).astype(float)
+        end = pd.Timestamp(datetime.utcnow()).floor('min' if freq == '1min' else 'D')
+        index = pd.date_range(end=end, periods=rows, freq=freq)
+        return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+    def last_prices(self, symbol):
+        closes = self.bars(symbol, 2)['Close']
+        return float(closes.iloc[-1]), float(closes.iloc[-2])
+
+    def _rows_for(self, period, interval, start=None):
+        if start:
+            elapsed = datetime.utcnow() - pd.Timestamp(start).tz_localize(None).to_pydatetime()
+            if interval == '1m':
+                return max(1, int(elapsed.total_seconds() // 60))
+            return max(1, elapsed.days)
+        if interval == '1m':
+            return 390 * PERIOD_ROWS.get(period, 1)
+        return PERIOD_ROWS.get(period, 30)
+
+    # --- API yfinance ---
+
+    def download(self, tickers, period='1mo', interval='1d', group_by='column', start=None, **kwargs):
+        self._upstream('yahoo')
+        if isinstance(tickers, str):
+            tickers = tickers.replace(',', ' ').split()
+        tickers = list(dict.fromkeys(tickers))
+        rows = self._rows_for(period, interval, start)
+        freq = '1min' if interval == '1m' else '1D'
+        frames = {t: self.bars(t, rows, freq) for t in tickers if self.listed(t)}
+        if len(tickers) == 1:
+            return next(iter(frames.values()), pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume']))
+        if not frames:
+            return pd.DataFrame()
+        data = pd.concat(frames, axis=1)
+        if group_by != 'ticker':
+            data = data.swaplevel(0, 1, axis=1).sort_index(axis=1)
+        return data
+
+    def ticker(self, symbol):
+        return FakeTicker(self, symbol)
+
+    def tickers(self, symbols):
+        return FakeTickers(self, symbols)
+
+    # --- OUTROS FORNECEDORES ---
+
+    def http_get(self, url, *args, **kwargs):
+        if 'alternative.me' in url:
+            self._upstream('feargreed')
+            value = _stable_int(self.seed, 'fng') % 100
+            return FakeResponse(200, json.dumps({'data': [{'value': str(value), 'value_classification': 'Greed' if value > 50 else 'Fear'}]}))
+        self._upstream('rss')
+        return FakeResponse(200, self.rss_body(url))
+
+    def rss_body(self, url, items=10):
+        entries = "".join(
+            f"<item><title>Notícia {i} ({url.split('/')[2]})</title><link>https://example.com/{i}</link>"
+            f"<pubDate>Mon, 01 Jan 2024 0{i % 10}:00:00 GMT</pubDate></item>" for i in range(items))
+        return f"<?xml version='1.0'?><rss version='2.0'><channel><title>fake</title>{entries}</channel></rss>"
+
+    def send_mail(self, msg):
+        self._upstream('smtp')
+        with self._lock:
+            self.sent_mail.append({'subject': msg.subject, 'recipients': list(msg.recipients), 'at': time.perf_counter()})
+
+class FakeFastInfo:
+    def __init__(self, market, symbol):
+        self._market = market
+        self._symbol = symbol
+        self._prices = None
+
+    def _load(self):
+        if self._prices is None:
+            self._market._upstream('yahoo')
+            if not self._market.listed(self._symbol):
+                raise KeyError(self._symbol)
+            self._prices = self._market.last_prices(self._symbol)
+        return self._prices
+
+    @property
+    def last_price(self):
+        return self._load()[0]
+
+    @property
+    def previous_close(self):
+        return self._load()[1]
+
+class FakeTicker:
+    def __init__(self, market, symbol):
+        self.market = market
+        self.ticker = symbol
+        self.fast_info = FakeFastInfo(market, symbol)
+
+    def history(self, period='1mo', interval='1d', start=None, end=None, **kwargs):
+        self.market._upstream('yahoo')
+        if not self.market.listed(self.ticker):
+            return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+        rows = self.market._rows_for(period, interval, start)
+        return self.market.bars(self.ticker, rows, '1min' if interval == '1m' else '1D')
+
+class FakeTickers:
+    def __init__(self, market, symbols):
+        if isinstance(symbols, str):
+            symbols = symbols.split()
+        self.tickers = {s: FakeTicker(market, s) for s in symbols}
+
+class FakeResponse:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+
+    def json(self):
+        return json.loads(self.text)
+
+# --- CLIENTE GENAI FALSO ---
+
+class FakeGenaiResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenaiModels:
+    def __init__(self, client):
+        self._client = client
+
+    def _answer(self, contents):
+        prompt = contents if isinstance(contents, str) else " ".join(c for c in contents if isinstance(c, str))
+        words = [f"<b>Análise</b> simulada ({len(prompt)} chars)."] + [f"ponto {i}" for i in range(self._client.words)]
+        return " ".join(words)
+
+    def generate_content(self, model=None, contents=None, **kwargs):
+        self._client.market._upstream('gemini')
+        return FakeGenaiResponse(self._answer(contents))
+
+    def generate_content_stream(self, model=None, contents=None, **kwargs):
+        self._client.market._upstream('gemini')
+        words = self._answer(contents).split(" ")
+        for i in range(0, len(words), self._client.chunk_words):
+            if self._client.token_latency_ms:
+                time.sleep(self._client.token_latency_ms / 1000.0)
+            yield FakeGenaiResponse(" ".join(words[i:i + self._client.chunk_words]) + " ")
+
+class FakeGenaiClient:
+    def __init__(self, market, words=120, chunk_words=8, token_latency_ms=0.0):
+        self.market = market
+        self.words = words
+        self.chunk_words = chunk_words
+        self.token_latency_ms = token_latency_ms
+        self.models = FakeGenaiModels(self)
+
+# --- INSTALAÇÃO (monkeypatch) ---
+
+def install(market, site=None, genai_client=None):
+    # Devolve uma função que repõe tudo como estava
+    import requests
+    import yfinance
+    import utils
+
+    patches = [
+        (yfinance, 'download', market.download),
+        (yfinance, 'Ticker', market.ticker),
+        (yfinance, 'Tickers', market.tickers),
+        (requests, 'get', market.http_get),
+        (utils, '_client', genai_client or FakeGenaiClient(market)),
+    ]
+    if site is not None:
+        patches.append((site.mail, 'send', market.send_mail))
+
+    originals = []
+    for target, attr, value in patches:
+        originals.append((target, attr, getattr(target, attr, None)))
+        setattr(target, attr, value)
+
+    def restore():
+        for target, attr, value in reversed(originals):
+            setattr(target, attr, value)
+    return restore
@@ -0,0 +1,68 @@
+# bench/harness.py
+# Utilitários partilhados pelos benchmarks: arrancar a app numa BD temporária, login, estatísticas.
+import os
+import subprocess
+import tempfile
+
+def load_app(db_path=None, metrics=True, database_url=None, **env):
+    # Tem de ser chamado ANTES de qualquer "import app" (a config é lida no import).
+    # database_url permite correr contra Postgres/MySQL (as tabelas são recriadas!)
+    if database_url is None:
+        if db_path is None:
+            db_path = os.path.join(tempfile.mkdtemp(prefix="flowtrade-bench-"), "bench.sqlite")
+        database_url = f"sqlite:///{db_path}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["METRICS_ENABLED"] = "1" if metrics else "0"
+    os.environ.update({k: str(v) for k, v in env.items()})
+    import app as site
+    with site.app.app_context():
+        site.db.drop_all()
+        site.db.create_all()
+    return site
+
+def login_client(site, user_id):
+    client = site.app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    return client
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    k = (len(sorted_samples) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (k - lo)
+
+def summarize(samples_ms):
+    s = sorted(samples_ms)
+    return {
+        "count": len(s),
+        "mean_ms": sum(s) / len(s) if s else 0.0,
+        "p50_ms": percentile(s, 50),
+        "p90_ms": percentile(s, 90),
+        "p99_ms": percentile(s, 99),
+        "max_ms": s[-1] if s else 0.0,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def print_comparison(current, baseline, keys, metrics=("p50_ms", "p90_ms", "rps")):
+    # Diferenças percentuais entre dois relatórios JSON (ex: commit atual vs anterior)
+    print(f"\n=== Comparação com {baseline.get('revision', '?')} ===")
+    print(f"{'':28}" + "".join(f"{m:>22}" for m in metrics))
+    for key in keys:
+        old, new = baseline.get("results", {}).get(key), current["results"].get(key)
+        if not old or not new:
+            continue
+        cells = []
+        for m in metrics:
+            a, b = old.get(m, 0.0), new.get(m, 0.0)
+            delta = ((b - a) / a * 100) if a else 0.0
+            cells.append(f"{a:8.1f} -> {b:8.1f} ({delta:+5.0f}%)")
+        print(f"{key:28}" + "".join(f"{c:>22}" for c in cells))
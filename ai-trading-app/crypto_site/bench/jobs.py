@@ -0,0 +1,162 @@
+# bench/jobs.py
+# Coordenação das tarefas em background (jobs.py): com N "workers" (um JobCoordinator por thread,
+# cada um com os seus locks, como processos diferentes) o refresher de preços tem de correr uma só
+# vez por intervalo, qualquer que seja N, em vez de N vezes. No fim o líder "morre" (solta o lock
+# como o kernel/o Postgres fariam) e mede-se o tempo até outro worker assumir.
+# Confirma também que cada alerta disparado manda um só email (mesmo com os refreshers em
+# paralelo do cenário "antes") e que, com o refresher ligado, os polls do /api/check_alerts em
+# qualquer worker devolvem o resultado do líder sem irem ao Yahoo.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.jobs
+#   python -m bench.jobs --workers 1 4 16 --interval 0.2 --lease 0.5 --duration 4
+#   python -m bench.jobs --database-url postgresql://...   (advisory locks; as tabelas são recriadas!)
+import argparse
+import sys
+import tempfile
+import threading
+import time
+
+from bench.harness import load_app
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+class Worker:
+    # Um processo da app a fazer de conta: o seu coordenador e o seu ciclo de step()
+    def __init__(self, site, index, interval, lease, runs):
+        import jobs
+        self.index = index
+        self.coordinator = jobs.JobCoordinator()
+        self.coordinator.init_app(site.app)
+        self.coordinator.lease = lease
+        self.coordinator.owner = f"worker-{index}"
+        self.job = self.coordinator.every('prices', interval, self._run, site.follow_prices_job)
+        self.site = site
+        self.runs = runs
+        self.tick = min(interval, lease)
+        self.alive = True
+        self.lock = jobs._NoLock()
+
+    def _run(self):
+        self.runs.append((time.perf_counter(), self.index))
+        self.site.refresh_prices_job()
+
+    def loop(self, stop):
+        while not stop.is_set() and self.alive:
+            with self.site.app.app_context():
+                try:
+                    self.lock = self.coordinator.step(self.job, self.lock)
+                except Exception as e:
+                    self.site.db.session.rollback()
+                    print(f"worker-{self.index}: {e}")
+            time.sleep(self.tick)
+        self.lock.release() # fim do processo
+
+    def die(self):
+        # Processo morto: o lock é solto pelo sistema, o estado de líder desaparece com ele
+        self.alive = False
+        self.lock.release()
+
+def uncoordinated(site, workers, interval, duration):
+    # Como era antes: cada worker com o seu refresher
+    stop = threading.Event()
+    def loop():
+        while not stop.is_set():
+            with site.app.app_context():
+                site.refresh_prices_job()
+            time.sleep(interval)
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da coordenação de tarefas em background")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--interval", type=float, default=0.2, help="Intervalo do refresher (s)")
+    parser.add_argument("--lease", type=float, default=0.5, help="JOB_LEASE_SECONDS (s)")
+    parser.add_argument("--duration", type=float, default=3.0, help="Duração de cada cenário (s)")
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False, database_url=args.database_url,
+                    JOB_LOCK_DIR=tempfile.mkdtemp(prefix="flowtrade-locks-"))
+    market = FakeMarket(seed=8, latency_ms=5)
+    restore = install(market, site)
+    with site.app.app_context():
+        user_ids = seed(site.db, market, users=5, positions=2, alerts=2, watchlist=0, transactions=0)
+        # Alertas que disparam logo, disputados pelos refreshers em paralelo
+        site.db.session.add_all([site.PriceAlert(user_id=uid, symbol='BTC', target_price=1e12, condition='below',
+                                                 is_active=True) for uid in user_ids])
+        site.db.session.commit()
+        dialect = site.db.engine.dialect.name
+    locks = {'postgresql': 'advisory locks', 'mysql': 'GET_LOCK', 'mariadb': 'GET_LOCK'}.get(dialect, 'flock')
+    print(f"BD: {dialect} ({locks}), "
+          f"intervalo {args.interval}s, lease {args.lease}s, {args.duration}s por cenário\n")
+    print(f"{'workers':>7} {'Yahoo/intervalo antes':>22} {'depois':>8} {'líderes':>8} {'failover ms':>12}")
+    expected = args.duration / args.interval
+    failures = []
+    for n in args.workers:
+        calls = market.calls.get('yahoo', 0)
+        uncoordinated(site, n, args.interval, args.duration)
+        before = (market.calls['yahoo'] - calls) / expected
+
+        runs = []
+        stop = threading.Event()
+        workers = [Worker(site, i, args.interval, args.lease, runs) for i in range(n)]
+        threads = [threading.Thread(target=w.loop, args=(stop,), daemon=True) for w in workers]
+        calls = market.calls.get('yahoo', 0)
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        after = (market.calls['yahoo'] - calls) / expected
+        leaders = {i for _, i in runs}
+
+        # Failover: mata o líder atual e espera pela próxima execução noutro worker
+        leader = runs[-1][1] if runs else None
+        failover = None
+        if leader is not None and n > 1:
+            died = time.perf_counter()
+            workers[leader].die()
+            deadline = died + args.lease * 4 + args.interval
+            while time.perf_counter() < deadline and failover is None:
+                failover = next(((at - died) * 1000 for at, i in runs if at > died and i != leader), None)
+                time.sleep(0.01)
+        stop.set()
+        for t in threads:
+            t.join()
+        print(f"{n:>7} {before:>22.2f} {after:>8.2f} {len(leaders):>8} "
+              f"{(f'{failover:.0f}' if failover is not None else '-'):>12}")
+        if after > 1.5 or len(leaders) != 1 or (n > 1 and failover is None):
+            failures.append(f"{n} workers")
+
+    # Emails: um por alerta desativado
+    with site.app.app_context():
+        fired = site.PriceAlert.query.filter_by(is_active=False).count()
+    mails = len(market.sent_mail)
+    # /api/check_alerts com o refresher ligado, em "workers" diferentes (cache vazia em cada pedido)
+    site.app.config['PRICE_REFRESH_INTERVAL'] = 1
+    calls = market.calls['yahoo']
+    statuses = []
+    for _ in range(5):
+        with site.app.app_context():
+            site.cache.clear()
+        statuses.append(site.app.test_client().get('/api/check_alerts').get_json().get('status'))
+    polled = market.calls['yahoo'] - calls
+    print(f"\nalertas disparados: {fired} | emails: {mails}")
+    print(f"/api/check_alerts com refresher: {statuses.count('checked')}/5 com o resultado do líder, "
+          f"{polled} pedidos ao Yahoo")
+    if fired < len(user_ids) or mails != fired:
+        failures.append("um email por alerta")
+    if polled or statuses.count('checked') != 5:
+        failures.append("check_alerts com refresher")
+
+    restore()
+    print("\nOK" if not failures else f"\nFALHOU: {', '.join(failures)}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
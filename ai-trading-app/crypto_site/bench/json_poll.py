@@ -0,0 +1,83 @@
+# bench/json_poll.py
+# Custo de cada poll das APIs JSON que o browser consulta repetidamente: bytes enviados e CPU
+# do servidor por pedido, para um cliente "cru" (sem cabeçalhos), um com Accept-Encoding: gzip
+# e um browser a revalidar com If-None-Match (o caso normal de um poll com o fetch()).
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.json_poll
+#   python -m bench.json_poll --polls 500 --json depois.json --baseline antes.json
+import argparse
+import json
+import sys
+import time
+
+from bench.harness import load_app, login_client, git_revision
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+ENDPOINTS = [
+    ('news', 'GET', '/api/news', None),
+    ('recommendations', 'GET', '/get_recommendations', None),
+    ('check_alerts', 'GET', '/api/check_alerts', None),
+    ('analyze_user_coin', 'POST', '/analyze_user_coin', {'ticker': 'BTC', 'investment': 1000}),
+]
+
+def poll(client, method, path, body, polls, headers):
+    # (bytes/poll, µs de CPU/poll, último estado HTTP); o 1º pedido (aquece a cache) não conta
+    send = client.post if method == 'POST' else client.get
+    first = send(path, json=body, headers=headers)
+    etag = first.headers.get('ETag')
+    if headers.pop('If-None-Match', None) is not None and etag:
+        headers['If-None-Match'] = etag
+    total, status = 0, first.status_code
+    cpu = time.process_time()
+    for _ in range(polls):
+        resp = send(path, json=body, headers=headers)
+        total += len(resp.get_data())
+        status = resp.status_code
+    cpu = time.process_time() - cpu
+    return total / polls, cpu / polls * 1e6, status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bytes e CPU por poll das APIs JSON")
+    parser.add_argument("--polls", type=int, default=300)
+    parser.add_argument("--alerts", type=int, default=50, help="Alertas ativos (trabalho do /api/check_alerts)")
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--baseline", help="Relatório JSON de outra revisão para comparar")
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    market = FakeMarket(seed=11, latency_ms=0)
+    restore = install(market, site)
+    with site.app.app_context():
+        user_ids = seed(site.db, market, users=max(1, args.alerts), positions=0, alerts=1, watchlist=0, transactions=0)
+    client = login_client(site, user_ids[0])
+
+    clients = [('cru', {}), ('gzip', {'Accept-Encoding': 'gzip'}),
+               ('revalidar', {'Accept-Encoding': 'gzip', 'If-None-Match': ''})]
+    results = {}
+    print(f"{'endpoint':<20} {'cliente':<10} {'bytes/poll':>11} {'CPU µs/poll':>12} {'HTTP':>5}")
+    for name, method, path, body in ENDPOINTS:
+        for label, headers in clients:
+            size, cpu, status = poll(client, method, path, body, args.polls, dict(headers))
+            results[f"{name}/{label}"] = {"bytes": size, "cpu_us": cpu, "status": status}
+            print(f"{name:<20} {label:<10} {size:>11.0f} {cpu:>12.0f} {status:>5}")
+    restore()
+
+    report = {"revision": git_revision(), "args": vars(args), "results": results}
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\n=== Comparação com {baseline.get('revision', '?')} ===")
+        for key, new in results.items():
+            old = baseline.get("results", {}).get(key)
+            if old:
+                print(f"{key:<30} bytes {old['bytes']:>8.0f} -> {new['bytes']:>8.0f}   "
+                      f"CPU µs {old['cpu_us']:>8.0f} -> {new['cpu_us']:>8.0f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# bench/load_test.py
+# Teste de carga offline: mercado falso, BD povoada e rotas principais a concorrência controlada.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.load_test --users 2000 --requests 40 --concurrency 8 --json bench_results.json
+#   python -m bench.load_test --latency-ms 50 --failure-rate 0.05 --compare bench_results.json
+import argparse
+import json
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.harness import load_app, login_client, summarize, git_revision, print_comparison
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+DEFAULT_ROUTES = ['/', '/crypto', '/leaderboard', '/paper_trading', '/watchlist', '/api/check_alerts']
+
+def run_route(site, route, user_ids, requests_total, concurrency, rng_seed):
+    local = threading.local()
+    rng = random.Random(rng_seed)
+    plan = [rng.choice(user_ids) for _ in range(requests_total)]
+
+    def one(user_id):
+        if not hasattr(local, "clients"):
+            local.clients = {}
+        client = local.clients.get(user_id)
+        if client is None:
+            client = local.clients[user_id] = login_client(site, user_id)
+        start = time.perf_counter()
+        resp = client.get(route)
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, resp.status_code
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, plan))
+    wall = time.perf_counter() - wall_start
+
+    stats = summarize([r[0] for r in results])
+    stats["errors"] = sum(1 for r in results if r[1] >= 500)
+    stats["non_2xx_3xx"] = sum(1 for r in results if r[1] >= 400)
+    stats["rps"] = len(results) / wall if wall else 0.0
+    stats["wall_s"] = wall
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga offline")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--positions", type=int, default=5)
+    parser.add_argument("--transactions", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=40, help="Pedidos por rota")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latência simulada do upstream")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Taxa de falhas do upstream (0-1)")
+    parser.add_argument("--routes", nargs="+", default=DEFAULT_ROUTES)
+    parser.add_argument("--warm", action="store_true", help="Não limpar a cache entre rotas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--compare", help="Relatório JSON anterior para comparar")
+    args = parser.parse_args(argv)
+
+    site = load_app()
+    market = FakeMarket(seed=args.seed, latency_ms=args.latency_ms, failure_rate=args.failure_rate)
+    restore = install(market, site)
+    try:
+        with site.app.app_context():
+            t0 = time.perf_counter()
+            user_ids = seed(site.db, market, users=args.users, positions=args.positions,
+                            transactions=args.transactions, seed=args.seed)
+            print(f"BD povoada: {len(user_ids)} utilizadores em {time.perf_counter() - t0:.1f}s")
+
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "params": vars(args),
+            "results": {},
+        }
+        print(f"\n{'rota':24}{'pedidos':>8}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'erros':>7}")
+        for i, route in enumerate(args.routes):
+            if not args.warm:
+                with site.app.app_context():
+                    site.cache.clear()
+            calls_before = dict(market.calls)
+            stats = run_route(site, route, user_ids, args.requests, args.concurrency, args.seed + i)
+            stats["upstream_calls"] = {k: v - calls_before.get(k, 0) for k, v in market.calls.items() if v - calls_before.get(k, 0)}
+            report["results"][route] = stats
+            print(f"{route:24}{stats['count']:>8}{stats['rps']:>9.1f}{stats['p50_ms']:>9.1f}{stats['p90_ms']:>9.1f}"
+                  f"{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}{stats['errors']:>7}")
+    finally:
+        restore()
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f), args.routes)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# bench/movers.py
+# Movers (movers.MoversTracker) num universo grande: custo por tick da manutenção incremental
+# (listas ordenadas por variação e volume) e custo das leituras top-K, comparado com a forma
+# antiga (calcular tudo e ordenar a lista inteira a cada pedido). Confirma que o top-K
+# incremental é igual ao da ordenação completa.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.movers
+#   python -m bench.movers --symbols 10000 --ticks 200000 --k 10
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+def full_sort(states, k):
+    # O que o get_market_movers fazia: variação de todos, sort completo, pontas
+    rows = [((s.price / s.ref - 1) * 100, sym) for sym, s in states.items() if s.ref]
+    rows.sort(reverse=True)
+    return [sym for _, sym in rows[:k]], [sym for _, sym in sorted(rows[-k:])]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos movers incrementais")
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--bars", type=int, default=240, help="Barras de 1 minuto por símbolo")
+    parser.add_argument("--ticks", type=int, default=100_000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    import market_data
+    from movers import MoversTracker
+    universe = [f"S{i:05d}" for i in range(args.symbols)]
+    tracker = MoversTracker(universe)
+    market_data.prices.subscribe(tracker.on_tick)
+
+    rng = np.random.default_rng(3)
+    now = time.time()
+    start = now - now % 60 - (args.bars - 1) * 60
+    ts = start + np.arange(args.bars) * 60
+    load = time.perf_counter()
+    for sym in universe:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, args.bars)))
+        market_data.prices.add_bars(sym, ts, close, close * 1.001, close * 0.999, close, rng.uniform(1, 100, args.bars))
+    load = time.perf_counter() - load
+    print(f"{args.symbols} símbolos x {args.bars} barras carregados em {load:.1f} s")
+
+    # 1) Ticks: preços a andar no minuto atual (o caso normal entre barras)
+    rand = random.Random(4)
+    last = {sym: market_data.prices.get(sym) for sym in universe}
+    ticks = [(rand.choice(universe), rand.gauss(0, 0.003)) for _ in range(args.ticks)]
+    tick_ts = ts[-1] + 30
+    elapsed = time.perf_counter()
+    for sym, move in ticks:
+        last[sym] *= 1 + move
+        market_data.prices.update(sym, last[sym], tick_ts, volume=1.0)
+    elapsed = time.perf_counter() - elapsed
+    market_data.prices._listeners.remove(tracker.on_tick)
+    bare = time.perf_counter()
+    for sym, move in ticks[:20_000]:
+        market_data.prices.update(sym, last[sym], tick_ts, volume=0.0)
+    bare = (time.perf_counter() - bare) / 20_000
+    per_tick = elapsed / args.ticks
+    print(f"tick com movers: {per_tick * 1e6:6.1f} µs  (feed sem movers: {bare * 1e6:.1f} µs, "
+          f"manutenção: {(per_tick - bare) * 1e6:.1f} µs)")
+
+    # 2) Leituras
+    def timed(fn, repeat=2000):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - t) / repeat * 1e6
+    k = args.k
+    print(f"\n{'leitura (K=' + str(k) + ')':<28} {'µs':>10}")
+    for label, fn in (("gainers + losers", lambda: (tracker.gainers(k), tracker.losers(k))),
+                      ("volume_leaders", lambda: tracker.volume_leaders(k)),
+                      ("new_highs + new_lows", lambda: (tracker.new_highs(k), tracker.new_lows(k)))):
+        print(f"{label:<28} {timed(fn):>10.1f}")
+    print(f"{'sort completo (antes)':<28} {timed(lambda: full_sort(tracker._states, k), repeat=20):>10.1f}")
+
+    # 3) Correção: o top-K incremental tem de ser igual ao da ordenação completa
+    gainers, losers = full_sort(tracker._states, k)
+    ok = ([g['symbol'] for g in tracker.gainers(k)] == gainers and [l['symbol'] for l in tracker.losers(k)] == losers
+          and len(tracker._by_change) == args.symbols)
+    print("\nOK" if ok else "\nFALHOU: top-K incremental diferente da ordenação completa")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
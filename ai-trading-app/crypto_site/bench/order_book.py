@@ -0,0 +1,98 @@
+# bench/order_book.py
+# Benchmark do motor de matching (orders.py): milhares de ordens pendentes por símbolo.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.order_book
+#   python -m bench.order_book --orders-per-symbol 50000 --symbols 5 --ticks 500 --json book.json
+#
+# Mede: carregamento do livro a partir da BD, passagens de matching sem cruzamentos
+# (o caso normal a cada tick) e passagens em que o preço atravessa uma fatia do livro.
+import argparse
+import json
+import random
+import sys
+import time
+
+from bench.harness import load_app, summarize, git_revision
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do livro de ordens / matching")
+    parser.add_argument("--orders-per-symbol", type=int, default=20000)
+    parser.add_argument("--symbols", type=int, default=3)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=300, help="Passagens sem cruzamentos")
+    parser.add_argument("--sweeps", type=int, default=10, help="Passagens que executam ordens")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    import orders
+    import market_data
+    from models import User, Portfolio, Order
+
+    rng = random.Random(args.seed)
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    mid = 100.0
+    store = market_data.PriceStore()
+    engine = orders.MatchingEngine()
+
+    with site.app.app_context():
+        db = site.db
+        db.session.execute(db.insert(User), [{'username': f"u{i}", 'email': f"u{i}@bench.local", 'password': "x",
+                                              'virtual_balance': 1e9} for i in range(args.users)])
+        db.session.execute(db.insert(Portfolio), [{'user_id': u + 1, 'symbol': s, 'amount': 1e9, 'avg_price': mid}
+                                                  for u in range(args.users) for s in symbols])
+        rows = []
+        for sym in symbols:
+            for _ in range(args.orders_per_symbol):
+                side = rng.choice(('BUY', 'SELL'))
+                kind = rng.choice(('LIMIT', 'STOP'))
+                # Longe do preço atual: limit de compra / stop de venda abaixo, o resto acima
+                below = (side == 'BUY') == (kind == 'LIMIT')
+                offset = rng.uniform(0.02, 0.5)
+                rows.append({'user_id': rng.randint(1, args.users), 'symbol': sym, 'side': side, 'order_type': kind,
+                             'price': mid * (1 - offset if below else 1 + offset), 'amount': 1.0, 'status': 'OPEN'})
+        db.session.execute(db.insert(Order), rows)
+        db.session.commit()
+
+        t0 = time.perf_counter()
+        engine.sync()
+        load_ms = (time.perf_counter() - t0) * 1000
+        print(f"Livro carregado: {engine.open_count()} ordens em {len(symbols)} símbolos ({load_ms:.0f} ms)")
+
+        now = time.time()
+        quiet = []
+        for i in range(args.ticks):
+            for sym in symbols:
+                store.update(sym, mid * (1 + rng.uniform(-0.01, 0.01)), ts=now + i)
+            t0 = time.perf_counter()
+            engine.run(store)
+            quiet.append((time.perf_counter() - t0) * 1000)
+
+        sweep, filled = [], 0
+        for i in range(args.sweeps):
+            # O preço foge cada vez mais do meio e atravessa uma nova fatia do livro
+            move = 0.02 + 0.03 * (i + 1)
+            for sym in symbols:
+                store.update(sym, mid * (1 + move), ts=now + args.ticks + i)
+                store.update(sym, mid * (1 - move), ts=now + args.ticks + i)
+                store.update(sym, mid, ts=now + args.ticks + i)
+            t0 = time.perf_counter()
+            filled += len(engine.run(store))
+            sweep.append((time.perf_counter() - t0) * 1000)
+
+    results = {"quiet_tick": summarize(quiet), "sweep": summarize(sweep)}
+    print(f"\n{'':12}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'max ms':>10}")
+    for name, s in results.items():
+        print(f"{name:12}{s['count']:>6}{s['p50_ms']:>10.2f}{s['p90_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    print(f"\nOrdens executadas: {filled} | ainda abertas: {engine.open_count()}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"revision": git_revision(), "args": vars(args), "load_ms": load_ms, "filled": filled,
+                       "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# bench/profiler.py
+# Profiler por amostragem para admins (profiler.py):
+#   1) sessão (POST /admin/profile/start) enquanto /leaderboard e /paper_trading são pedidos com
+#      o Yahoo falso lento: as stacks têm de vir atribuídas às rotas e ao upstream;
+#   2) um só pedido com o header X-Profile: id na resposta, download em collapsed e speedscope;
+#   3) quem não é admin recebe 403 e o header é ignorado;
+#   4) custo: latência dos mesmos pedidos sem profiler e com uma sessão a correr.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.profiler
+#   python -m bench.profiler --hz 1000 --seconds 5
+import argparse
+import sys
+import time
+
+from bench.harness import load_app, login_client, summarize
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+PAGES = ['/leaderboard', '/paper_trading']
+ROUTES = ('route:leaderboard_page', 'route:paper_trading')
+
+def hit(client, market_data, repeat):
+    # Pedidos com os buffers de preços vazios, para cada um ir ao Yahoo (falso)
+    samples = []
+    for _ in range(repeat):
+        for url in PAGES:
+            market_data.prices.clear()
+            t = time.perf_counter()
+            client.get(url)
+            samples.append((time.perf_counter() - t) * 1000)
+    return summarize(samples)
+
+def wait_results(client, profile_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        resp = client.get(f'/admin/profile/{profile_id}')
+        if resp.status_code == 200:
+            return resp
+        time.sleep(0.1)
+    return resp
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do profiler por amostragem")
+    parser.add_argument("--latency", type=float, default=20, help="Latência do Yahoo falso (ms)")
+    parser.add_argument("--seconds", type=float, default=2, help="Duração da sessão")
+    parser.add_argument("--hz", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False, PROFILE_POLL_SECONDS=0)
+    import market_data
+    import profiler
+    from models import User
+    market = FakeMarket(seed=12, latency_ms=args.latency, latency_jitter=0)
+    restore = install(market, site)
+    with site.app.app_context():
+        user_ids = seed(site.db, market, users=30, positions=3, alerts=0, watchlist=0, transactions=10)
+        site.db.session.get(User, user_ids[0]).special_role = 'ADMIN'
+        site.db.session.commit()
+    admin, regular = login_client(site, user_ids[0]), login_client(site, user_ids[1])
+    failures = []
+
+    # 1) Sessão em todos os workers (aqui só um)
+    off = hit(admin, market_data, args.repeat)
+    resp = admin.post('/admin/profile/start', data={'seconds': args.seconds, 'hz': args.hz})
+    session = resp.get_json()
+    on = hit(admin, market_data, args.repeat)
+    while time.time() < session['until']:
+        hit(admin, market_data, 1)
+    resp = wait_results(admin, session['id'], timeout=args.seconds + 10)
+    stacks = resp.get_data(as_text=True).splitlines() if resp.status_code == 200 else []
+    attributed = {prefix: sum(int(line.rsplit(" ", 1)[1]) for line in stacks if line.startswith(prefix))
+                  for prefix in ROUTES}
+    upstream = sum(int(line.rsplit(" ", 1)[1]) for line in stacks
+                   if line.startswith(ROUTES) and ";upstream:yahoo;" in line)
+    print(f"sessão {session['id']}: {resp.headers.get('X-Profile-Samples')} amostras, {len(stacks)} stacks distintas")
+    for prefix, count in attributed.items():
+        print(f"  {prefix:<28} {count:>6} amostras")
+    print(f"  {'... dentro de upstream:yahoo':<28} {upstream:>6} amostras")
+    if not all(attributed.values()) or not upstream:
+        failures.append("atribuição da sessão")
+
+    # 2) Um pedido com o header
+    resp = admin.get('/leaderboard', headers={'X-Profile': '1'})
+    profile_id = resp.headers.get('X-Profile-Id')
+    folded = admin.get(f'/admin/profile/{profile_id}?format=collapsed') if profile_id else None
+    scope = admin.get(f'/admin/profile/{profile_id}?format=speedscope') if profile_id else None
+    lines = folded.get_data(as_text=True).splitlines() if folded is not None and folded.status_code == 200 else []
+    ok_single = bool(lines) and all(line.startswith('route:leaderboard_page') for line in lines)
+    ok_scope = (scope is not None and scope.status_code == 200
+                and scope.get_json()['profiles'][0]['type'] == 'sampled')
+    print(f"\npedido {profile_id}: {len(lines)} stacks, speedscope {'ok' if ok_scope else 'FALHOU'}")
+    if not ok_single:
+        failures.append("perfil de um pedido")
+    if not ok_scope:
+        failures.append("formato speedscope")
+
+    # 3) Só admins
+    denied = [regular.get('/admin/profile').status_code, regular.post('/admin/profile/start').status_code,
+              regular.get(f'/admin/profile/{session["id"]}').status_code]
+    ignored = 'X-Profile-Id' not in regular.get('/leaderboard', headers={'X-Profile': '1'}).headers
+    print(f"não-admin: {denied}, header ignorado: {'sim' if ignored else 'NÃO'}")
+    if denied != [403, 403, 403] or not ignored:
+        failures.append("acesso de não-admin")
+
+    # 4) Custo
+    print(f"\n{'':<22} {'p50 ms':>8} {'p90 ms':>8}")
+    print(f"{'profiler desligado':<22} {off['p50_ms']:>8.1f} {off['p90_ms']:>8.1f}")
+    print(f"{f'sessão a {args.hz} Hz':<22} {on['p50_ms']:>8.1f} {on['p90_ms']:>8.1f}")
+    if profiler.active:
+        failures.append("sampler ficou a correr")
+
+    restore()
+    print("\nOK" if not failures else f"\nFALHOU: {', '.join(failures)}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
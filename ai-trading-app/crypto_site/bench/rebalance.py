@@ -0,0 +1,96 @@
+# bench/rebalance.py
+# Rebalancear a carteira para pesos-alvo: N pedidos ao /paper_trading/trade (um por moeda)
+# vs um só pedido ao /paper_trading/rebalance. Conta statements SQL, downloads de preços e latência.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.rebalance
+#   python -m bench.rebalance --sizes 5 20 50 --latency-ms 80
+#
+# No fim confirma que os pesos obtidos pelo /rebalance batem com os pedidos.
+import argparse
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+from bench.harness import load_app, login_client
+from bench.fake_market import FakeMarket, install
+
+INITIAL_BALANCE = 100000.0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do rebalanceamento em lote")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 50], help="Nº de moedas da alocação")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latência simulada do Yahoo")
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    from models import User, Portfolio
+    universe = [f"C{i:03d}" for i in range(max(args.sizes))]
+    market = FakeMarket(seed=5, universe=universe, latency_ms=args.latency_ms, latency_jitter=0.0)
+    restore = install(market, site)
+    import market_data
+
+    statements = []
+    with site.app.app_context():
+        @event.listens_for(site.db.engine, "before_cursor_execute")
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if threading.current_thread() is threading.main_thread(): # ignora o worker do fan-out
+                statements.append(statement)
+
+    print(f"{'moedas':>7} {'modo':>10} {'pedidos':>8} {'statements':>11} {'ms':>9}")
+    failures = []
+    for size in args.sizes:
+        coins = universe[:size]
+        weights = {sym: 0.9 / size for sym in coins}
+        runs = {}
+        for mode in ('trade', 'rebalance'):
+            name = f"{mode}{size}"
+            with site.app.app_context():
+                db = site.db
+                db.session.execute(db.insert(User), [{'username': name, 'email': f"{name}@bench.local", 'password': "x",
+                                                      'virtual_balance': INITIAL_BALANCE}])
+                uid = db.session.execute(db.select(User.id).where(User.username == name)).scalar_one()
+                db.session.commit()
+            client = login_client(site, uid)
+            market_data.prices.clear() # cada modo começa com os buffers frios
+            statements.clear()
+            start = time.perf_counter()
+            if mode == 'trade':
+                requests_made = size
+                for sym in coins:
+                    resp = client.post('/paper_trading/trade', data={'symbol': sym, 'action': 'BUY', 'trade_mode': 'fiat',
+                                                                    'amount': str(weights[sym] * INITIAL_BALANCE)})
+                    if resp.status_code != 302:
+                        failures.append(f"{name}: HTTP {resp.status_code}")
+            else:
+                requests_made = 1
+                resp = client.post('/paper_trading/rebalance', json={'weights': weights})
+                if resp.status_code != 200 or resp.get_json().get('status') != 'ok':
+                    failures.append(f"{name}: HTTP {resp.status_code} {resp.get_json()}")
+            elapsed = (time.perf_counter() - start) * 1000
+            runs[mode] = uid
+            print(f"{size:>7} {mode:>10} {requests_made:>8} {len(statements):>11} {elapsed:>9.1f}")
+
+        # Pesos obtidos pelo rebalance (ao preço de execução, guardado como avg_price)
+        with site.app.app_context():
+            db = site.db
+            rows = db.session.execute(db.select(Portfolio.symbol, Portfolio.amount, Portfolio.avg_price)
+                                      .where(Portfolio.user_id == runs['rebalance'])).all()
+            cash = db.session.get(User, runs['rebalance']).virtual_balance
+            equity = cash + sum(a * p for _, a, p in rows)
+            for sym, amount, px in rows:
+                if abs(amount * px / equity - weights[sym]) > 1e-6:
+                    failures.append(f"rebalance{size}: peso de {sym} {amount * px / equity:.6f} != {weights[sym]:.6f}")
+            if len(rows) != size or abs(equity - INITIAL_BALANCE) > 1e-6 * INITIAL_BALANCE:
+                failures.append(f"rebalance{size}: {len(rows)} posições, património {equity:.2f}")
+
+    restore()
+    for f in failures:
+        print(f"FALHA: {f}")
+    print("OK" if not failures else "")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
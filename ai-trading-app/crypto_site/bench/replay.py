@@ -0,0 +1,277 @@
+# bench/replay.py
+# Simulador de replay de mercado: empurra ticks (gravados ou sintéticos) pela camada de preços
+# (market_data.prices) a 1x-1000x e avalia alertas + valorização das carteiras como a app faz.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.replay --scenario mixed --minutes 60 --speed 1000
+#   python -m bench.replay --scenario flash_crash --poll-seconds 60 --json replay.json
+#   python -m bench.replay --csv ticks.csv --speed 0      # CSV: timestamp,symbol,price
+#
+# Relatório: latência tick->notificação (tempo real e tempo de mercado), alertas falhados
+# (o preço cruzou o alvo mas o alerta nunca disparou) e CPU por tick.
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from bench.harness import load_app, summarize, git_revision
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+SCENARIOS = ('random_walk', 'flash_crash', 'gap', 'mixed')
+
+# Cópia leve das posições: os objetos ORM expiram a cada commit dos alertas
+Position = namedtuple('Position', 'symbol amount avg_price')
+
+# --- GERADORES DE TICKS ---
+
+def random_walk(rng, n, start, vol=0.0008):
+    return start * np.exp(np.cumsum(rng.normal(0.0, vol, n)))
+
+def flash_crash(rng, n, start, depth=0.15, vol=0.0005):
+    # Queda de `depth` em poucos ticks e recuperação quase total logo a seguir (wick)
+    path = random_walk(rng, n, start, vol)
+    at = n // 2
+    width = max(3, n // 200)
+    shape = np.zeros(n)
+    down = np.linspace(0, -depth, width)
+    up = np.linspace(-depth, -depth * 0.1, width * 2)
+    seg = np.concatenate([down, up])[: n - at]
+    shape[at:at + len(seg)] = seg
+    shape[at + len(seg):] = -depth * 0.1
+    return path * (1 + shape)
+
+def gap_move(rng, n, start, gap=0.08, vol=0.0005):
+    path = random_walk(rng, n, start, vol)
+    sign = 1 if rng.random() < 0.5 else -1
+    path[n // 3:] *= (1 + sign * gap)
+    return path
+
+GENERATORS = {'random_walk': random_walk, 'flash_crash': flash_crash, 'gap': gap_move}
+
+def synthetic_paths(symbols, market, scenario, n, seed_value):
+    rng = np.random.default_rng(seed_value)
+    paths = {}
+    for i, sym in enumerate(symbols):
+        kind = SCENARIOS[i % 3] if scenario == 'mixed' else scenario
+        paths[sym] = GENERATORS[kind](rng, n, market.base_price(sym))
+    return paths
+
+def load_csv(path):
+    # Agrupa ticks por timestamp -> matriz (passos x símbolos), repetindo o último preço
+    rows = []
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            ts = row['timestamp']
+            try:
+                t = float(ts)
+            except ValueError:
+                t = datetime.fromisoformat(ts).timestamp()
+            rows.append((t, row['symbol'].upper().replace('-USD', ''), float(row['price'])))
+    rows.sort()
+    times = sorted({r[0] for r in rows})
+    symbols = sorted({r[1] for r in rows})
+    index = {t: i for i, t in enumerate(times)}
+    paths = {s: np.full(len(times), np.nan) for s in symbols}
+    for t, s, p in rows:
+        paths[s][index[t]] = p
+    for s in symbols: # forward fill
+        arr = paths[s]
+        for i in range(1, len(arr)):
+            if np.isnan(arr[i]):
+                arr[i] = arr[i - 1]
+        paths[s] = arr
+    dt = float(np.median(np.diff(times))) if len(times) > 1 else 1.0
+    return paths, dt
+
+# --- ALERTAS COM "VERDADE" CONHECIDA ---
+
+def seed_alerts(db, paths, user_ids, per_user, rng):
+    from models import PriceAlert
+    rows = []
+    symbols = sorted(paths)
+    # Criados um minuto antes do replay: as barras do primeiro minuto contam para eles
+    created = datetime.utcnow() - timedelta(minutes=1)
+    for uid in user_ids:
+        for _ in range(per_user):
+            sym = symbols[rng.integers(len(symbols))]
+            start = paths[sym][0]
+            above = rng.random() < 0.5
+            pct = rng.uniform(0.005, 0.2)
+            rows.append({'user_id': int(uid), 'symbol': sym, 'condition': 'above' if above else 'below',
+                         'target_price': start * (1 + pct if above else 1 - pct), 'is_active': True,
+                         'created_at': created})
+    db.session.execute(db.insert(PriceAlert), rows)
+    db.session.commit()
+    return PriceAlert.query.all()
+
+def first_crossing(alert, path):
+    hits = np.nonzero(path >= alert.target_price if alert.condition == 'above' else path <= alert.target_price)[0]
+    return int(hits[0]) if len(hits) else None
+
+def late_alert(db, symbol, base):
+    # Devolve (disparados depois do pico, disparados no fim, id do alerta); símbolo fora do replay
+    # Alerta criado depois de um pico já visto pelo buffer (mas ainda não por uma passagem):
+    # o pico é de antes do alerta e não o pode disparar. Um preço acima do alvo depois dele sim.
+    import market_data
+    from alerts import evaluate_alerts
+    from models import PriceAlert
+    store, fired = market_data.prices, []
+    notify = lambda alert, price: fired.append(alert.id)
+    store.clear()
+    t = time.time()
+    t -= t % 60
+    store.update(symbol, base, ts=t)
+    evaluate_alerts(notify=notify)
+    store.update(symbol, base * 1.2, ts=t + 60)
+    alert = PriceAlert(user_id=1, symbol=symbol, condition='above', target_price=base * 1.1,
+                       is_active=True, created_at=datetime.utcfromtimestamp(t + 120))
+    db.session.add(alert)
+    db.session.commit()
+    store.update(symbol, base, ts=t + 180)
+    evaluate_alerts(notify=notify)
+    early = list(fired)
+    store.update(symbol, base * 1.15, ts=t + 240)
+    evaluate_alerts(notify=notify)
+    return early, list(fired), alert.id
+
+# --- REPLAY ---
+
+def replay(site, paths, dt, speed, poll_seconds, portfolios):
+    import market_data
+    from alerts import evaluate_alerts, send_alert_email
+
+    symbols = sorted(paths)
+    n = len(next(iter(paths.values())))
+    push_wall = np.zeros(n)
+    fired = {} # alert_id -> (wall, passo)
+    cpu = {'ingest': 0.0, 'alerts': 0.0, 'valuation': 0.0}
+    evaluations = 0
+    step_ref = [0]
+
+    def notify(alert, price):
+        send_alert_email(alert, price)
+        fired[alert.id] = (time.perf_counter(), step_ref[0])
+
+    poll_every = max(1, int(round(poll_seconds / dt)))
+    t0 = time.time()
+    market_data.prices.clear()
+    wall_start = time.perf_counter()
+    for step in range(n):
+        if speed > 0:
+            target = wall_start + step * dt / speed
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        c0 = time.process_time()
+        market_ts = t0 + step * dt # tempo de mercado (as barras de 1 minuto formam-se com ele)
+        for sym in symbols:
+            market_data.prices.update(sym, paths[sym][step], ts=market_ts)
+        push_wall[step] = time.perf_counter()
+        cpu['ingest'] += time.process_time() - c0
+
+        if step % poll_every == poll_every - 1 or step == n - 1:
+            step_ref[0] = step
+            c0 = time.process_time()
+            evaluate_alerts(notify=notify)
+            cpu['alerts'] += time.process_time() - c0
+            c0 = time.process_time()
+            for items in portfolios.values():
+                market_data.portfolio_value(items, market_data.prices.get)
+            cpu['valuation'] += time.process_time() - c0
+            evaluations += 1
+    wall = time.perf_counter() - wall_start
+    return fired, push_wall, cpu, evaluations, wall, n
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay de mercado para stress-test de alertas")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--csv", help="Ticks gravados (timestamp,symbol,price)")
+    parser.add_argument("--symbols", nargs="+", default=['BTC', 'ETH', 'SOL', 'XRP', 'DOGE', 'ADA'])
+    parser.add_argument("--minutes", type=float, default=60, help="Duração sintética (tempo de mercado)")
+    parser.add_argument("--tick-seconds", type=float, default=1.0, help="Intervalo entre ticks sintéticos")
+    parser.add_argument("--speed", type=float, default=1000, help="1 = tempo real, 1000 = 1000x, 0 = sem pausas")
+    parser.add_argument("--poll-seconds", type=float, default=60, help="Cadência de avaliação dos alertas (tempo de mercado)")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--alerts-per-user", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    site = load_app()
+    market = FakeMarket(seed=args.seed)
+    restore = install(market, site)
+    try:
+        if args.csv:
+            paths, dt = load_csv(args.csv)
+        else:
+            n = int(args.minutes * 60 / args.tick_seconds)
+            paths, dt = synthetic_paths(args.symbols, market, args.scenario, n, args.seed), args.tick_seconds
+        market.universe |= set(paths)
+
+        with site.app.app_context():
+            from models import Portfolio
+            rng = np.random.default_rng(args.seed)
+            user_ids = seed(site.db, market, users=args.users, alerts=0, transactions=0, seed=args.seed)
+            alerts = seed_alerts(site.db, paths, user_ids, args.alerts_per_user, rng)
+            truth = {a.id: first_crossing(a, paths[a.symbol]) for a in alerts}
+            portfolios = {}
+            for item in Portfolio.query.all():
+                portfolios.setdefault(item.user_id, []).append(Position(item.symbol, item.amount, item.avg_price))
+
+            fired, push_wall, cpu, evaluations, wall, n = replay(site, paths, dt, args.speed, args.poll_seconds, portfolios)
+            late = late_alert(site.db, 'LATE', 100.0)
+    finally:
+        restore()
+
+    crossed = {aid: step for aid, step in truth.items() if step is not None}
+    missed = [aid for aid in crossed if aid not in fired]
+    spurious = [aid for aid in fired if aid not in crossed]
+    wall_latency = [(fired[aid][0] - push_wall[step]) * 1000 for aid, step in crossed.items() if aid in fired]
+    market_latency = [(fired[aid][1] - step) * dt for aid, step in crossed.items() if aid in fired]
+    total_cpu = sum(cpu.values())
+
+    report = {
+        "revision": git_revision(),
+        "params": vars(args),
+        "ticks": n * len(paths),
+        "steps": n,
+        "evaluations": evaluations,
+        "wall_s": wall,
+        "alerts": len(truth),
+        "crossed": len(crossed),
+        "fired": len(fired),
+        "missed": len(missed),
+        "spurious": len(spurious),
+        "fire_latency_wall": summarize(wall_latency),
+        "fire_latency_market_s": summarize(market_latency),
+        "cpu_us_per_tick": total_cpu / max(1, n * len(paths)) * 1e6,
+        "cpu_breakdown_s": cpu,
+        "emails": len(market.sent_mail),
+        "late_alert_ok": not late[0] and late[1] == [late[2]],
+    }
+
+    print(f"Replay: {n} passos x {len(paths)} símbolos ({report['ticks']} ticks) em {wall:.2f}s "
+          f"(velocidade {f'{args.speed:g}x' if args.speed else 'máx'}, {evaluations} avaliações)")
+    print(f"Alertas: {len(truth)} | cruzaram: {len(crossed)} | disparados: {len(fired)} | "
+          f"FALHADOS: {len(missed)} | espúrios: {len(spurious)}")
+    wl, ml = report["fire_latency_wall"], report["fire_latency_market_s"]
+    print(f"Latência tick->notificação (real): p50 {wl['p50_ms']:.1f} ms | p99 {wl['p99_ms']:.1f} ms | max {wl['max_ms']:.1f} ms")
+    print(f"Latência em tempo de mercado: p50 {ml['p50_ms']:.1f} s | p99 {ml['p99_ms']:.1f} s")
+    print(f"CPU: {report['cpu_us_per_tick']:.1f} µs/tick (ingestão {cpu['ingest']:.3f}s, "
+          f"alertas {cpu['alerts']:.3f}s, valorização {cpu['valuation']:.3f}s)")
+    print(f"Alerta criado depois de um pico: {'não disparou com o pico' if not late[0] else 'DISPAROU COM O PICO'}, "
+          f"{'disparou' if late[1] == [late[2]] else 'NÃO DISPAROU'} com o preço seguinte")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["late_alert_ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
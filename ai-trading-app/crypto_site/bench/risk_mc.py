@@ -0,0 +1,106 @@
+# bench/risk_mc.py
+# Benchmark do motor de risco (risk.py): Monte Carlo de 10k a 1M caminhos (um processo vs pool)
+# e atualização incremental da covariância quando chega um dia novo vs reconstrução completa.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.risk_mc
+#   python -m bench.risk_mc --paths 10000 100000 1000000 --workers 4 --symbols 50 --json risk.json
+#
+# Verifica também que a covariância incremental bate com a do pandas (pairwise) na mesma janela.
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from bench.harness import load_app, git_revision
+
+def seed_history(site, symbols, days, rng):
+    # Fechos diários sintéticos até anteontem; algumas moedas só com parte do histórico
+    from models import DailyPrice
+    today = datetime.utcnow().date()
+    rows = []
+    for i, sym in enumerate(symbols):
+        n = days if i % 5 else days // 4
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, n)))
+        rows += [{'symbol': sym, 'day': today - timedelta(days=n + 1 - d), 'close': float(c)} for d, c in enumerate(closes)]
+    with site.app.app_context():
+        site.db.session.execute(site.db.insert(DailyPrice), rows)
+        site.db.session.commit()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do Monte Carlo e da covariância incremental")
+    parser.add_argument("--paths", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--workers", type=int, default=4, help="Processos do pool (risk.POOL_WORKERS)")
+    parser.add_argument("--assets", type=int, default=5, help="Moedas na carteira simulada")
+    parser.add_argument("--horizon", type=int, default=30)
+    parser.add_argument("--symbols", type=int, default=50, help="Tamanho do universo da covariância")
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False)
+    import risk
+    import market_data
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    ok = True
+
+    # 1) Covariância: reconstrução vs um dia novo
+    symbols = [f"S{i:03d}" for i in range(args.symbols)]
+    today = datetime.utcnow().date()
+    seed_history(site, symbols, risk.WINDOW_DAYS + 30, rng)
+    for sym in symbols:
+        market_data._daily_synced[sym] = today # só BD local, sem Yahoo
+    with site.app.app_context():
+        cache = risk.CovarianceCache()
+        start = time.perf_counter()
+        cache.update(symbols)
+        full_ms = (time.perf_counter() - start) * 1000
+
+        from models import DailyPrice
+        site.db.session.execute(site.db.insert(DailyPrice), [
+            {'symbol': s, 'day': today - timedelta(days=1), 'close': float(100 * np.exp(rng.normal(0, 0.3)))} for s in symbols])
+        site.db.session.commit()
+        start = time.perf_counter()
+        cache.update(symbols)
+        incr_ms = (time.perf_counter() - start) * 1000
+
+        _, cov = cache.moments(symbols, psd=False)
+        closes = market_data.daily_closes(symbols, today - timedelta(days=risk.WINDOW_DAYS + 1))
+        rets = np.log(closes[closes.index.date < today]).diff()
+        rets = rets[rets.index.date >= today - timedelta(days=risk.WINDOW_DAYS)]
+        expected = rets.cov().fillna(0.0).to_numpy()
+        err = float(np.abs(cov - expected).max() / np.abs(expected).max())
+    ok &= err < 1e-6
+    print(f"Covariância ({args.symbols} símbolos, janela {risk.WINDOW_DAYS} dias): reconstrução {full_ms:.1f} ms | "
+          f"dia novo {incr_ms:.1f} ms | erro relativo vs pandas {err:.1e}")
+    results["covariance"] = {"full_ms": full_ms, "incremental_ms": incr_ms, "max_rel_error": err}
+
+    # 2) Monte Carlo
+    mu, cov = cache.moments(symbols[1:args.assets + 1])
+    values = np.full(args.assets, 1000.0)
+    print(f"\nMonte Carlo: {args.assets} moedas, {args.horizon} dias")
+    print(f"{'caminhos':>10} {'modo':>10} {'s':>8} {'caminhos/s':>12} {'VaR 95%':>10}")
+    for paths in args.paths:
+        for mode, workers in (("1 proc", 1), (f"pool x{args.workers}", args.workers)):
+            risk.POOL_WORKERS = workers
+            risk.monte_carlo(mu, cov, values, 0.0, args.horizon, min(paths, risk.POOL_MIN_PATHS), seed=0) # aquecer o pool
+            start = time.perf_counter()
+            terminal, bands = risk.monte_carlo(mu, cov, values, 0.0, args.horizon, paths, seed=args.seed)
+            elapsed = time.perf_counter() - start
+            var = values.sum() - float(np.percentile(terminal, 5))
+            print(f"{paths:>10,} {mode:>10} {elapsed:>8.2f} {paths / elapsed:>12,.0f} {var:>10.2f}")
+            results[f"mc_{paths}_{workers}"] = {"seconds": elapsed, "paths_per_s": paths / elapsed, "var95": var}
+            ok &= len(terminal) == paths and bands.shape == (len(risk.BAND_PERCENTILES), args.horizon)
+    print("\nOK" if ok else "\nFALHA")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"revision": git_revision(), "args": vars(args), "results": results}, f, indent=2)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
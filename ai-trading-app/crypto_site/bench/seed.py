@@ -0,0 +1,53 @@
+# bench/seed.py
+# Povoa a BD com utilizadores, carteiras, alertas, watchlists e transações (inserts em bulk).
+import random
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from bench.fake_market import DEFAULT_UNIVERSE
+
+BENCH_PASSWORD = "bench-password"
+
+def seed(db, market, users=2000, positions=5, alerts=1, watchlist=3, transactions=10, seed=42):
+    from models import User, Portfolio, Transaction, PriceAlert, Watchlist
+
+    rng = random.Random(seed)
+    password = generate_password_hash(BENCH_PASSWORD, method='pbkdf2:sha256')
+    universe = sorted(market.universe) if market else DEFAULT_UNIVERSE
+    now = datetime.utcnow()
+
+    db.session.execute(db.insert(User), [{
+        'username': f"trader{i}", 'email': f"trader{i}@bench.local", 'password': password,
+        'plan_type': rng.choice(['Starter', 'Pro', 'Ultra']), 'virtual_balance': rng.uniform(1000, 20000),
+        'created_at': now,
+    } for i in range(users)])
+    user_ids = [uid for (uid,) in db.session.execute(db.select(User.id).order_by(User.id))]
+
+    portfolio_rows, tx_rows, alert_rows, watch_rows = [], [], [], []
+    for uid in user_ids:
+        for sym in rng.sample(universe, min(positions, len(universe))):
+            price = market.base_price(sym) if market else 1.0
+            portfolio_rows.append({'user_id': uid, 'symbol': sym, 'amount': rng.uniform(0.01, 10) * 100 / price, 'avg_price': price * rng.uniform(0.8, 1.2)})
+        for n in range(transactions):
+            sym = rng.choice(universe)
+            price = (market.base_price(sym) if market else 1.0) * rng.uniform(0.8, 1.2)
+            amount = rng.uniform(10, 500) / price
+            tx_rows.append({'user_id': uid, 'symbol': sym, 'type': rng.choice(['BUY', 'SELL']), 'price': price,
+                            'amount': amount, 'total_value': amount * price, 'timestamp': now - timedelta(hours=n * 7)})
+        for _ in range(alerts):
+            sym = rng.choice(universe)
+            price = market.base_price(sym) if market else 1.0
+            # ~10% dos alertas disparam logo; os restantes ficam longe do preço
+            above = rng.random() < 0.5
+            factor = rng.choice([0.5, 2.0]) if rng.random() > 0.1 else 1.0
+            alert_rows.append({'user_id': uid, 'symbol': sym, 'condition': 'above' if above else 'below',
+                               'target_price': price * (factor if above else 1 / factor), 'is_active': True, 'created_at': now})
+        for sym in rng.sample(universe, min(watchlist, len(universe))):
+            watch_rows.append({'user_id': uid, 'symbol': sym})
+
+    for model, rows in ((Portfolio, portfolio_rows), (Transaction, tx_rows), (PriceAlert, alert_rows), (Watchlist, watch_rows)):
+        if rows:
+            db.session.execute(db.insert(model), rows)
+    db.session.commit()
+    return user_ids
@@ -0,0 +1,156 @@
+# bench/snapshot.py
+# Arranque quente com o snapshot do mercado (snapshot.py):
+#   1) primeiro pedido de cada página depois de um "restart" (buffers de preços, movers e cache
+#      limpos) sem snapshot e com snapshot: latência e chamadas ao Yahoo/RSS feitas dentro do
+#      pedido. Com snapshot os dados saem logo (um pouco velhos) e a atualização corre em background;
+#   2) custo de gravar/restaurar um universo grande (tamanho do ficheiro, tempo de save e de load
+#      com mmap).
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.snapshot
+#   python -m bench.snapshot --latency 300 --symbols 5000 --age 600
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from bench.harness import load_app, login_client
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+PAGES = ['/', '/crypto', '/api/news', '/get_recommendations']
+UPSTREAMS = ('yahoo', 'rss')
+
+def count_in_requests(market):
+    # Chamadas ao Yahoo/RSS feitas dentro dos pedidos (as da thread movers-refresh não contam)
+    counts = {}
+    upstream = market._upstream
+    def tracked(provider):
+        if provider in UPSTREAMS and threading.current_thread().name != "movers-refresh":
+            counts[provider] = counts.get(provider, 0) + 1
+        return upstream(provider)
+    market._upstream = tracked
+    return counts
+
+def restart(site):
+    # O que um worker novo tem: nada em memória
+    import market_data
+    import movers
+    market_data.prices.clear()
+    movers.tracker.clear()
+    with site.app.app_context():
+        site.cache.clear()
+
+def first_requests(client, counts):
+    rows = []
+    for url in PAGES:
+        before = sum(counts.values())
+        t = time.perf_counter()
+        resp = client.get(url)
+        ms = (time.perf_counter() - t) * 1000
+        rows.append((url, resp.status_code, ms, sum(counts.values()) - before))
+    return rows
+
+def age_snapshot(directory, age):
+    # Finge que o snapshot foi gravado há `age` segundos (restart algum tempo depois)
+    path = os.path.join(directory, "market.json")
+    with open(path) as f:
+        index = json.load(f)
+    index['bars_at'] -= age
+    for item in index['views'].values():
+        item['at'] -= age
+    with open(path, 'w') as f:
+        json.dump(index, f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do snapshot para arranques quentes")
+    parser.add_argument("--latency", type=float, default=150, help="Latência do Yahoo/RSS falsos (ms)")
+    parser.add_argument("--age", type=int, default=600, help="Idade do snapshot no restart (s)")
+    parser.add_argument("--symbols", type=int, default=2000, help="Universo do teste de save/load")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="flowtrade-snapshot-")
+    site = load_app(metrics=False, SNAPSHOT_INTERVAL=60, SNAPSHOT_DIR=directory)
+    import market_data
+    import movers
+    import snapshot
+    market = FakeMarket(seed=11, latency_ms=args.latency, latency_jitter=0)
+    restore = install(market, site)
+    counts = count_in_requests(market)
+    with site.app.app_context():
+        user_ids = seed(site.db, market, users=3, positions=2, alerts=0, watchlist=0, transactions=0)
+    client = login_client(site, user_ids[0])
+    failures = []
+
+    # Estado "de produção": páginas visitadas, snapshot gravado
+    for url in PAGES:
+        client.get(url)
+    with site.app.app_context():
+        saved = snapshot.market.save()
+    before = movers.tracker.gainers(3)
+    age_snapshot(directory, args.age)
+
+    restart(site)
+    cold = first_requests(client, counts)
+    restart(site)
+    t = time.perf_counter()
+    restored = snapshot.market.load()
+    load_ms = (time.perf_counter() - t) * 1000
+    warm = first_requests(client, counts)
+    served = movers.tracker.gainers(3)
+
+    print(f"snapshot com {saved} símbolos, restaurado {args.age}s depois em {load_ms:.1f} ms ({restored} símbolos)\n")
+    print(f"{'1º pedido':<22} {'frio ms':>9} {'upstream':>9} {'quente ms':>10} {'upstream':>9}")
+    for (url, status_c, ms_c, calls_c), (_, status_w, ms_w, calls_w) in zip(cold, warm):
+        print(f"{url:<22} {ms_c:>9.0f} {calls_c:>9} {ms_w:>10.0f} {calls_w:>9}")
+        if status_c != 200 or status_w != 200:
+            failures.append(f"{url}: {status_c}/{status_w}")
+        if calls_w:
+            failures.append(f"{url} foi ao upstream no arranque quente")
+    if [g['symbol'] for g in served] != [g['symbol'] for g in before]:
+        failures.append("movers restaurados diferentes")
+
+    # A atualização em background termina e traz os dados para o presente
+    if movers.tracker._refresh_lock.acquire(timeout=10):
+        movers.tracker._refresh_lock.release()
+    fresh = time.time() - movers.tracker._last_tick <= movers.MAX_AGE
+    print(f"\natualização em background: {'ok' if fresh else 'NÃO CORREU'}")
+    if not fresh:
+        failures.append("refresh em background")
+    restore()
+
+    # Universo grande: tamanho e tempos de save/load
+    restart(site)
+    rng = np.random.default_rng(5)
+    now = time.time()
+    ts = now - now % 60 - np.arange(market_data.RING_SIZE)[::-1] * 60
+    for i in range(args.symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, len(ts))))
+        bars = np.column_stack([ts, close, close * 1.001, close * 0.999, close, rng.uniform(1, 100, len(ts))])
+        market_data.prices.restore(f"S{i:05d}", bars, (close[-1], now))
+    with site.app.app_context():
+        t = time.perf_counter()
+        snapshot.market.save()
+        save_s = time.perf_counter() - t
+    size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+    reference = market_data.prices.ring("S00042").bars()
+    restart(site)
+    t = time.perf_counter()
+    restored = snapshot.market.load()
+    load_s = time.perf_counter() - t
+    same = np.array_equal(market_data.prices.ring("S00042").bars(), reference)
+    print(f"\n{args.symbols} símbolos x {market_data.RING_SIZE} barras: {size / 1e6:.1f} MB, "
+          f"save {save_s * 1000:.0f} ms, load {load_s * 1000:.0f} ms ({restored} símbolos)")
+    if restored != args.symbols or not same:
+        failures.append("save/load do universo grande")
+
+    print("\nOK" if not failures else f"\nFALHOU: {', '.join(failures)}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
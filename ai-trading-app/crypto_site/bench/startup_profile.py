@@ -0,0 +1,128 @@
+# bench/startup_profile.py
+# Perfil de arranque: tempos de import (-X importtime) e cold start de um worker até à 1ª resposta.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.startup_profile
+#   python -m bench.startup_profile --budget-ms 1500 --top 25 --json startup.json
+#
+# Sai com código 1 se o orçamento de cold start for ultrapassado ou se algum módulo
+# pesado for importado logo no "import app" (devem ser carregados só no primeiro uso).
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que NÃO devem ser importados ao carregar a app
+HEAVY_MODULES = ["yfinance", "pandas", "numpy", "PIL", "feedparser", "google.genai", "requests"]
+
+COLD_START_SNIPPET = """
+import time, json
+t0 = time.perf_counter()
+import app as site
+t1 = time.perf_counter()
+client = site.app.test_client()
+resp = client.get('/legal/terms')
+t2 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'first_request_ms': (t2 - t1) * 1000, 'status': resp.status_code}))
+"""
+
+def _child_env():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+def parse_importtime(stderr):
+    # Formato: "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            _, rest = line.split(":", 1)
+            self_us, cumulative_us, name = rest.split("|")
+            rows.append({
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip())) // 2,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+            })
+        except ValueError:
+            continue
+    return rows
+
+def import_profile():
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                          cwd=SITE_DIR, env=_child_env(), capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"'import app' falhou:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+def cold_start():
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", COLD_START_SNIPPET],
+                          cwd=SITE_DIR, env=_child_env(), capture_output=True, text=True)
+    total_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"Cold start falhou:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["total_ms"] = total_ms # Inclui o arranque do interpretador
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfil de arranque da app")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", 2000)),
+                        help="Orçamento do cold start (processo novo -> 1ª resposta)")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts a medir (usa-se o mediano)")
+    parser.add_argument("--json", dest="json_path", help="Guardar o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    rows = import_profile()
+    app_row = next((r for r in rows if r["module"] == "app"), None)
+    loaded = {r["module"] for r in rows}
+    heavy_loaded = [m for m in HEAVY_MODULES if m in loaded]
+
+    print("=== Import time (import app) ===")
+    if app_row:
+        print(f"app: {app_row['cumulative_us'] / 1000:.1f} ms cumulativo")
+    print(f"{'cumulativo (ms)':>16} {'self (ms)':>10}  módulo")
+    for r in sorted(rows, key=lambda r: r["cumulative_us"], reverse=True)[:args.top]:
+        print(f"{r['cumulative_us'] / 1000:16.1f} {r['self_us'] / 1000:10.1f}  {'  ' * r['depth']}{r['module']}")
+
+    runs = sorted((cold_start() for _ in range(max(1, args.runs))), key=lambda r: r["total_ms"])
+    median = runs[len(runs) // 2]
+    print("\n=== Cold start (processo novo -> 1ª resposta) ===")
+    print(f"import app: {median['import_ms']:.1f} ms | 1º pedido: {median['first_request_ms']:.1f} ms | "
+          f"total: {median['total_ms']:.1f} ms (orçamento {args.budget_ms:.0f} ms, HTTP {median['status']})")
+
+    ok = True
+    if heavy_loaded:
+        ok = False
+        print(f"\nFALHA: módulos pesados importados no arranque: {', '.join(heavy_loaded)}")
+    if median["total_ms"] > args.budget_ms:
+        ok = False
+        print(f"\nFALHA: cold start acima do orçamento ({median['total_ms']:.0f} > {args.budget_ms:.0f} ms)")
+    if median["status"] != 200:
+        ok = False
+        print(f"\nFALHA: 1º pedido respondeu HTTP {median['status']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "app_import_ms": app_row["cumulative_us"] / 1000 if app_row else None,
+                "heavy_loaded": heavy_loaded,
+                "cold_start": median,
+                "budget_ms": args.budget_ms,
+                "top_imports": sorted(rows, key=lambda r: r["cumulative_us"], reverse=True)[:args.top],
+            }, f, indent=2)
+
+    print("\nOK" if ok else "")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
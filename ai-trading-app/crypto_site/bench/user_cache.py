@@ -0,0 +1,125 @@
+# bench/user_cache.py
+# Cache do utilizador e das quotas (usercache.py): instruções SQL por pedido nas páginas principais
+# sem cache (USER_CACHE_TTL=0, um SELECT do utilizador em cada pedido, COUNTs nos limites) e com
+# cache. Confirma também que a cache não mostra dados velhos:
+#   - saldo depois de um trade (no mesmo worker e noutro worker com a entrada antiga na cache);
+#   - plano depois de /subscribe;
+#   - análises de AI contadas em memória e gravadas em lote na BD.
+#
+# Uso (a partir de crypto_site):
+#   python -m bench.user_cache
+#   python -m bench.user_cache --repeat 50
+import argparse
+import re
+import sys
+
+from sqlalchemy import event
+
+from bench.harness import load_app, login_client
+from bench.fake_market import FakeMarket, install
+from bench.seed import seed
+
+PAGES = ['/pricing', '/profile', '/ai/vision', '/crypto/tools', '/watchlist', '/paper_trading', '/history']
+BALANCE = re.compile(rb'\$([\d,]+)</div>')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da cache de utilizador e quotas")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    site = load_app(metrics=False, USER_CACHE_TTL=30, QUOTA_FLUSH_SECONDS=3600)
+    import usercache
+    from models import User
+    market = FakeMarket(seed=9, latency_ms=0)
+    restore = install(market, site)
+    with site.app.app_context():
+        user_ids = seed(site.db, market, users=args.users, positions=3, alerts=1, watchlist=2, transactions=20)
+        uid = user_ids[0]
+        site.db.session.get(User, uid).plan_type = 'Pro'
+        site.db.session.commit()
+
+    statements = [0]
+    with site.app.app_context():
+        event.listen(site.db.engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+    def measure(client, method, url, **kwargs):
+        before = statements[0]
+        resp = getattr(client, method)(url, **kwargs)
+        return resp, statements[0] - before
+
+    client = login_client(site, uid)
+    failures = []
+    results = {}
+    for label, ttl in (("sem cache", 0), ("com cache", 30)):
+        usercache.users.ttl = ttl
+        site.cache.clear()
+        rows = {}
+        for url in PAGES:
+            client.get(url) # aquece (primeiro pedido preenche a cache)
+            total = 0
+            for _ in range(args.repeat):
+                resp, n = measure(client, 'get', url)
+                total += n
+                if resp.status_code != 200:
+                    failures.append(f"{label} {url}: {resp.status_code}")
+            rows[f"GET {url}"] = total / args.repeat
+        resp, rows["POST /api/toggle_watchlist"] = measure(client, 'post', '/api/toggle_watchlist/DOGE')
+        client.post('/api/toggle_watchlist/DOGE') # repõe
+        resp, rows["POST /api/create_alert"] = measure(client, 'post', '/api/create_alert',
+                                                       data={'symbol': 'BTC', 'target': '1', 'condition': 'below'})
+        with site.app.app_context():
+            alert = site.PriceAlert.query.filter_by(user_id=uid, target_price=1.0).first()
+        client.get(f'/api/delete_alert/{alert.id}')
+        results[label] = rows
+
+    print(f"{'pedido':<30} {'SQL sem cache':>14} {'com cache':>10}")
+    for key in results["sem cache"]:
+        print(f"{key:<30} {results['sem cache'][key]:>14.1f} {results['com cache'][key]:>10.1f}")
+    before, after = sum(results["sem cache"].values()), sum(results["com cache"].values())
+    print(f"{'total':<30} {before:>14.1f} {after:>10.1f}")
+    if after >= before:
+        failures.append("menos SQL com cache")
+
+    # 1) Saldo depois de um trade, no mesmo worker
+    def shown_balance():
+        return int(BALANCE.search(client.get('/profile').data).group(1).replace(b',', b''))
+    def db_balance():
+        with site.app.app_context():
+            return round(site.db.session.get(User, uid).virtual_balance)
+    shown_balance()
+    with site.app.app_context():
+        stale = site.cache.get(usercache._key(uid)) # entrada que "outro worker" ainda tem
+    client.post('/paper_trading/trade', data={'symbol': 'BTC', 'action': 'BUY', 'trade_mode': 'fiat', 'amount': '1000'})
+    ok_local = shown_balance() == db_balance()
+    # 2) ... e noutro worker: a entrada antiga continua na cache dele, mas o cliente escreveu depois
+    with site.app.app_context():
+        site.cache.set(usercache._key(uid), stale, timeout=30)
+    ok_remote = shown_balance() == db_balance()
+    # 3) Plano
+    client.get('/subscribe/Ultra')
+    ok_plan = b'ULTRA PLAN' in client.get('/pricing').data
+    client.get('/subscribe/Pro')
+    # 4) Quota de AI: contada em memória, gravada no flush
+    with site.app.app_context():
+        for _ in range(2):
+            usercache.ai_quota.add(uid)
+    remaining = re.search(rb'<strong>(\d+)</strong> / 5', client.get('/ai/vision').data)
+    with site.app.app_context():
+        flushed = usercache.ai_quota.flush()
+        saved = site.db.session.get(User, uid).ai_usage_count
+    after_flush = re.search(rb'<strong>(\d+)</strong> / 5', client.get('/ai/vision').data)
+    ok_quota = (remaining and remaining.group(1) == b'3' and flushed == 1 and saved == 2
+                and after_flush and after_flush.group(1) == b'3')
+    print(f"\nsaldo após trade (mesmo worker): {'ok' if ok_local else 'VELHO'}")
+    print(f"saldo após trade (outro worker): {'ok' if ok_remote else 'VELHO'}")
+    print(f"plano após /subscribe: {'ok' if ok_plan else 'VELHO'}")
+    print(f"quota de AI (memória + flush): {'ok' if ok_quota else 'ERRADA'}")
+    failures += [name for name, ok in (("saldo", ok_local), ("saldo noutro worker", ok_remote),
+                                       ("plano", ok_plan), ("quota", ok_quota)) if not ok]
+
+    restore()
+    print("\nOK" if not failures else f"\nFALHOU: {', '.join(failures)}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# charts.py
+# Séries para gráficos servidas por nós (/api/chart, /api/sparklines), a partir do histórico que
+# já temos: o buffer de barras de 1 minuto do market_data (intervalo 1d) e a tabela daily_price
+# (7d a 5y). Nada de widgets de terceiros para desenhar uma linha de 60 pixels.
+#
+# As séries são reduzidas no servidor para a largura pedida (um ponto por pixel):
+#   - linha (close): Largest-Triangle-Three-Buckets, que mantém os picos e vales visíveis;
+#   - velas (ohlcv): agregação por balde (open do 1º, high máx, low mín, close do último, volume somado).
+# Formatos: `json` (arrays de números arredondados a 6 algarismos significativos) ou `delta`
+# (inteiros: 1º valor e depois diferenças, com a escala decimal de cada coluna; comprime muito
+# melhor no gzip). Os resultados ficam em cache por (símbolo, intervalo, largura, série, formato).
+import math
+from datetime import datetime, timedelta
+from lazy_imports import np
+from extensions import cache
+from metrics import record_error
+from market_data import TS, OPEN, HIGH, LOW, CLOSE, VOLUME
+import market_data
+import coins
+
+RANGES = {'1d': None, '7d': 7, '1m': 30, '3m': 90, '1y': 365, '5y': 1825} # dias; None = barras de 1 minuto
+SERIES = ('close', 'ohlcv')
+FORMATS = ('json', 'delta')
+DEFAULT_WIDTH = 600
+MIN_WIDTH = 3 # o LTTB guarda sempre o primeiro e o último ponto
+MAX_WIDTH = 2000
+SPARKLINE_WIDTH = 60
+MAX_SPARKLINES = 50
+SIGNIFICANT_DIGITS = 6
+INTRADAY_TTL = 60 # segundos (uma barra nova por minuto)
+DAILY_TTL = 900
+EMPTY_TTL = 30 # séries vazias (sem dados no Yahoo/na BD): evita um download por pedido
+
+# --- REDUÇÃO ---
+
+def lttb(x, y, threshold):
+    # Índices dos `threshold` pontos escolhidos pelo Largest-Triangle-Three-Buckets (Steinarsson, 2013):
+    # em cada balde fica o ponto que faz o maior triângulo com o ponto escolhido no balde anterior
+    # e a média do balde seguinte. O algoritmo é sequencial (cada balde depende do anterior) e os
+    # baldes são pequenos, por isso o ciclo em listas Python é mais rápido que NumPy por balde.
+    n = len(x)
+    if threshold >= n or threshold < MIN_WIDTH:
+        return np.arange(n)
+    xs = np.asarray(x, dtype=float).tolist()
+    ys = np.asarray(y, dtype=float).tolist()
+    # threshold-2 baldes entre o primeiro e o último ponto; o "balde seguinte" do último é o último ponto
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int).tolist() + [n]
+    out = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end, following = edges[i], edges[i + 1], edges[i + 2]
+        count = following - end
+        avg_x = sum(xs[end:following]) / count
+        avg_y = sum(ys[end:following]) / count
+        ax, ay = xs[a], ys[a]
+        dx, dy = ax - avg_x, avg_y - ay
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        out.append(a)
+    out.append(n - 1)
+    return np.array(out)
+
+def ohlcv_buckets(bars, width):
+    # Velas agregadas em `width` baldes (bars: n x 6 como no BarRing)
+    n = len(bars)
+    if n <= width:
+        return bars
+    starts = np.linspace(0, n, width + 1).astype(int)[:-1]
+    ends = np.append(starts[1:], n) - 1
+    out = np.empty((width, 6))
+    out[:, TS] = bars[starts, TS]
+    out[:, OPEN] = bars[starts, OPEN]
+    out[:, HIGH] = np.maximum.reduceat(bars[:, HIGH], starts)
+    out[:, LOW] = np.minimum.reduceat(bars[:, LOW], starts)
+    out[:, CLOSE] = bars[ends, CLOSE]
+    out[:, VOLUME] = np.add.reduceat(bars[:, VOLUME], starts)
+    return out
+
+# --- CODIFICAÇÃO ---
+
+def _decimals(values):
+    # Casas decimais para SIGNIFICANT_DIGITS algarismos no maior valor (BTC: 2, SHIB: 10)
+    peak = float(np.abs(values).max()) if len(values) else 0.0
+    if peak == 0 or not math.isfinite(peak):
+        return 0
+    return min(max(SIGNIFICANT_DIGITS - 1 - math.floor(math.log10(peak)), 0), 12)
+
+def _encode(columns, fmt):
+    # {'t': [...], 'c': [...], ...} já no formato pedido (+ 'scale' por coluna no delta)
+    payload = {}
+    scale = {}
+    for name, values in columns.items():
+        digits = 0 if name == 't' else _decimals(values)
+        if fmt == 'delta':
+            ints = np.round(values * 10 ** digits).astype(np.int64)
+            payload[name] = np.concatenate((ints[:1], np.diff(ints))).tolist()
+            scale[name] = digits
+        elif name == 't':
+            payload[name] = values.astype(np.int64).tolist()
+        else:
+            payload[name] = np.round(values, digits).tolist()
+    if fmt == 'delta':
+        payload['scale'] = scale
+    return payload
+
+# --- FONTES ---
+
+def _intraday(symbols):
+    # {símbolo: barras de 1 minuto (n x 6)}; os símbolos sem dados frescos vão num só download
+    stale = [s for s in symbols if market_data.prices.intraday_stats(s) is None]
+    if stale:
+        try:
+            market_data.refresh(stale)
+        except Exception as e:
+            record_error("charts.intraday", e)
+    out = {}
+    for sym in symbols:
+        ring = market_data.prices.ring(sym)
+        if ring is not None and ring.count:
+            out[sym] = ring.bars()
+    return out
+
+def _daily(symbols, days):
+    # {símbolo: (timestamps, fechos)} a partir da tabela daily_price (um só pedido para todos)
+    start = datetime.utcnow().date() - timedelta(days=days)
+    frame = market_data.daily_closes(symbols, start)
+    out = {}
+    for sym in symbols:
+        if sym not in frame:
+            continue
+        closes = frame[sym].dropna()
+        if len(closes):
+            out[sym] = (np.array([ts.timestamp() for ts in closes.index]), closes.to_numpy(dtype=float))
+    return out
+
+def _closes(symbols, rng):
+    if RANGES[rng] is None:
+        return {sym: (bars[:, TS], bars[:, CLOSE]) for sym, bars in _intraday(symbols).items()}
+    return _daily(symbols, RANGES[rng])
+
+def _ttl(rng):
+    return INTRADAY_TTL if RANGES[rng] is None else DAILY_TTL
+
+# --- API ---
+
+def parse_width(value, default=DEFAULT_WIDTH):
+    try:
+        width = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise ValueError("Largura inválida.")
+    return min(max(width, MIN_WIDTH), MAX_WIDTH)
+
+def _check(rng, series='close', fmt='json'):
+    if rng not in RANGES:
+        raise ValueError(f"Intervalo inválido (use {', '.join(RANGES)}).")
+    if series not in SERIES:
+        raise ValueError(f"Série inválida (use {', '.join(SERIES)}).")
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato inválido (use {', '.join(FORMATS)}).")
+    if series == 'ohlcv' and RANGES[rng] is not None:
+        raise ValueError("Velas (ohlcv) só existem para o intervalo 1d; o histórico diário só guarda fechos.")
+
+def chart(raw_symbol, rng='1d', width=DEFAULT_WIDTH, series='close', fmt='json'):
+    # Série de um símbolo reduzida a `width` pontos. Só símbolos do coins.registry: cada um pode
+    # ficar com um buffer de barras em memória. Sem dados devolve arrays vazios (EMPTY_TTL em cache).
+    _check(rng, series, fmt)
+    symbol = coins.canonical(raw_symbol)
+    if not coins.registry.known(symbol):
+        raise ValueError(f"Símbolo desconhecido: {symbol}")
+    width = parse_width(width)
+    key = f"chart/{symbol}/{rng}/{width}/{series}/{fmt}"
+    payload = cache.get(key)
+    if payload is not None:
+        return payload
+    if series == 'ohlcv':
+        bars = _intraday([symbol]).get(symbol)
+        bars = ohlcv_buckets(bars, width) if bars is not None else np.zeros((0, 6))
+        columns = {'t': bars[:, TS], 'o': bars[:, OPEN], 'h': bars[:, HIGH], 'l': bars[:, LOW],
+                   'c': bars[:, CLOSE], 'v': bars[:, VOLUME]}
+    else:
+        t, c = _closes([symbol], rng).get(symbol, (np.zeros(0), np.zeros(0)))
+        keep = lttb(t, c, width)
+        columns = {'t': t[keep], 'c': c[keep]}
+    payload = {'symbol': symbol, 'range': rng, 'width': width, 'series': series, 'format': fmt,
+               'points': len(columns['t']), **_encode(columns, fmt)}
+    cache.set(key, payload, timeout=_ttl(rng) if payload['points'] else EMPTY_TTL)
+    return payload
+
+def sparklines(raw_symbols, rng='1d', width=SPARKLINE_WIDTH):
+    # {símbolo: [fechos]} para uma lista inteira (ex: a watchlist). Cada linha tem a sua entrada na
+    # cache; as que faltam são calculadas juntas (um download ou uma query para todas). Como no
+    # chart(), símbolos fora do coins.registry ficam de fora e as linhas vazias ficam EMPTY_TTL em cache.
+    _check(rng)
+    width = parse_width(width, SPARKLINE_WIDTH)
+    symbols = [sym for sym in dict.fromkeys(coins.canonical(s) for s in raw_symbols if s)
+               if coins.registry.known(sym)][:MAX_SPARKLINES]
+    keys = [f"chart/{sym}/{rng}/{width}/spark" for sym in symbols]
+    lines = dict(zip(symbols, cache.get_many(*keys))) if keys else {}
+    missing = [sym for sym, line in lines.items() if line is None]
+    if missing:
+        fresh = {}
+        for sym, (t, c) in _closes(missing, rng).items():
+            values = c[lttb(t, c, width)]
+            fresh[f"chart/{sym}/{rng}/{width}/spark"] = lines[sym] = np.round(values, _decimals(values)).tolist()
+        if fresh:
+            cache.set_many(fresh, timeout=_ttl(rng))
+        empty = {f"chart/{sym}/{rng}/{width}/spark": [] for sym in missing if lines[sym] is None}
+        if empty:
+            cache.set_many(empty, timeout=EMPTY_TTL)
+    return {sym: line or [] for sym, line in lines.items()}
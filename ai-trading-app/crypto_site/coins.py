@@ -0,0 +1,156 @@
+# coins.py
+# Registo de símbolos: forma canónica ("btc-usd", "Bitcoin (BTC)" -> "BTC"), metadados
+# pré-calculados (nome, ícone, ids do Yahoo/Binance/TradingView), cache negativa para símbolos
+# que o Yahoo não conhece e pesquisa por prefixo (trie) para a caixa de símbolo do simulador.
+#
+# Cada nó da trie guarda já as melhores sugestões para o seu prefixo (ordenadas pelo ranking),
+# por isso uma pesquisa é só descer len(prefixo) nós: microssegundos, sem BD nem rede.
+import re
+import threading
+import time
+from collections import namedtuple
+
+MAX_SUGGESTIONS = 8
+INVALID_TTL = 3600 # segundos que um símbolo inválido fica sem ir ao Yahoo
+TRANSIENT_TTL = 30 # ... e um desconhecido cuja consulta falhou (timeout, rate limit)
+LEARNED_RANK = 1000 # símbolos aprendidos (trades) ficam depois da lista base
+
+Coin = namedtuple('Coin', 'symbol name icon yahoo binance tradingview rank')
+
+# (símbolo, nome), por ordem aproximada de capitalização (= ranking das sugestões)
+KNOWN = [
+    ('BTC', 'Bitcoin'), ('ETH', 'Ethereum'), ('USDT', 'Tether'), ('BNB', 'BNB'), ('SOL', 'Solana'),
+    ('XRP', 'XRP'), ('USDC', 'USD Coin'), ('DOGE', 'Dogecoin'), ('ADA', 'Cardano'), ('TRX', 'TRON'),
+    ('AVAX', 'Avalanche'), ('SHIB', 'Shiba Inu'), ('TON', 'Toncoin'), ('LINK', 'Chainlink'),
+    ('DOT', 'Polkadot'), ('BCH', 'Bitcoin Cash'), ('SUI', 'Sui'), ('LTC', 'Litecoin'), ('NEAR', 'NEAR Protocol'),
+    ('MATIC', 'Polygon'), ('UNI', 'Uniswap'), ('PEPE', 'Pepe'), ('ICP', 'Internet Computer'),
+    ('APT', 'Aptos'), ('ETC', 'Ethereum Classic'), ('XLM', 'Stellar'), ('XMR', 'Monero'),
+    ('HBAR', 'Hedera'), ('ATOM', 'Cosmos'), ('FIL', 'Filecoin'), ('ARB', 'Arbitrum'), ('OP', 'Optimism'),
+    ('INJ', 'Injective'), ('VET', 'VeChain'), ('MKR', 'Maker'), ('AAVE', 'Aave'), ('ALGO', 'Algorand'),
+    ('SAND', 'The Sandbox'), ('MANA', 'Decentraland'), ('AXS', 'Axie Infinity'),
+]
+# O Yahoo usa ids com sufixo numérico quando o ticker colide com outro ativo
+YAHOO_IDS = {'UNI': 'UNI7083-USD', 'SUI': 'SUI20947-USD', 'PEPE': 'PEPE24478-USD', 'TON': 'TON11419-USD',
+             'APT': 'APT21794-USD', 'ARB': 'ARB11841-USD'}
+ICONS = {'BTC': 'fa-brands fa-bitcoin', 'ETH': 'fa-brands fa-ethereum'}
+STABLECOINS = {'USDT', 'USDC'}
+DEFAULT_ICON = 'fa-solid fa-coins'
+
+def canonical(raw):
+    # "Bitcoin (BTC)" -> BTC, " eth-usd " -> ETH, "sol/usd" -> SOL
+    name = str(raw or '').strip().upper()
+    match = re.search(r'\(([A-Z0-9]+)\)', name)
+    if match:
+        name = match.group(1)
+    for suffix in ('-USD', '/USD'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+def _make(symbol, name, rank):
+    binance = None if symbol in STABLECOINS else f"{symbol}USDT"
+    return Coin(symbol, name, ICONS.get(symbol, DEFAULT_ICON), YAHOO_IDS.get(symbol, f"{symbol}-USD"),
+                binance, f"BINANCE:{binance}" if binance else None, rank)
+
+class _Node:
+    __slots__ = ('children', 'best')
+
+    def __init__(self):
+        self.children = {}
+        self.best = () # melhores símbolos para este prefixo, por ranking
+
+class CoinRegistry:
+    def __init__(self, known=KNOWN):
+        self._coins = {}
+        self._root = _Node()
+        self._invalid = {} # símbolo -> expira_em
+        self._lock = threading.Lock()
+        for rank, (symbol, name) in enumerate(known):
+            self._add(_make(symbol, name, rank))
+
+    def _add(self, coin):
+        self._coins[coin.symbol] = coin
+        keys = {coin.symbol.lower(), coin.name.lower()} | set(coin.name.lower().split())
+        for key in keys:
+            node = self._root
+            for ch in key:
+                node = node.children.setdefault(ch, _Node())
+                if coin.symbol not in node.best:
+                    ranked = sorted(node.best + (coin.symbol,), key=lambda s: self._coins[s].rank)
+                    node.best = tuple(ranked[:MAX_SUGGESTIONS]) # tuplo novo: leituras sem lock
+
+    def get(self, raw):
+        # Metadados do símbolo (um símbolo desconhecido recebe os valores por defeito)
+        symbol = canonical(raw)
+        return self._coins.get(symbol) or _make(symbol, symbol, LEARNED_RANK)
+
+    def known(self, raw):
+        # Na lista base ou já confirmado pelo Yahoo (remember)
+        return canonical(raw) in self._coins
+
+    def yahoo(self, raw):
+        return self.get(raw).yahoo
+
+    def icon(self, raw):
+        return self.get(raw).icon
+
+    def by_name(self, word):
+        # "bitcoin" -> BTC (só o nome completo: "near" ou "link" numa frase não são símbolos)
+        word = word.strip().lower()
+        node = self._root
+        for ch in word:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return next((s for s in node.best if self._coins[s].name.lower() == word), None)
+
+    def remember(self, raw):
+        # Símbolo que o Yahoo confirmou (ex: num trade): passa a aparecer nas sugestões
+        symbol = canonical(raw)
+        self._invalid.pop(symbol, None)
+        if symbol and symbol not in self._coins:
+            with self._lock:
+                if symbol not in self._coins:
+                    self._add(_make(symbol, symbol, LEARNED_RANK + len(self._coins)))
+
+    # --- CACHE NEGATIVA ---
+
+    def mark_invalid(self, raw, transient=False):
+        # Símbolos da lista base ou já confirmados nunca entram (uma falha do Yahoo não pode
+        # bloquear o BTC); transient=True quando a consulta falhou em vez de vir sem dados
+        symbol = canonical(raw)
+        if not symbol or symbol in self._coins:
+            return
+        self._invalid[symbol] = time.monotonic() + (TRANSIENT_TTL if transient else INVALID_TTL)
+
+    def is_invalid(self, raw):
+        expires = self._invalid.get(canonical(raw))
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            self._invalid.pop(canonical(raw), None)
+            return False
+        return True
+
+    # --- PESQUISA ---
+
+    def search(self, prefix, limit=MAX_SUGGESTIONS):
+        # Sugestões para o prefixo (símbolo ou nome); o símbolo exato vem sempre primeiro
+        query = canonical(prefix).lower()
+        node = self._root
+        for ch in query:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        found = list(node.best)
+        exact = query.upper()
+        if exact in self._coins:
+            if exact in found:
+                found.remove(exact)
+            found.insert(0, exact)
+        return [self._coins[s] for s in found[:limit]]
+
+registry = CoinRegistry()
+
+def yahoo_symbol(raw):
+    return registry.yahoo(raw)
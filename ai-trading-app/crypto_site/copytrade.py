@@ -0,0 +1,201 @@
+# copytrade.py
+# Modo "seguir" do copy trading: cada trade manual de um líder é replicado nos seguidores.
+# Compra: o seguidor compra a quantidade do líder x ratio. Venda: o seguidor vende a mesma
+# fração da sua posição que o líder vendeu da dele.
+#
+# O pedido do líder só mete o evento numa fila (não toca nos seguidores). Um worker em
+# background processa a fila e escreve os fills em lote: por cada bloco de seguidores há um
+# nº fixo de statements (débito/venda set-based com RETURNING, upserts e créditos em
+# executemany, transações em bulk insert) e um único commit.
+#
+# A fila é só em memória: eventos ainda por processar quando o worker reinicia (deploy, crash,
+# reciclagem do gunicorn) perdem-se e esses trades não chegam aos seguidores. A cópia é
+# "melhor esforço", não garantida.
+import queue
+import threading
+import time
+from collections import namedtuple, deque
+from datetime import datetime
+from extensions import db
+from models import CopySubscription, User, Portfolio
+from metrics import record_error
+from usercache import users as user_cache
+import trading
+
+BATCH_SIZE = 1000 # seguidores por transação
+MAX_EVENTS_PER_WAKEUP = 50
+MIN_RATIO, MAX_RATIO = 0.01, 10.0
+LATENCY_SAMPLES = 10000 # últimas latências guardadas (o resto é descartado)
+
+TradeEvent = namedtuple('TradeEvent', 'leader_id symbol side amount price fraction queued_at')
+
+def _dialect():
+    return db.session.get_bind(mapper=Portfolio.__mapper__).dialect
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class FanoutWorker:
+    def __init__(self, app=None):
+        self.app = app
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Estatísticas (usadas pelo bench/copy_fanout.py)
+        self.events = 0
+        self.fills = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES) # segundos desde o submit até ao último commit do evento
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, leader_id, symbol, side, amount, price, fraction=None):
+        self.queue.put(TradeEvent(leader_id, symbol, side, amount, price, fraction, time.perf_counter()))
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        # Arranque preguiçoso: com o gunicorn (preload + fork) cada worker cria a sua thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name="copy-fanout", daemon=True)
+                    self._thread.start()
+
+    def wait(self, timeout=None):
+        # Espera até a fila estar vazia (todos os eventos processados). False se der timeout.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < MAX_EVENTS_PER_WAKEUP:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.app.app_context():
+                for event in batch:
+                    try:
+                        self.process(event)
+                    except Exception as e:
+                        db.session.rollback()
+                        record_error("copy_fanout", e)
+                    finally:
+                        self.queue.task_done()
+
+    def process(self, event):
+        # Replica um trade do líder em todos os seguidores ativos. Devolve o nº de fills.
+        subs = db.session.execute(
+            db.select(CopySubscription.follower_id, CopySubscription.ratio)
+            .where(CopySubscription.leader_id == event.leader_id, CopySubscription.is_active == True)
+            .order_by(CopySubscription.follower_id)
+        ).all()
+        filled = 0
+        for chunk in _chunks(subs, BATCH_SIZE):
+            if event.side == 'BUY':
+                filled += self._buy(event, chunk)
+            else:
+                filled += self._sell(event, chunk)
+            db.session.commit()
+        self.events += 1
+        self.fills += filled
+        self.latencies.append(time.perf_counter() - event.queued_at)
+        return filled
+
+    def _buy(self, event, chunk):
+        users = User.__table__
+        ratios = dict(chunk)
+        # Custo de cada seguidor como CASE id WHEN ... (um só UPDATE condicional para o bloco todo);
+        # o RETURNING diz quem tinha saldo
+        cost = db.case({uid: r * event.amount * event.price for uid, r in ratios.items()}, value=users.c.id)
+        affordable = users.c.id.in_(ratios) & (users.c.virtual_balance >= cost)
+        if _dialect().update_returning:
+            ids = db.session.execute(
+                users.update().where(affordable).values(virtual_balance=users.c.virtual_balance - cost)
+                .returning(users.c.id)).scalars().all()
+        else:
+            ids = db.session.execute(db.select(users.c.id).where(affordable).with_for_update()).scalars().all()
+            trading.credit_many([(uid, -ratios[uid] * event.amount * event.price) for uid in ids]) # linhas bloqueadas
+        if not ids:
+            return 0
+        user_cache.changed(*ids)
+        debited = [(uid, ratios[uid]) for uid in ids]
+        now = datetime.utcnow()
+        trading.upsert_positions([(uid, event.symbol, event.amount * r, event.price) for uid, r in debited])
+        trading.insert_transactions([trading.record(uid, event.symbol, 'BUY', event.price, event.amount * r, now)
+                                     for uid, r in debited])
+        return len(debited)
+
+    def _sell(self, event, chunk):
+        follower_ids = [uid for uid, _ in chunk]
+        positions = Portfolio.__table__
+        f = min(1.0, max(0.0, event.fraction or 0.0))
+        if f <= 0:
+            return 0
+        mine = positions.c.user_id.in_(follower_ids) & (positions.c.symbol == event.symbol)
+        if f >= trading.SELL_TOLERANCE:
+            # O líder fechou a posição: os seguidores também
+            if _dialect().delete_returning:
+                sold = db.session.execute(positions.delete().where(mine).returning(positions.c.user_id, positions.c.amount)).all()
+            else:
+                sold = db.session.execute(db.select(positions.c.user_id, positions.c.amount).where(mine).with_for_update()).all()
+                db.session.execute(positions.delete().where(mine))
+        else:
+            if _dialect().update_returning:
+                left = db.session.execute(positions.update().where(mine).values(amount=positions.c.amount * (1 - f))
+                                          .returning(positions.c.user_id, positions.c.amount)).all()
+                sold = [(uid, amount * f / (1 - f)) for uid, amount in left]
+            else:
+                held = db.session.execute(db.select(positions.c.user_id, positions.c.amount).where(mine).with_for_update()).all()
+                db.session.execute(positions.update().where(mine).values(amount=positions.c.amount * (1 - f)))
+                sold = [(uid, amount * f) for uid, amount in held]
+            db.session.execute(positions.delete().where(mine & (positions.c.amount <= trading.DUST)))
+        sold = [(uid, qty) for uid, qty in sold if qty > 0]
+        if not sold:
+            return 0
+        now = datetime.utcnow()
+        trading.credit_many([(uid, qty * event.price) for uid, qty in sold])
+        trading.insert_transactions([trading.record(uid, event.symbol, 'SELL', event.price, qty, now)
+                                     for uid, qty in sold])
+        return len(sold)
+
+fanout = FanoutWorker()
+
+# --- API USADA PELAS ROTAS ---
+
+def on_leader_trade(leader_id, symbol, side, amount, price):
+    # Chamado depois do commit do trade do líder. Na venda calcula já a fração vendida
+    # (a posição do líder pode mudar antes de o worker pegar no evento).
+    fraction = None
+    if side == 'SELL':
+        remaining = db.session.execute(
+            db.select(Portfolio.amount).where(Portfolio.user_id == leader_id, Portfolio.symbol == symbol)
+        ).scalar() or 0.0
+        fraction = min(1.0, amount / (amount + remaining)) if amount + remaining > 0 else 1.0
+    fanout.submit(leader_id, symbol, side, amount, price, fraction)
+
+def follow(follower_id, leader_id, ratio):
+    # Os trades do líder são copiados em melhor esforço (ver o cabeçalho): os que estiverem na fila
+    # quando o processo reinicia não chegam ao seguidor
+    if follower_id == leader_id:
+        raise ValueError("Não te podes seguir a ti próprio.")
+    if not MIN_RATIO <= ratio <= MAX_RATIO:
+        raise ValueError(f"O rácio tem de estar entre {MIN_RATIO} e {MAX_RATIO}.")
+    sub = CopySubscription.query.filter_by(follower_id=follower_id, leader_id=leader_id).first()
+    if sub:
+        sub.ratio, sub.is_active = ratio, True
+    else:
+        db.session.add(CopySubscription(follower_id=follower_id, leader_id=leader_id, ratio=ratio))
+    db.session.commit()
+
+def unfollow(follower_id, leader_id):
+    CopySubscription.query.filter_by(follower_id=follower_id, leader_id=leader_id).delete()
+    db.session.commit()
@@ -0,0 +1,77 @@
+# dbrouting.py
+# Encaminhamento leitura/escrita da BD e opções do pool de ligações.
+#
+# Com DATABASE_REPLICA_URL definido, as rotas marcadas com @read_only (e o código em background
+# dentro de `with replica():`) fazem os SELECTs na réplica; tudo o resto, e qualquer escrita,
+# vai para a BD principal. Proteção read-your-writes:
+#   - dentro do pedido: depois da primeira escrita (flush ou INSERT/UPDATE/DELETE) todas as
+#     leituras seguintes voltam à principal;
+#   - entre pedidos: um pedido que escreveu grava na sessão (cookie) o instante da escrita, e
+#     durante REPLICA_LAG_SECONDS as rotas @read_only desse cliente leem da principal (ex: o
+#     histórico logo a seguir a um trade mostra o trade, mesmo com a réplica atrasada).
+# Sem réplica configurada tudo vai para a principal, como antes. Rotas que podem gravar pelo
+# caminho (ex: o /api/risk sincroniza o histórico diário) não levam @read_only.
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, session, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+
+REPLICA = 'replica' # chave do bind em SQLALCHEMY_BINDS
+WRITE_MARK = 'db_written_at'
+
+def engine_options(url):
+    # SQLALCHEMY_ENGINE_OPTIONS a partir do ambiente: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    # DB_POOL_RECYCLE (segundos) e DB_POOL_PRE_PING (1/0). O SQLite em memória usa um pool por
+    # thread que não aceita tamanho/overflow, por isso aí só entram o pre-ping e o recycle.
+    options = {
+        'pool_pre_ping': os.getenv("DB_POOL_PRE_PING", "1") == "1",
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+    if url.startswith("sqlite") and (url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url):
+        return options
+    for env, key in (("DB_POOL_SIZE", 'pool_size'), ("DB_MAX_OVERFLOW", 'max_overflow'), ("DB_POOL_TIMEOUT", 'pool_timeout')):
+        if os.getenv(env):
+            options[key] = int(os.getenv(env))
+    return options
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                g.db_wrote = True
+            elif (g.get('db_read_only') and not g.get('db_wrote') and getattr(clause, 'is_select', False)
+                  and REPLICA in self._db.engines):
+                return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _recent_write(lag):
+    return has_request_context() and time.time() - session.get(WRITE_MARK, 0) < lag
+
+def read_only(view):
+    # A rota só lê: SELECTs na réplica, salvo se este cliente escreveu há menos de REPLICA_LAG_SECONDS
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import current_app
+        g.db_read_only = not _recent_write(current_app.config['REPLICA_LAG_SECONDS'])
+        return view(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def replica():
+    # Leituras na réplica fora das rotas (ex: análises em background); as escritas continuam na principal
+    previous = g.get('db_read_only')
+    g.db_read_only = True
+    try:
+        yield
+    finally:
+        g.db_read_only = previous
+
+def _mark_write(response):
+    if g.get('db_wrote'):
+        session[WRITE_MARK] = time.time()
+    return response
+
+def init_app(app):
+    app.after_request(_mark_write)
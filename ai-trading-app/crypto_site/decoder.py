@@ -0,0 +1,211 @@
+# decoder.py
+# Market Decoder (/decode_market): responde à pergunta do utilizador com as cotações atuais no
+# prompt e devolve a resposta do Gemini em streaming (SSE a partir do generate_content_stream),
+# para o utilizador só esperar pelo primeiro fragmento.
+#
+# As respostas ficam em cache por (pergunta normalizada, versão dos dados de mercado do prompt):
+# a versão é a última barra de 1 minuto de cada símbolo do contexto, por isso uma barra nova
+# invalida a resposta (CACHE_TTL é só o teto). Pedidos iguais em simultâneo partilham a mesma
+# geração: um só pedido ao Gemini, e cada cliente lê o buffer de fragmentos desde o início.
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from metrics import track_upstream, record_error
+import market_data
+import coins
+from utils import smart_format
+
+MODEL = "gemini-2.0-flash"
+CONTEXT_SYMBOLS = ('BTC', 'ETH') # entram sempre no contexto
+MAX_SYMBOLS = 6
+MAX_QUESTION = 300
+CACHE_TTL = 600 # segundos (teto; normalmente a cache cai antes, com a barra seguinte)
+CACHE_SIZE = 256
+FOLLOW_TIMEOUT = 60 # segundos sem fragmentos novos até desistir
+
+# Alcunhas -> símbolo; os nomes do coins.registry ("solana") e os tickers do universo
+# também são reconhecidos diretamente
+ALIASES = {'ether': 'ETH', 'ripple': 'XRP', 'binance': 'BNB'}
+
+_lock = threading.Lock()
+_answers = OrderedDict() # chave -> (expira_em, texto)
+_inflight = {} # chave -> _Flight
+
+def normalize(question):
+    # Forma canónica da pergunta: maiúsculas/minúsculas, espaços e pontuação final não contam
+    text = unicodedata.normalize('NFKC', question or '').casefold()
+    return re.sub(r'\s+', ' ', text).strip().rstrip('?!. ').strip()
+
+def mentioned_symbols(question, universe=()):
+    found = list(CONTEXT_SYMBOLS)
+    known = set(universe)
+    for word in re.findall(r'[a-z0-9]+', question):
+        sym = ALIASES.get(word) or coins.registry.by_name(word) or (word.upper() if word.upper() in known else None)
+        if sym and sym not in found:
+            found.append(sym)
+    return found[:MAX_SYMBOLS]
+
+def market_context(symbols):
+    # (linhas para o prompt, versão dos dados). Os buffers do market_data servem quase sempre;
+    # os símbolos sem dados frescos são atualizados num só download.
+    stale = [s for s in symbols if market_data.prices.intraday_stats(s) is None]
+    if stale:
+        try:
+            market_data.refresh(stale)
+        except Exception as e:
+            record_error("decoder.market_context", e)
+    lines, version = [], []
+    for sym in symbols:
+        stats = market_data.prices.intraday_stats(sym)
+        if stats is None:
+            continue
+        change = (stats['last'] / stats['open'] - 1) * 100 if stats['open'] else 0.0
+        lines.append(f"{sym}: {smart_format(stats['last'])} ({change:+.2f}% nas últimas 24h, "
+                     f"máx {smart_format(stats['high'])}, mín {smart_format(stats['low'])})")
+        version.append((sym, market_data.prices.ring(sym).last_ts))
+    return lines, tuple(version)
+
+def build_prompt(question, lines):
+    context = "\n".join(lines) if lines else "(sem cotações disponíveis)"
+    return f"""
+    Atua como um Analista de Mercado de Criptomoedas que explica as coisas a principiantes.
+    Cotações atuais (barras de 1 minuto):
+    {context}
+
+    Pergunta do utilizador: "{question}"
+
+    Responde em HTML simples (sem markdown, usa <b>, <br>, <ul>), em português, com no máximo
+    3 parágrafos curtos: o que aconteceu, porque é que provavelmente aconteceu e o que observar a seguir.
+    Não dês conselhos financeiros.
+    """
+
+# --- CACHE ---
+
+def _cached(key):
+    with _lock:
+        entry = _answers.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _answers[key]
+            return None
+        _answers.move_to_end(key)
+        return entry[1]
+
+def _store(key, text):
+    with _lock:
+        _answers[key] = (time.monotonic() + CACHE_TTL, text)
+        _answers.move_to_end(key)
+        while len(_answers) > CACHE_SIZE:
+            _answers.popitem(last=False)
+
+def clear():
+    with _lock:
+        _answers.clear()
+
+# --- GERAÇÃO PARTILHADA ---
+
+class _Flight:
+    # Uma geração em curso: fragmentos acumulados + condição para quem está à espera
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+    def push(self, text):
+        with self.cond:
+            self.chunks.append(text)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def follow(self):
+        # Todos os fragmentos desde o início, depois os novos à medida que chegam
+        i = 0
+        while True:
+            with self.cond:
+                if i >= len(self.chunks) and not self.done:
+                    self.cond.wait(FOLLOW_TIMEOUT)
+                    if i >= len(self.chunks) and not self.done:
+                        raise TimeoutError("Sem resposta da AI.")
+                new, done, error = self.chunks[i:], self.done, self.error
+            i += len(new)
+            yield from new
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+def _produce(key, flight, client, prompt, refund=None):
+    # Corre numa thread própria: um cliente que fecha a ligação não corta a resposta aos outros
+    error = None
+    try:
+        with track_upstream('gemini'):
+            for part in client.models.generate_content_stream(model=MODEL, contents=prompt):
+                if part.text:
+                    flight.push(part.text)
+        _store(key, "".join(flight.chunks))
+    except Exception as e:
+        record_error("decode_market", e)
+        error = e
+        if refund is not None:
+            refund()
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        flight.finish(error)
+
+def _sse(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def stream(question, client, universe=(), charge=None):
+    # Prepara tudo antes de responder (erros de validação ainda saem como JSON) e devolve o
+    # gerador de eventos SSE: {"text": ...} por fragmento e {"done": true, "cached": ...} no fim.
+    # charge() corre antes de cada geração nova (não nas respostas em cache ou partilhadas) e
+    # pode recusá-la com PermissionError (quota do plano); o que devolver (se não for None) é
+    # chamado se essa geração falhar, para anular a cobrança.
+    question = normalize(question)
+    if not question:
+        raise ValueError("Escreve a tua dúvida!")
+    if len(question) > MAX_QUESTION:
+        raise ValueError(f"Pergunta demasiado longa (máx. {MAX_QUESTION} caracteres).")
+    lines, version = market_context(mentioned_symbols(question, universe))
+    key = (question, version)
+
+    text = _cached(key)
+    if text is not None:
+        def replay():
+            yield _sse({'text': text})
+            yield _sse({'done': True, 'cached': True})
+        return replay()
+
+    refund = None
+    with _lock:
+        flight = _inflight.get(key)
+        shared = flight is not None
+        if not shared:
+            if client is None:
+                raise ConnectionError("Serviço de AI indisponível.")
+            if charge is not None:
+                refund = charge()
+            flight = _inflight[key] = _Flight()
+    if not shared:
+        threading.Thread(target=_produce, args=(key, flight, client, build_prompt(question, lines), refund),
+                         name="decoder", daemon=True).start()
+
+    def events():
+        try:
+            for chunk in flight.follow():
+                yield _sse({'text': chunk})
+            yield _sse({'done': True, 'cached': False, 'shared': shared})
+        except Exception:
+            yield _sse({'error': 'Erro na AI. Tenta novamente.'})
+    return events()
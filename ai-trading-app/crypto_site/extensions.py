@@ -3,9 +3,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_caching import Cache
+from dbrouting import RoutingSession
 
 # Inicializamos as instâncias vazias
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession}) # leituras das rotas @read_only na réplica
 login_manager = LoginManager()
 mail = Mail()
 cache = Cache(config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 60})
\ No newline at end of file
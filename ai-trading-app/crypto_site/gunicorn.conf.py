@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+# Uso: gunicorn app:app  (o gunicorn lê este ficheiro automaticamente)
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:" + os.getenv("PORT", "8000"))
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+# O master importa a app uma vez e os workers herdam a memória via fork
+preload_app = True
+
+def when_ready(server):
+    # Fase de preload: yfinance/pandas, PIL, feedparser e genai ficam importados no master.
+    # Desligar com PRELOAD_HEAVY_MODULES=0 (ex: máquinas com pouca RAM).
+    if os.getenv("PRELOAD_HEAVY_MODULES", "1") == "1":
+        import lazy_imports
+        lazy_imports.preload()
+        server.log.info("Módulos pesados pré-carregados antes do fork")
+
+def post_fork(server, worker):
+    # Ligações à BD abertas no master não podem ser partilhadas entre processos
+    from app import app, db, start_background_jobs
+    with app.app_context():
+        db.engine.dispose()
+    # Threads não sobrevivem ao fork: cada worker candidata-se às tarefas, só o líder as corre (jobs.py)
+    start_background_jobs()
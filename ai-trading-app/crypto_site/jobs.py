@@ -0,0 +1,240 @@
+# jobs.py
+# Coordenação das tarefas em background entre workers e nós: cada tarefa tem um só "líder" em
+# todo o deploy e os outros processos só leem o que ele publica, por isso o tráfego para o Yahoo,
+# os feeds RSS e o SMTP não cresce com o nº de workers.
+#
+# Eleição com um lock por tarefa, não bloqueante:
+#   - PostgreSQL: pg_try_advisory_lock numa ligação dedicada. O lock vive com a sessão: se o
+#     processo morre ou perde a ligação, o Postgres solta-o e outro nó assume;
+#   - MySQL/MariaDB: GET_LOCK(nome, 0), também preso à sessão de uma ligação dedicada;
+#   - outras BDs (SQLite em desenvolvimento): flock num ficheiro em JOB_LOCK_DIR, solto pelo
+#     kernel quando o processo morre (serve um só nó, que é o caso do SQLite). Tarefas que só
+#     mexem em ficheiros locais (every(..., local=True), ex: o snapshot) usam sempre o flock:
+#     um líder por nó.
+# O lease é renovado a cada ciclo (a ligação/o ficheiro ainda são nossos?); se a renovação
+# falha o líder demite-se antes de correr outra vez. Os seguidores tentam ficar com o lock a
+# cada JOB_LEASE_SECONDS (no máximo), por isso o failover demora no máximo um lease.
+#
+# Os resultados vão para a tabela job_result (JSON) e cada worker guarda a última leitura na
+# sua cache durante RESULT_TTL segundos.
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from extensions import db, cache
+from metrics import record_error
+from models import JobResult
+
+try:
+    import fcntl
+except ImportError: # Windows: sem flock, cada processo corre as tarefas (como antes)
+    fcntl = None
+
+RESULT_TTL = 5 # segundos que um worker reutiliza a última leitura de um resultado
+
+def _advisory_key(name):
+    # Chave bigint estável por tarefa (o mesmo nome dá o mesmo lock em todos os nós)
+    return int.from_bytes(hashlib.sha1(f"job:{name}".encode()).digest()[:8], 'big', signed=True)
+
+class _AdvisoryLock:
+    # Lock de sessão do Postgres numa ligação dedicada
+    ACQUIRE = "SELECT pg_try_advisory_lock(:key)"
+    RELEASE = "SELECT pg_advisory_unlock(:key)"
+
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.key = _advisory_key(name)
+        self.conn = None
+
+    def acquire(self):
+        conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            if conn.execute(text(self.ACQUIRE), {'key': self.key}).scalar() == 1:
+                self.conn = conn
+                return True
+        except Exception:
+            conn.close()
+            raise
+        conn.close()
+        return False
+
+    def renew(self):
+        # A sessão continua viva? (se caiu, o lock já é de outro)
+        try:
+            self.conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            self.release()
+            return False
+
+    def release(self):
+        if self.conn is not None:
+            try:
+                self.conn.execute(text(self.RELEASE), {'key': self.key})
+                self.conn.close()
+            except Exception:
+                pass # ligação já perdida: a BD soltou o lock
+            self.conn = None
+
+class _NamedLock(_AdvisoryLock):
+    # MySQL/MariaDB: GET_LOCK com timeout 0 (não bloqueia); o nome tem no máximo 64 caracteres
+    ACQUIRE = "SELECT GET_LOCK(:key, 0)"
+    RELEASE = "SELECT RELEASE_LOCK(:key)"
+
+    def __init__(self, engine, name):
+        super().__init__(engine, name)
+        self.key = f"job:{name}"[:64]
+
+class _FileLock:
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, f"{name}.lock")
+        self.fd = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{socket.gethostname()}:{os.getpid()}\n".encode()) # quem é o líder (diagnóstico)
+        self.fd = fd
+        return True
+
+    def renew(self):
+        return self.fd is not None
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+class _NoLock:
+    def acquire(self):
+        return True
+
+    def renew(self):
+        return True
+
+    def release(self):
+        pass
+
+class Job:
+    def __init__(self, name, interval, run, follow=None, local=False):
+        self.name = name
+        self.interval = interval
+        self.run = run # só no líder
+        self.follow = follow # nos restantes processos (ex: aplicar o resultado publicado)
+        self.local = local # um líder por nó em vez de um por deploy
+        self.leader = False
+        self.last_run = None
+
+class JobCoordinator:
+    def __init__(self):
+        self.app = None
+        self.jobs = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease = 30
+        self.lock_dir = None
+        self._threads = []
+
+    def init_app(self, app):
+        self.app = app
+        self.lease = app.config['JOB_LEASE_SECONDS']
+        self.lock_dir = app.config['JOB_LOCK_DIR']
+
+    def _lock(self, name, local=False):
+        if db.engine.dialect.name == 'postgresql' and not local:
+            return _AdvisoryLock(db.engine, name)
+        if db.engine.dialect.name in ('mysql', 'mariadb') and not local:
+            return _NamedLock(db.engine, name)
+        if fcntl is not None:
+            return _FileLock(self.lock_dir, name)
+        return _NoLock()
+
+    # --- EXECUÇÃO ---
+
+    def every(self, name, interval, run, follow=None, local=False):
+        # Regista uma tarefa periódica (arranca com start())
+        self.jobs[name] = Job(name, interval, run, follow, local)
+        return self.jobs[name]
+
+    def start(self):
+        # Uma thread por tarefa, depois do fork (gunicorn post_fork): cada processo candidata-se
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        for job in self.jobs.values():
+            thread = threading.Thread(target=self._loop, args=(job,), name=f"job-{job.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def step(self, job, lock):
+        # Um ciclo: eleição/renovação e depois run() (líder) ou follow() (seguidor). Devolve o lock.
+        if job.leader and not lock.renew():
+            job.leader = False
+            self.app.logger.warning("job %s: lease perdido por %s", job.name, self.owner)
+        if not job.leader:
+            lock = self._lock(job.name, job.local)
+            job.leader = lock.acquire()
+            if job.leader:
+                self.app.logger.info("job %s: líder %s", job.name, self.owner)
+        due = job.last_run is None or time.monotonic() - job.last_run >= job.interval
+        if due:
+            job.last_run = time.monotonic()
+            if job.leader:
+                job.run()
+            elif job.follow is not None:
+                job.follow()
+        return lock
+
+    def _loop(self, job):
+        lock = _NoLock()
+        tick = min(job.interval, self.lease) # renovação/candidatura pelo menos a cada lease
+        while True:
+            with self.app.app_context():
+                try:
+                    lock = self.step(job, lock)
+                except Exception as e:
+                    db.session.rollback()
+                    record_error(f"job[{job.name}]", e)
+            time.sleep(tick)
+
+    # --- RESULTADOS PARTILHADOS ---
+
+    def publish(self, name, payload):
+        # Grava o resultado da tarefa para os outros workers (upsert portável)
+        values = {'payload': json.dumps(payload, separators=(",", ":")), 'owner': self.owner,
+                  'updated_at': datetime.utcnow()}
+        updated = db.session.execute(db.update(JobResult).where(JobResult.name == name).values(**values)).rowcount
+        if not updated:
+            try:
+                db.session.execute(db.insert(JobResult).values(name=name, **values))
+            except IntegrityError: # outro processo inseriu primeiro
+                db.session.rollback()
+                db.session.execute(db.update(JobResult).where(JobResult.name == name).values(**values))
+        db.session.commit()
+        cache.set(f"job/{name}", (values['updated_at'], payload), timeout=RESULT_TTL)
+
+    def result(self, name, max_age=None):
+        # Último resultado publicado (None se não houver ou for mais velho que max_age segundos)
+        entry = cache.get(f"job/{name}")
+        if entry is None:
+            row = db.session.execute(db.select(JobResult.updated_at, JobResult.payload)
+                                     .where(JobResult.name == name)).first()
+            if row is None:
+                return None
+            entry = (row.updated_at, json.loads(row.payload))
+            cache.set(f"job/{name}", entry, timeout=RESULT_TTL)
+        updated_at, payload = entry
+        if max_age is not None and datetime.utcnow() - updated_at > timedelta(seconds=max_age):
+            return None
+        return payload
+
+coordinator = JobCoordinator()
@@ -0,0 +1,51 @@
+# lazy_imports.py
+import importlib
+import threading
+
+# Módulos pesados (yfinance/pandas, PIL, genai...) só são importados no primeiro uso.
+# Assim o reset_tables.py e as rotas que não precisam deles arrancam rápido.
+# Com o gunicorn (preload_app) o master chama preload() antes do fork e os workers
+# herdam tudo já importado.
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "carregado" if self.is_loaded else "por carregar"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+yf = LazyModule("yfinance")
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+requests = LazyModule("requests")
+feedparser = LazyModule("feedparser")
+Image = LazyModule("PIL.Image")
+genai = LazyModule("google.genai")
+pa = LazyModule("pyarrow")
+pq = LazyModule("pyarrow.parquet")
+ds = LazyModule("pyarrow.dataset")
+
+HEAVY_MODULES = [yf, np, pd, requests, feedparser, Image, genai, pa, pq, ds]
+
+def preload():
+    # Importa tudo de uma vez (usado no master do gunicorn antes do fork)
+    for module in HEAVY_MODULES:
+        module.load()
@@ -0,0 +1,159 @@
+# ledger.py
+# Replay das transações de um utilizador: P&L realizado e não realizado (FIFO, LIFO e custo
+# médio), custo de cada posição e série diária do património (saldo + posições ao fecho).
+#
+# O Portfolio.avg_price só guarda a média corrente; aqui reconstrói-se tudo a partir da tabela
+# de transações e do histórico diário local (market_data.daily_closes). A série é calculada
+# vetorialmente com pandas (matriz dias x moedas); o casamento de lotes é um ciclo simples.
+#
+# Checkpoints incrementais (tabela ledger_checkpoint): o estado de tudo o que aconteceu antes
+# de um dia fechado fica gravado, e cada pedido só repete a cauda (as transações de hoje).
+import json
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from lazy_imports import pd
+from extensions import db
+from models import User, LedgerCheckpoint
+import market_data
+import trading
+import archive
+
+METHODS = ('fifo', 'lifo', 'average')
+SETTLE = timedelta(minutes=5) # transações de ontem podem ainda estar a ser gravadas logo após a meia-noite
+PRICE_LOOKBACK = timedelta(days=7) # fechos anteriores ao início da série, para o forward-fill
+
+def _empty_state(cash):
+    return {'cash': cash, 'lots': {'fifo': {}, 'lifo': {}}, 'avg': {}, 'last_px': {},
+            'realized': {m: 0.0 for m in METHODS}, 'series': []}
+
+def _consume(lots, qty, price, from_end):
+    # Retira `qty` dos lotes [[quantidade, preço], ...] e devolve o custo retirado.
+    # Vendas acima do que há nos lotes (tolerância de arredondamento) saem ao próprio preço.
+    cost = 0.0
+    while qty > trading.DUST and lots:
+        lot = lots[-1] if from_end else lots[0]
+        take = min(qty, lot[0])
+        cost += take * lot[1]
+        lot[0] -= take
+        qty -= take
+        if lot[0] <= trading.DUST:
+            lots.pop(-1 if from_end else 0)
+    return cost + max(qty, 0.0) * price
+
+def _apply(state, txs):
+    # Casa as transações (ordem cronológica) com os lotes e acumula o P&L realizado
+    lots, avg, realized = state['lots'], state['avg'], state['realized']
+    for sym, side, price, amount in zip(txs['symbol'], txs['type'], txs['price'], txs['amount']):
+        q, c = avg.get(sym, (0.0, 0.0))
+        if side == 'BUY':
+            for method in ('fifo', 'lifo'):
+                lots[method].setdefault(sym, []).append([amount, price])
+            avg[sym] = (q + amount, c + amount * price)
+        else:
+            proceeds = amount * price
+            realized['fifo'] += proceeds - _consume(lots['fifo'].get(sym, []), amount, price, from_end=False)
+            realized['lifo'] += proceeds - _consume(lots['lifo'].get(sym, []), amount, price, from_end=True)
+            out = c * min(1.0, amount / q) if q > 0 else proceeds
+            realized['average'] += proceeds - out
+            avg[sym] = (max(q - amount, 0.0), c - out if q > amount else 0.0)
+        state['cash'] += -amount * price if side == 'BUY' else amount * price
+        state['last_px'][sym] = price
+    for book in (lots['fifo'], lots['lifo']):
+        for sym in [s for s, l in book.items() if not l]:
+            del book[sym]
+    for sym in [s for s, (q, _) in avg.items() if q <= trading.DUST]:
+        del avg[sym]
+
+def _equity(holdings, cash, txs, days, closes, last_px):
+    # Património ao fecho de cada dia, vetorizado: quantidades (dias x moedas) a partir do
+    # cumsum dos movimentos + saldo inicial, vezes os fechos (com forward-fill)
+    if len(days) == 0:
+        return pd.Series(dtype=float)
+    day = txs['timestamp'].dt.normalize()
+    signed = txs['amount'].where(txs['type'] == 'BUY', -txs['amount'])
+    flows = (-txs['total_value']).where(txs['type'] == 'BUY', txs['total_value'])
+    symbols = sorted(set(holdings) | set(txs['symbol']))
+    qty = (pd.DataFrame({'day': day, 'symbol': txs['symbol'], 'qty': signed})
+           .pivot_table(index='day', columns='symbol', values='qty', aggfunc='sum')
+           .reindex(index=days, columns=symbols, fill_value=0.0).fillna(0.0).cumsum()
+           + pd.Series(holdings, index=symbols, dtype=float).fillna(0.0))
+    balance = cash + flows.groupby(day).sum().reindex(days, fill_value=0.0).cumsum()
+    # Fechos do histórico; sem histórico usa o preço da última transação
+    trade_px = (pd.DataFrame({'day': day, 'symbol': txs['symbol'], 'price': txs['price']})
+                .groupby(['day', 'symbol'])['price'].last().unstack())
+    px = closes.reindex(columns=symbols)
+    px = px.reindex(px.index.union(days)).ffill().reindex(days)
+    px = px.fillna(trade_px.reindex(index=days, columns=symbols)).ffill()
+    px = px.fillna(pd.Series(last_px, index=symbols, dtype=float))
+    return balance + (qty * px.fillna(0.0)).sum(axis=1)
+
+def _load_transactions(user_id, since=None):
+    # Tabela + arquivo Parquet (archive.py): um replay completo também vê as transações arquivadas
+    frame = archive.store.transactions(user_id, start=since)
+    return frame[['timestamp', 'symbol', 'type', 'price', 'amount', 'total_value']]
+
+def _advance(state, txs, start, end, closes):
+    # Estende a série de `start` a `end` (inclusive) e aplica as transações ao estado
+    days = pd.date_range(start, end, freq='D') if start <= end else pd.DatetimeIndex([])
+    holdings = {sym: q for sym, (q, _) in state['avg'].items()}
+    equity = _equity(holdings, state['cash'], txs, days, closes, state['last_px'])
+    state['series'].extend([ts.date().isoformat(), round(float(v), 2)] for ts, v in equity.items())
+    _apply(state, txs)
+
+def _save_checkpoint(user_id, day, state):
+    try:
+        db.session.merge(LedgerCheckpoint(user_id=user_id, day=day, state=json.dumps(state)))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback() # outro pedido gravou o mesmo checkpoint
+
+def replay(user_id):
+    # Estado completo do ledger até agora. Grava um checkpoint novo sempre que há um dia fechado
+    # (antes de hoje - SETTLE) que ainda não estava no checkpoint.
+    now = datetime.utcnow()
+    today = now.date()
+    settled_day = (now - SETTLE).date() # tudo antes deste dia pode ir para o checkpoint
+
+    checkpoint = db.session.get(LedgerCheckpoint, user_id)
+    if checkpoint:
+        state, start = json.loads(checkpoint.state), checkpoint.day
+        txs = _load_transactions(user_id, since=datetime.combine(start, datetime.min.time()))
+    else:
+        txs = _load_transactions(user_id)
+        flows = (-txs['total_value']).where(txs['type'] == 'BUY', txs['total_value']).sum()
+        balance = db.session.execute(db.select(User.virtual_balance).where(User.id == user_id)).scalar() or 0.0
+        state = _empty_state(balance - float(flows)) # saldo inicial = atual - fluxos de todas as transações
+        start = txs['timestamp'].iloc[0].date() if len(txs) else today
+
+    symbols = set(state['avg']) | set(txs['symbol'])
+    closes = market_data.daily_closes(symbols, start - PRICE_LOOKBACK)
+
+    settled = txs[txs['timestamp'] < pd.Timestamp(settled_day)]
+    if start < settled_day:
+        _advance(state, settled, start, settled_day - timedelta(days=1), closes)
+        _save_checkpoint(user_id, settled_day, state)
+        start = settled_day
+    # A cauda (transações ainda não fechadas) é repetida em cada pedido e não é gravada
+    _advance(state, txs[txs['timestamp'] >= pd.Timestamp(start)], start, today, closes)
+    return state, closes
+
+def performance(user_id):
+    # Resumo para as páginas: série de património, P&L por método e custo de cada posição
+    state, closes = replay(user_id)
+    latest = closes.ffill().iloc[-1] if len(closes) else pd.Series(dtype=float)
+    positions, unrealized = [], {m: 0.0 for m in METHODS}
+    for sym, (qty, cost) in sorted(state['avg'].items()):
+        price = latest.get(sym)
+        price = float(price) if price is not None and price == price else state['last_px'].get(sym, 0.0)
+        basis = {'average': cost,
+                 'fifo': sum(q * p for q, p in state['lots']['fifo'].get(sym, [])),
+                 'lifo': sum(q * p for q, p in state['lots']['lifo'].get(sym, []))}
+        for method in METHODS:
+            unrealized[method] += qty * price - basis[method]
+        positions.append({'symbol': sym, 'amount': qty, 'price': price, 'value': qty * price,
+                          'cost_basis': {m: round(v, 2) for m, v in basis.items()}})
+    return {'equity': state['series'],
+            'realized': {m: round(v, 2) for m, v in state['realized'].items()},
+            'unrealized': {m: round(v, 2) for m, v in unrealized.items()},
+            'cash': round(state['cash'], 2),
+            'positions': positions}
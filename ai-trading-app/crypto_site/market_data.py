@@ -0,0 +1,377 @@
+# market_data.py
+# Camada de preços partilhada: última cotação por símbolo + buffer circular (NumPy) de barras
+# de 1 minuto (OHLCV). As rotas, os alertas e o simulador de replay (bench/replay.py) leem daqui
+# em vez de ir ao Yahoo.
+# Também guarda o histórico de fechos diários na BD (tabela daily_price), usado pelo ledger.
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from lazy_imports import yf, np, pd
+from metrics import track_upstream, record_error
+from extensions import db
+from models import DailyPrice
+from coins import yahoo_symbol
+
+RING_SIZE = 1440 # 24h de barras de 1 minuto por símbolo
+PUBLISH_BARS = 3 # barras publicadas por ciclo do refresher (a atual e as anteriores, para cobrir atrasos)
+TS, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+
+class BarRing:
+    # Buffer circular de tamanho fixo com barras de 1 minuto: colunas ts, open, high, low, close, volume.
+    # Cada consumidor (ex: 'alerts', 'orders') tem a sua marca de máximo/mínimo desde a última leitura,
+    # para não perder wicks que cruzam um alvo e revertem entre avaliações.
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.data = np.zeros((size, 6))
+        self.count = 0 # total de barras já escritas (não limitado ao tamanho)
+        self._marks = {} # consumidor -> [low, high]
+        self._lock = threading.Lock()
+
+    def _last(self):
+        return self.data[(self.count - 1) % self.size]
+
+    @property
+    def last_ts(self):
+        return float(self._last()[TS]) if self.count else None
+
+    @property
+    def last_close(self):
+        return float(self._last()[CLOSE]) if self.count else None
+
+    @property
+    def last_volume(self):
+        return float(self._last()[VOLUME]) if self.count else None
+
+    def _touch_marks(self, low, high):
+        for mark in self._marks.values():
+            if low < mark[0]: mark[0] = low
+            if high > mark[1]: mark[1] = high
+
+    def add_bar(self, ts, o, h, l, c, v):
+        # Barra vinda do refresher: a barra do minuto atual é substituída (o volume vem acumulado)
+        minute = ts - ts % 60
+        with self._lock:
+            if self.count and minute < self._last()[TS]:
+                return False # já vista
+            if self.count and minute == self._last()[TS]:
+                row = self._last()
+                row[HIGH] = max(row[HIGH], h)
+                row[LOW] = min(row[LOW], l)
+                row[CLOSE] = c
+                row[VOLUME] = v
+            else:
+                self.data[self.count % self.size] = (minute, o, h, l, c, v)
+                self.count += 1
+            self._touch_marks(l, h)
+            return True
+
+    def add_tick(self, ts, price, volume=0.0):
+        # Tick avulso: agrega na barra do minuto corrente
+        minute = ts - ts % 60
+        with self._lock:
+            if self.count and minute <= self._last()[TS]:
+                row = self._last()
+                if price > row[HIGH]: row[HIGH] = price
+                if price < row[LOW]: row[LOW] = price
+                row[CLOSE] = price
+                row[VOLUME] += volume
+            else:
+                self.data[self.count % self.size] = (minute, price, price, price, price, volume)
+                self.count += 1
+            self._touch_marks(price, price)
+
+    def take_range(self, consumer):
+        # (low, high) desde a última chamada deste consumidor; a 1ª vez devolve a barra atual
+        with self._lock:
+            if not self.count:
+                return None
+            last = self._last()
+            mark = self._marks.get(consumer)
+            result = (float(last[LOW]), float(last[HIGH])) if mark is None else (mark[0], mark[1])
+            self._marks[consumer] = [float(last[CLOSE]), float(last[CLOSE])]
+            return result
+
+    def range_since(self, ts):
+        # (low, high) das barras dos minutos seguintes ao de ts, mais o último fecho. A barra do
+        # próprio minuto fica de fora: o máximo/mínimo dela pode ser de antes de ts.
+        with self._lock:
+            if not self.count:
+                return None
+            close = float(self._last()[CLOSE])
+        bars = self.bars()
+        after = bars[bars[:, TS] > ts - ts % 60]
+        if not len(after):
+            return (close, close)
+        return (min(float(after[:, LOW].min()), close), max(float(after[:, HIGH].max()), close))
+
+    def return_range(self, consumer, low, high):
+        # Devolve um intervalo lido com take_range e não processado (ex: o email do alerta falhou):
+        # a próxima leitura volta a incluí-lo
+        with self._lock:
+            mark = self._marks.get(consumer)
+            if mark is None:
+                self._marks[consumer] = [low, high]
+            else:
+                mark[0], mark[1] = min(mark[0], low), max(mark[1], high)
+
+    def load(self, rows):
+        # Substitui o conteúdo por barras já ordenadas (n x 6, ex: vindas do snapshot) de uma vez
+        rows = rows[-self.size:]
+        with self._lock:
+            self.data[:len(rows)] = rows
+            self.count = len(rows)
+            self._marks.clear()
+
+    def bars(self, n=None):
+        # Cópia cronológica das últimas n barras (n x 6)
+        with self._lock:
+            available = min(self.count, self.size)
+            n = available if n is None else min(n, available)
+            if n == 0:
+                return np.zeros((0, 6))
+            end = self.count % self.size
+            idx = (np.arange(end - n, end)) % self.size
+            return self.data[idx].copy()
+
+class PriceStore:
+    def __init__(self, ring_size=RING_SIZE):
+        self.ring_size = ring_size
+        self._quotes = {} # 'BTC' -> (preço, timestamp)
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def ring(self, symbol, create=False):
+        ring = self._rings.get(symbol)
+        if ring is None and create:
+            with self._lock:
+                ring = self._rings.setdefault(symbol, BarRing(self.ring_size))
+        return ring
+
+    def _notify(self, symbol, price, ts):
+        for listener in self._listeners:
+            listener(symbol, price, ts)
+
+    def update(self, symbol, price, ts=None, volume=0.0):
+        ts = ts if ts is not None else time.time()
+        price = float(price)
+        self._quotes[symbol] = (price, ts)
+        self.ring(symbol, create=True).add_tick(ts, price, volume)
+        self._notify(symbol, price, ts)
+
+    def add_bars(self, symbol, ts, o, h, l, c, v):
+        # Arrays alinhados (mais antigo primeiro); barras já vistas são ignoradas
+        ring = self.ring(symbol, create=True)
+        added = 0
+        for row in zip(ts, o, h, l, c, v):
+            added += ring.add_bar(*map(float, row))
+        if ring.count:
+            self._quotes[symbol] = (ring.last_close, time.time())
+            self._notify(symbol, ring.last_close, ring.last_ts)
+        return added
+
+    def get(self, symbol, max_age=None):
+        quote = self._quotes.get(symbol)
+        if quote is None:
+            return None
+        if max_age is not None and time.time() - quote[1] > max_age:
+            return None
+        return quote[0]
+
+    def take_range(self, symbol, consumer):
+        ring = self._rings.get(symbol)
+        return ring.take_range(consumer) if ring else None
+
+    def range_since(self, symbol, ts):
+        ring = self._rings.get(symbol)
+        return ring.range_since(ts) if ring else None
+
+    def return_range(self, symbol, consumer, window):
+        ring = self._rings.get(symbol)
+        if ring:
+            ring.return_range(consumer, *window)
+
+    def intraday_stats(self, symbol, max_age=300):
+        # Estatísticas das últimas 24h a partir do buffer (sem rede). None se não houver dados frescos.
+        ring = self._rings.get(symbol)
+        if not ring or not ring.count or time.time() - ring.last_ts > max_age:
+            return None
+        bars = ring.bars()
+        return {
+            'last': float(bars[-1, CLOSE]),
+            'open': float(bars[0, OPEN]),
+            'high': float(bars[:, HIGH].max()),
+            'low': float(bars[:, LOW].min()),
+            'volume': float(bars[:, VOLUME].sum()),
+            'bars': len(bars),
+            'since': float(bars[0, TS]),
+        }
+
+    def export(self):
+        # {símbolo: (barras n x 6, (preço, timestamp))} dos símbolos com barras, para o snapshot
+        return {sym: (ring.bars(), self._quotes[sym]) for sym, ring in list(self._rings.items())
+                if ring.count and sym in self._quotes}
+
+    def restore(self, symbol, rows, quote):
+        # Repõe um símbolo (snapshot): barras e última cotação com o timestamp original, por isso
+        # quem pede preços frescos (get com max_age) continua a não os aceitar
+        ring = self.ring(symbol, create=True)
+        ring.load(rows)
+        self._quotes[symbol] = (float(quote[0]), float(quote[1]))
+        self._notify(symbol, float(quote[0]), ring.last_ts)
+
+    def subscribe(self, listener):
+        # listener(symbol, price, ts) é chamado a cada tick (ex: vistas live, matching)
+        self._listeners.append(listener)
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
+            self._rings.clear()
+
+prices = PriceStore()
+
+def _frame_for(data, yf_sym, single):
+    # O yfinance devolve colunas planas ou MultiIndex (ticker -> campo) conforme a versão
+    columns = getattr(data, 'columns', None)
+    if columns is not None and getattr(columns, 'nlevels', 1) > 1 and yf_sym in columns.get_level_values(0):
+        return data[yf_sym]
+    if single:
+        return data
+    raise KeyError(yf_sym)
+
+def _download_into_store(symbols, **kwargs):
+    tickers = [yahoo_symbol(s) for s in symbols]
+    with track_upstream('yahoo'):
+        data = yf.download(tickers, interval="1m", progress=False, group_by='ticker', **kwargs)
+    fetched = {}
+    for sym, yf_sym in zip(symbols, tickers):
+        try:
+            frame = _frame_for(data, yf_sym, len(tickers) == 1).dropna(subset=['Close'])
+            if frame.empty:
+                continue
+            ts = [t.timestamp() for t in frame.index]
+            prices.add_bars(sym, ts, frame['Open'].to_numpy(), frame['High'].to_numpy(), frame['Low'].to_numpy(),
+                            frame['Close'].to_numpy(), frame['Volume'].to_numpy())
+            fetched[sym] = prices.get(sym)
+        except Exception as e:
+            record_error(f"market_data.refresh[{sym}]", e)
+    return fetched
+
+def refresh(symbols):
+    # Atualiza os buffers de forma incremental: símbolos novos recebem o dia inteiro,
+    # os restantes só as barras desde a última que já temos. Devolve {símbolo: preço}
+    symbols = sorted(set(symbols))
+    new = [s for s in symbols if not (prices.ring(s) and prices.ring(s).count)]
+    known = [s for s in symbols if s not in new]
+    fetched = {}
+    if new:
+        fetched.update(_download_into_store(new, period="1d"))
+    if known:
+        since = min(prices.ring(s).last_ts for s in known)
+        fetched.update(_download_into_store(known, start=datetime.utcfromtimestamp(since)))
+    return fetched
+
+def recent_bars(symbols, n=PUBLISH_BARS):
+    # {símbolo: [[ts, open, high, low, close, volume], ...]} das últimas n barras, para publicar
+    # aos outros workers (jobs.coordinator.publish)
+    out = {}
+    for sym in symbols:
+        ring = prices.ring(sym)
+        if ring is not None and ring.count:
+            out[sym] = ring.bars(n).tolist()
+    return out
+
+def apply_bars(published):
+    # Barras publicadas pelo refresher de outro processo. Os símbolos ainda sem histórico neste
+    # processo descarregam as últimas 24h uma vez; depois chegam só as barras publicadas.
+    missing = [s for s in published if not (prices.ring(s) and prices.ring(s).count)]
+    if missing:
+        try:
+            refresh(missing)
+        except Exception as e:
+            record_error("market_data.apply_bars", e)
+    for sym, rows in published.items():
+        if rows:
+            prices.add_bars(sym, *np.array(rows, dtype=float).T)
+
+def portfolio_value(items, price_for):
+    # Valor de mercado de uma lista de posições; usa o avg_price se não houver cotação
+    total = 0.0
+    for item in items:
+        price = price_for(item.symbol)
+        total += item.amount * (price if price is not None else item.avg_price)
+    return total
+
+# --- HISTÓRICO DIÁRIO (tabela daily_price) ---
+
+_daily_synced = {} # símbolo -> dia em que já se foi ao Yahoo (no máximo uma vez por dia)
+_daily_today = {}  # símbolo -> (dia, fecho provisório de hoje), nunca gravado
+_daily_retry = {}  # símbolo -> instante (monotonic) até ao qual não se volta a tentar depois de um erro
+DAILY_RETRY_SECONDS = 300
+
+def _sync_daily(symbols, start, today):
+    # Descarrega só os dias em falta: desde o último dia guardado (ou desde `start`, se o
+    # histórico guardado começar depois). Um único download para todos os símbolos.
+    now = time.monotonic()
+    stale = [s for s in symbols if _daily_synced.get(s) != today and _daily_retry.get(s, 0) <= now]
+    if not stale:
+        return
+    ranges = {sym: (first, last) for sym, first, last in db.session.execute(
+        db.select(DailyPrice.symbol, db.func.min(DailyPrice.day), db.func.max(DailyPrice.day))
+        .where(DailyPrice.symbol.in_(stale)).group_by(DailyPrice.symbol))}
+    since = min(start if sym not in ranges or ranges[sym][0] > start else ranges[sym][1] + timedelta(days=1)
+                for sym in stale)
+    tickers = [yahoo_symbol(s) for s in stale]
+    try:
+        with track_upstream('yahoo'):
+            data = yf.download(tickers, start=since.isoformat(), interval="1d", progress=False, group_by='ticker')
+    except Exception as e:
+        record_error("market_data.daily", e)
+        for sym in stale:
+            _daily_retry[sym] = now + DAILY_RETRY_SECONDS
+        return
+    rows = []
+    for sym, yf_sym in zip(stale, tickers):
+        # Sincronizado hoje mesmo sem dados: um símbolo sem histórico no Yahoo não é pedido de novo
+        _daily_synced[sym] = today
+        try:
+            closes = _frame_for(data, yf_sym, len(tickers) == 1)['Close'].dropna()
+        except Exception:
+            continue # sem dados no Yahoo: o ledger usa os preços das transações
+        first, last = ranges.get(sym, (None, None))
+        for ts, close in closes.items():
+            day = ts.date()
+            if day >= today:
+                _daily_today[sym] = (day, float(close))
+            elif first is None or day < first or day > last:
+                rows.append({'symbol': sym, 'day': day, 'close': float(close)})
+    if rows:
+        try:
+            db.session.execute(db.insert(DailyPrice), rows)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback() # outro worker gravou os mesmos dias primeiro
+
+def daily_closes(symbols, start):
+    # Fechos diários desde `start` (DataFrame: índice = dia, colunas = símbolos). Os dias fechados
+    # vêm da BD; hoje usa a cotação ao vivo (ou o fecho provisório do último download).
+    symbols = sorted(set(symbols))
+    today = datetime.utcnow().date()
+    if not symbols:
+        return pd.DataFrame(index=pd.DatetimeIndex([]))
+    _sync_daily(symbols, start, today)
+    rows = db.session.execute(
+        db.select(DailyPrice.day, DailyPrice.symbol, DailyPrice.close)
+        .where(DailyPrice.symbol.in_(symbols), DailyPrice.day >= start)).all()
+    frame = pd.DataFrame(rows, columns=['day', 'symbol', 'close']).pivot(index='day', columns='symbol', values='close')
+    frame.index = pd.to_datetime(frame.index)
+    frame = frame.reindex(columns=symbols)
+    for sym in symbols:
+        live = prices.get(sym)
+        if live is None and _daily_today.get(sym, (None,))[0] == today:
+            live = _daily_today[sym][1]
+        if live is not None:
+            frame.loc[pd.Timestamp(today), sym] = live
+    return frame.sort_index()
@@ -0,0 +1,217 @@
+# metrics.py
+# Instrumentação leve (sem dependências) exportada em formato Prometheus no /metrics.
+#
+# Ativar com METRICS_ENABLED=1. Desligado, não se registam hooks nem listeners do SQLAlchemy
+# e o track_upstream() é praticamente um no-op. Opcionalmente protege-se o endpoint com
+# METRICS_TOKEN (header "Authorization: Bearer <token>" ou ?token=).
+#
+# Nota: com vários workers do gunicorn cada processo tem o seu registo (label "pid").
+import logging
+import os
+import threading
+import time
+from flask import g, request, Response, has_request_context, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("flowtrade")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500)
+
+_enabled = False
+_upstream_tags = None # profiler.py: thread -> fornecedor em curso (atribuição das amostras)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {} # labels -> [contagens por bucket..., soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def count(self, *label_values):
+        data = self._values.get(label_values)
+        return data[-1] if data else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, data):
+                    cumulative += n
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {data[-1]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {data[-2]:.6f}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {data[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.append(f'flowtrade_process_info{{pid="{os.getpid()}"}} 1')
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram("flowtrade_request_duration_seconds", "Latência dos pedidos por rota", ["route", "method", "status"])
+DB_QUERIES = registry.histogram("flowtrade_db_queries_per_request", "Queries SQL por pedido", ["route"], buckets=QUERY_COUNT_BUCKETS)
+DB_TIME = registry.histogram("flowtrade_db_time_per_request_seconds", "Tempo total em SQL por pedido", ["route"])
+UPSTREAM_LATENCY = registry.histogram("flowtrade_upstream_duration_seconds", "Chamadas externas por fornecedor", ["provider", "outcome"])
+CACHE_REQUESTS = registry.counter("flowtrade_cache_requests_total", "Leituras da cache (hit/miss)", ["namespace", "result"])
+ERRORS = registry.counter("flowtrade_errors_total", "Erros apanhados e ignorados", ["where"])
+
+# --- API USADA PELO RESTO DA APP ---
+
+class track_upstream:
+    # Uso: with track_upstream('yahoo'): yf.download(...)
+    __slots__ = ("provider", "start")
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _enabled else None
+        if _upstream_tags is not None:
+            _upstream_tags[threading.get_ident()] = self.provider
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - self.start, self.provider, "error" if exc_type else "ok")
+        if _upstream_tags is not None:
+            _upstream_tags.pop(threading.get_ident(), None)
+        return False
+
+def tag_upstreams(tags):
+    # O profiler passa o dicionário onde o track_upstream marca a thread durante a chamada
+    global _upstream_tags
+    _upstream_tags = tags
+
+def record_error(where, exc):
+    # Substitui os "except: pass" / print(): fica no log e conta para o /metrics
+    logger.warning("%s: %s", where, exc)
+    if _enabled:
+        ERRORS.inc(where.split("[", 1)[0]) # "watchlist[BTC]" -> "watchlist" (evita labels por símbolo)
+
+# --- HOOKS (só registados com METRICS_ENABLED=1) ---
+
+def _route_label():
+    return request.endpoint or "unmatched"
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._db_queries = 0
+    g._db_time = 0.0
+
+def _after_request(response):
+    start = g.pop("_metrics_start", None)
+    if start is not None and request.endpoint != "metrics":
+        route = _route_label()
+        REQUEST_LATENCY.observe(time.perf_counter() - start, route, request.method, response.status_code)
+        DB_QUERIES.observe(g.pop("_db_queries", 0), route)
+        DB_TIME.observe(g.pop("_db_time", 0.0), route)
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_metrics_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("_metrics_start")
+    if not stack:
+        return
+    elapsed = time.perf_counter() - stack.pop()
+    if has_request_context() and "_db_queries" in g:
+        g._db_queries += 1
+        g._db_time += elapsed
+
+def _instrument_cache(backend):
+    original_get = backend.get
+
+    def get(key):
+        value = original_get(key)
+        namespace = "view" if str(key).startswith("view/") else "memoize"
+        CACHE_REQUESTS.inc(namespace, "miss" if value is None else "hit")
+        return value
+
+    backend.get = get
+
+def metrics_view():
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        supplied = request.args.get("token") or request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if supplied != token:
+            abort(403)
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def init_app(app, cache=None):
+    global _enabled
+    _enabled = app.config.get("METRICS_ENABLED", False)
+    if not _enabled:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    if cache is not None:
+        _instrument_cache(app.extensions["cache"][cache])
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -32,6 +32,8 @@ class Portfolio(db.Model):
     symbol = db.Column(db.String(20), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     avg_price = db.Column(db.Float, nullable=False)
+    # Uma linha por moeda: permite o upsert atómico em trading.add_position
+    __table_args__ = (db.UniqueConstraint('user_id', 'symbol', name='uq_portfolio_user_symbol'),)
 
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -42,6 +44,9 @@ class Transaction(db.Model):
     amount = db.Column(db.Float, nullable=False)
     total_value = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Histórico e ledger leem as transações de um utilizador por ordem cronológica.
+    # AUTOINCREMENT no SQLite: sem ele os ids das linhas apagadas (arquivadas) voltam a ser usados
+    __table_args__ = (db.Index('ix_transaction_user_ts', 'user_id', 'timestamp'), {'sqlite_autoincrement': True})
 
 class PriceAlert(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,4 +55,54 @@ class PriceAlert(db.Model):
     target_price = db.Column(db.Float, nullable=False)
     condition = db.Column(db.String(10), nullable=False) # 'above' (acima de) ou 'below' (abaixo de)
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Order(db.Model):
+    # Ordens pendentes do paper trading (limit / stop; OCO = duas ordens com o mesmo oco_group)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    side = db.Column(db.String(4), nullable=False) # 'BUY' ou 'SELL'
+    order_type = db.Column(db.String(10), nullable=False) # 'LIMIT' ou 'STOP'
+    price = db.Column(db.Float, nullable=False) # preço limite ou de ativação
+    amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(10), default='OPEN') # OPEN, FILLED, CANCELLED, REJECTED
+    oco_group = db.Column(db.String(32), nullable=True, index=True)
+    fill_price = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    filled_at = db.Column(db.DateTime, nullable=True)
+    # O motor só procura ordens abertas mais recentes que a última vista (status + id)
+    __table_args__ = (db.Index('ix_order_status_id', 'status', 'id'),)
+
+class CopySubscription(db.Model):
+    # Modo "seguir" do copy trading: os trades manuais do líder são replicados no seguidor
+    id = db.Column(db.Integer, primary_key=True)
+    follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    leader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    ratio = db.Column(db.Float, default=1.0) # quantidade do seguidor = quantidade do líder x ratio
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('follower_id', 'leader_id', name='uq_copy_follower_leader'),)
+
+class DailyPrice(db.Model):
+    # Histórico local de fechos diários (market_data.daily_closes). Só dias já fechados.
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.UniqueConstraint('symbol', 'day', name='uq_daily_price_symbol_day'),)
+
+class LedgerCheckpoint(db.Model):
+    # Estado do replay das transações de um utilizador (ledger.py): tudo o que aconteceu antes
+    # de `day` já está em `state` (JSON: posições, lotes, P&L realizado, série de património)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    state = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class JobResult(db.Model):
+    # Último resultado de cada tarefa em background (jobs.coordinator.publish), lido pelos outros workers
+    name = db.Column(db.String(50), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    owner = db.Column(db.String(100))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,195 @@
+# movers.py
+# Movimentos do mercado (24h) para um universo configurável (MOVERS_UNIVERSE, milhares de
+# símbolos), alimentados pelo feed de preços partilhado (market_data.prices.subscribe) em vez de
+# um download por página.
+#
+# Por símbolo guarda-se o que não muda dentro do minuto (preço de referência de há 24h, máximo,
+# mínimo e volume das barras fechadas), recalculado a partir do BarRing só quando começa um minuto
+# novo; cada tick é então O(1) mais a reposição do símbolo em duas listas ordenadas (bisect):
+# variação e volume em USD. Top-K de gainers/losers/volume são fatias das pontas das listas e os
+# novos máximos/mínimos vêm de um OrderedDict por ordem de chegada: leituras O(K).
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from metrics import record_error
+from market_data import TS, OPEN, HIGH, LOW, VOLUME
+import market_data
+import coins
+
+MAX_AGE = 300 # segundos sem ticks até ensure_fresh() ir buscar o universo
+EXTREME_WINDOW = 3600 # um novo máximo/mínimo fica na lista durante 1h
+MIN_BARS = 60 # sem 1h de histórico não há "novo máximo" que valha a pena mostrar
+
+class _State:
+    __slots__ = ('icon', 'minute', 'ref', 'high', 'low', 'volume', 'price', 'bar_volume', 'change_key', 'volume_key')
+
+    def __init__(self, icon):
+        self.icon = icon
+        self.minute = None
+        self.ref = self.high = self.low = None
+        self.volume = self.bar_volume = 0.0
+        self.price = None
+        self.change_key = self.volume_key = None
+
+class MoversTracker:
+    def __init__(self, universe=()):
+        self.universe = set(universe)
+        self._states = {}
+        self._by_change = [] # [(variação %, símbolo)] ordenada
+        self._by_volume = [] # [(volume 24h em USD, símbolo)] ordenada
+        self._highs = OrderedDict() # símbolo -> instante do último novo máximo (mais recente no fim)
+        self._lows = OrderedDict()
+        self._last_tick = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.universe = set(app.config['MOVERS_UNIVERSE'])
+        market_data.prices.subscribe(self.on_tick)
+
+    # --- ATUALIZAÇÃO (POR TICK) ---
+
+    def _roll(self, state, ring):
+        # Novo minuto: estatísticas das barras fechadas das últimas 24h (a barra atual fica de fora)
+        bars = ring.bars()
+        closed = bars[:-1]
+        state.minute = float(bars[-1, TS])
+        state.ref = float(bars[0, OPEN])
+        if len(closed) >= MIN_BARS:
+            state.high, state.low = float(closed[:, HIGH].max()), float(closed[:, LOW].min())
+        else:
+            state.high = state.low = None
+        state.volume = float(closed[:, VOLUME].sum())
+
+    @staticmethod
+    def _reindex(ordered, old, new):
+        if old is not None:
+            i = bisect.bisect_left(ordered, old)
+            if i < len(ordered) and ordered[i] == old:
+                del ordered[i]
+        if new is not None:
+            bisect.insort(ordered, new)
+        return new
+
+    def on_tick(self, symbol, price, ts):
+        if symbol not in self.universe:
+            return
+        ring = market_data.prices.ring(symbol)
+        if ring is None or not ring.count:
+            return
+        try:
+            with self._lock:
+                state = self._states.get(symbol)
+                if state is None:
+                    state = self._states[symbol] = _State(coins.registry.icon(symbol))
+                if ring.last_ts != state.minute:
+                    self._roll(state, ring)
+                state.price = price
+                state.bar_volume = ring.last_volume
+                change = (price / state.ref - 1) * 100 if state.ref else None
+                state.change_key = self._reindex(self._by_change, state.change_key,
+                                                 (change, symbol) if change is not None else None)
+                state.volume_key = self._reindex(self._by_volume, state.volume_key,
+                                                 ((state.volume + state.bar_volume) * price, symbol))
+                now = time.time()
+                if state.high is not None and price > state.high:
+                    self._highs.pop(symbol, None)
+                    self._highs[symbol] = now
+                if state.low is not None and price < state.low:
+                    self._lows.pop(symbol, None)
+                    self._lows[symbol] = now
+                self._last_tick = now
+        except Exception as e:
+            record_error(f"movers[{symbol}]", e)
+
+    def ensure_fresh(self, max_age=MAX_AGE):
+        # Sem refresher em background (ou com ele parado), o 1º pedido atualiza o universo todo
+        # num só download incremental. Se já há dados (ex: restaurados do snapshot) servem-se
+        # como estão e a atualização corre numa thread; sem dados, os pedidos esperam por ela.
+        if time.time() - self._last_tick <= max_age or not self.universe:
+            return
+        if self._states:
+            if self._refresh_lock.acquire(blocking=False):
+                threading.Thread(target=self._refresh_in_background, args=(max_age,),
+                                 name="movers-refresh", daemon=True).start()
+            return
+        with self._refresh_lock:
+            if time.time() - self._last_tick <= max_age:
+                return
+            self._refresh(max_age)
+
+    def _refresh(self, max_age):
+        try:
+            market_data.refresh(self.universe)
+        except Exception as e:
+            record_error("movers.refresh", e)
+        self._last_tick = max(self._last_tick, time.time() - max_age / 2) # falhou: não tenta a cada pedido
+
+    def _refresh_in_background(self, max_age):
+        try:
+            self._refresh(max_age)
+        finally:
+            self._refresh_lock.release()
+
+    def backdate(self, ts):
+        # Dados restaurados contam com a idade que tinham (o próximo ensure_fresh atualiza-os)
+        self._last_tick = min(self._last_tick, ts)
+
+    # --- LEITURAS (O(K)) ---
+
+    def _view(self, symbol):
+        state = self._states[symbol]
+        high = max(state.high, state.price) if state.high is not None else None
+        low = min(state.low, state.price) if state.low is not None else None
+        return {
+            'symbol': symbol, 'price': state.price,
+            'change': (state.price / state.ref - 1) * 100 if state.ref else 0.0,
+            'volume': (state.volume + state.bar_volume) * state.price,
+            'high': high, 'low': low, 'icon': state.icon,
+        }
+
+    def quote(self, symbol):
+        with self._lock:
+            return self._view(symbol) if symbol in self._states else None
+
+    def gainers(self, k=3):
+        with self._lock:
+            return [self._view(s) for change, s in reversed(self._by_change[-k:]) if change > 0]
+
+    def losers(self, k=3):
+        # Do pior para o melhor
+        with self._lock:
+            return [self._view(s) for change, s in self._by_change[:k] if change < 0]
+
+    def volume_leaders(self, k=5):
+        with self._lock:
+            return [self._view(s) for _, s in reversed(self._by_volume[-k:])]
+
+    def _extremes(self, events, k):
+        cutoff = time.time() - EXTREME_WINDOW
+        out = []
+        for symbol in reversed(events):
+            if len(out) >= k or events[symbol] < cutoff:
+                break
+            out.append(self._view(symbol))
+        return out
+
+    def new_highs(self, k=5):
+        with self._lock:
+            return self._extremes(self._highs, k)
+
+    def new_lows(self, k=5):
+        with self._lock:
+            return self._extremes(self._lows, k)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._by_change.clear()
+            self._by_volume.clear()
+            self._highs.clear()
+            self._lows.clear()
+            self._last_tick = 0.0
+
+tracker = MoversTracker()
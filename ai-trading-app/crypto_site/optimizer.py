@@ -0,0 +1,142 @@
+# optimizer.py
+# Otimizador de carteiras por trás do /generate_portfolio (página "Arquiteto de Portfólio").
+#
+# Sobre o universo configurado (STRATEGY_UNIVERSE) e com os retornos/covariância já em cache
+# no risk.covariance: mistura de mean-variance (long-only, média encolhida) com risk parity,
+# e o peso total em cripto escalado para a volatilidade-alvo do perfil (o resto fica em liquidez).
+#
+# As soluções ficam memorizadas por (universo, último dia da covariância, perfil): pedidos
+# repetidos não resolvem nada. Quando chega um dia novo, o solver arranca da solução anterior.
+import math
+import threading
+import time
+from lazy_imports import np
+import risk
+
+# Perfil -> (volatilidade anual alvo, aversão ao risco do mean-variance)
+PROFILES = {
+    'Conservador': (0.20, 8.0),
+    'Equilibrado': (0.40, 4.0),
+    'Agressivo': (0.70, 2.0),
+}
+DEFAULT_PROFILE = 'Equilibrado'
+MEAN_SHRINK = 0.5 # as médias históricas de cripto são ruído: encolher para 0
+MV_BLEND = 0.5 # peso do mean-variance na mistura com o risk parity
+MIN_OBSERVATIONS = 60 # dias de histórico para uma moeda entrar
+MIN_WEIGHT = 0.01 # abaixo disto a moeda sai da alocação
+SNAPSHOT_TTL = 300 # segundos entre verificações de dias novos na covariância
+MAX_ITER = 5000
+TOL = 1e-10
+CASH_ASSET = 'Liquidez (USDT)'
+
+_lock = threading.Lock()
+_snapshot = {} # universo -> (verificado_em, chave)
+_solutions = {} # (chave, perfil) -> solução
+_warm = {} # (universo, perfil) -> pesos da última solução (arranque do próximo solve)
+
+def _project_simplex(v):
+    # Projeção euclidiana no simplex {w >= 0, Σw = 1}
+    u = np.sort(v)[::-1]
+    css = np.cumsum(u) - 1
+    rho = np.nonzero(u - css / np.arange(1, len(v) + 1) > 0)[0][-1]
+    return np.maximum(v - css[rho] / (rho + 1), 0.0)
+
+def mean_variance(mu, cov, gamma, w0=None):
+    # max μᵀw - γ/2 wᵀΣw com w >= 0, Σw = 1 (gradiente projetado, passo 1/L)
+    n = len(mu)
+    w = np.full(n, 1.0 / n) if w0 is None else w0
+    step = 1.0 / (gamma * max(np.linalg.eigvalsh(cov)[-1], 1e-12))
+    for i in range(MAX_ITER):
+        nxt = _project_simplex(w + step * (mu - gamma * cov @ w))
+        if np.abs(nxt - w).max() < TOL:
+            return nxt, i + 1
+        w = nxt
+    return w, MAX_ITER
+
+def risk_parity(cov, w0=None):
+    # Contribuições de risco iguais: w_i (Σw)_i = wᵀΣw / n (iteração multiplicativa)
+    n = len(cov)
+    w = np.full(n, 1.0 / n) if w0 is None else w0
+    for i in range(MAX_ITER):
+        rc = w * (cov @ w)
+        nxt = w * np.sqrt(rc.mean() / np.maximum(rc, 1e-18))
+        nxt /= nxt.sum()
+        if np.abs(nxt - w).max() < TOL:
+            return nxt, i + 1
+        w = nxt
+    return w, MAX_ITER
+
+def _snapshot_key(universe):
+    # Verifica dias novos no máximo a cada SNAPSHOT_TTL segundos
+    now = time.monotonic()
+    checked = _snapshot.get(universe)
+    if checked and now - checked[0] < SNAPSHOT_TTL:
+        return checked[1]
+    risk.covariance.update(list(universe))
+    key = (universe, risk.covariance.last_day)
+    if checked and checked[1] != key: # dia novo: as soluções antigas deste universo já não servem
+        for old in [k for k in _solutions if k[0] == checked[1]]:
+            del _solutions[old]
+    _snapshot[universe] = (now, key)
+    return key
+
+def _solve(universe, profile):
+    obs = risk.covariance.observations(universe)
+    symbols = [s for s in universe if obs[s] >= MIN_OBSERVATIONS]
+    if not symbols:
+        return None
+    mu, cov = risk.covariance.moments(symbols)
+    target_vol, gamma = PROFILES[profile]
+    warm = _warm.get((universe, profile))
+    w0_mv, w0_rp = (warm['mv'], warm['rp']) if warm and warm['symbols'] == symbols else (None, None)
+    w_mv, it_mv = mean_variance(mu * MEAN_SHRINK * risk.TRADING_DAYS, cov * risk.TRADING_DAYS, gamma, w0_mv)
+    w_rp, it_rp = risk_parity(cov, w0_rp)
+    _warm[(universe, profile)] = {'symbols': symbols, 'mv': w_mv, 'rp': w_rp}
+
+    w = MV_BLEND * w_mv + (1 - MV_BLEND) * w_rp
+    w = np.where(w >= MIN_WEIGHT, w, 0.0)
+    w /= w.sum()
+    vol = math.sqrt(float(w @ cov @ w) * risk.TRADING_DAYS)
+    invested = min(1.0, target_vol / vol) if vol > 0 else 1.0
+    return {'symbols': symbols, 'weights': w * invested, 'cash': 1.0 - invested,
+            'volatility': vol * invested, 'target_volatility': target_vol,
+            'expected_return': float(w @ mu) * risk.TRADING_DAYS * invested,
+            'iterations': {'mean_variance': it_mv, 'risk_parity': it_rp}}
+
+def optimize(universe, profile):
+    # Pesos ótimos para o perfil (memorizados por snapshot da covariância)
+    universe = tuple(sorted(set(universe)))
+    profile = profile if profile in PROFILES else DEFAULT_PROFILE
+    with _lock:
+        key = (_snapshot_key(universe), profile)
+        if key not in _solutions:
+            _solutions[key] = _solve(universe, profile)
+        return _solutions[key]
+
+def _percentages(weights):
+    # Percentagens com 1 casa decimal que somam exatamente 100 (maiores restos)
+    raw = np.asarray(weights) * 1000
+    base = np.floor(raw)
+    order = np.argsort(base - raw) # maiores restos primeiro
+    base[order[:int(round(1000 - base.sum()))]] += 1
+    return base / 10
+
+def allocate(universe, profile, capital):
+    # Resposta no formato da crypto_strategy.html: {explanation, allocation: [{asset, pct, value}]}
+    profile = profile if profile in PROFILES else DEFAULT_PROFILE
+    solution = optimize(universe, profile)
+    if solution is None:
+        raise ValueError("Sem histórico de preços suficiente para otimizar.")
+    items = sorted(((s, w) for s, w in zip(solution['symbols'], solution['weights']) if w > 0), key=lambda x: -x[1])
+    assets = [s for s, _ in items] + ([CASH_ASSET] if solution['cash'] > 0.0005 else [])
+    pcts = _percentages([w for _, w in items] + ([solution['cash']] if len(assets) > len(items) else []))
+    allocation = [{'asset': a, 'pct': round(float(p), 1), 'value': f"€{capital * p / 100:,.2f}"}
+                  for a, p in zip(assets, pcts) if p > 0]
+
+    cash_pct = next((a['pct'] for a in allocation if a['asset'] == CASH_ASSET), 0)
+    explanation = (f"Volatilidade anual alvo de {solution['target_volatility'] * 100:.0f}% "
+                   f"(estimada {solution['volatility'] * 100:.0f}%). Mistura de mean-variance e risk parity "
+                   f"sobre {len(solution['symbols'])} moedas com um ano de retornos diários")
+    explanation += f"; {cash_pct:g}% fica em liquidez para controlar o risco." if cash_pct else "."
+    return {'explanation': explanation, 'allocation': allocation, 'profile': profile,
+            'expected_return': solution['expected_return'], 'volatility': solution['volatility']}
@@ -0,0 +1,289 @@
+# orders.py
+# Ordens pendentes do paper trading (limit, stop e OCO) + motor de matching.
+#
+# As ordens abertas ficam indexadas em memória por símbolo, em listas ordenadas por preço
+# (bisect). A cada refresh de preços o motor lê o mínimo/máximo desde a última passagem
+# (buffer do market_data) e só toca nas ordens que podiam ser executadas nesse intervalo.
+# Uma ordem nova espera fora das listas até à primeira passagem e aí é comparada só com os
+# preços posteriores à criação (o intervalo partilhado pode ter começado antes dela existir).
+# As execuções de uma passagem são escritas numa única transação.
+import bisect
+import threading
+import uuid
+from datetime import datetime, timezone
+from extensions import db
+from models import Order
+from metrics import record_error
+import market_data
+import trading
+
+CONSUMER = 'orders'
+SIDES = ('BUY', 'SELL')
+TYPES = ('LIMIT', 'STOP', 'OCO')
+
+class PriceLevels:
+    # Lista ordenada de (preço, id)
+    def __init__(self):
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, price, order_id):
+        bisect.insort(self.entries, (price, order_id))
+
+    def extend(self, entries):
+        self.entries.extend(entries)
+        self.entries.sort()
+
+    def remove(self, price, order_id):
+        i = bisect.bisect_left(self.entries, (price, order_id))
+        if i < len(self.entries) and self.entries[i] == (price, order_id):
+            del self.entries[i]
+
+    def pop_at_or_below(self, price):
+        i = bisect.bisect_right(self.entries, (price, float('inf')))
+        taken = self.entries[:i]
+        del self.entries[:i]
+        return taken
+
+    def pop_at_or_above(self, price):
+        i = bisect.bisect_left(self.entries, (price, -1))
+        taken = self.entries[i:]
+        del self.entries[i:]
+        return taken
+
+def crosses(side, kind, price, low, high):
+    # O mesmo critério do SymbolBook.crossable para uma só ordem
+    if (side == 'BUY') == (kind == 'LIMIT'):
+        return low <= price # compra limit / venda stop
+    return high >= price # venda limit / compra stop
+
+def _epoch(created_at):
+    return created_at.replace(tzinfo=timezone.utc).timestamp() if created_at else 0.0
+
+class SymbolBook:
+    def __init__(self):
+        self.levels = {(side, kind): PriceLevels() for side in SIDES for kind in ('LIMIT', 'STOP')}
+        self.pending = {} # id -> (lado, tipo, preço, criação em epoch): ainda sem passagem
+
+    def __len__(self):
+        return len(self.pending) + sum(len(l) for l in self.levels.values())
+
+    def add(self, side, kind, price, order_id, since):
+        self.pending[order_id] = (side, kind, price, since)
+
+    def remove(self, side, kind, price, order_id):
+        if self.pending.pop(order_id, None) is None:
+            self.levels[(side, kind)].remove(price, order_id)
+
+    def admit(self, range_since):
+        # Primeira passagem das ordens pendentes: cada uma contra os preços desde a sua criação
+        # (range_since(ts) -> (low, high)); as que não cruzam entram nas listas
+        crossed, keep, windows = [], {}, {}
+        for order_id, (side, kind, price, since) in self.pending.items():
+            minute = since - since % 60
+            if minute not in windows:
+                windows[minute] = range_since(since)
+            window = windows[minute]
+            if window is not None and crosses(side, kind, price, *window):
+                crossed.append((price, order_id))
+            else:
+                keep.setdefault((side, kind), []).append((price, order_id))
+        for key, entries in keep.items():
+            self.levels[key].extend(entries)
+        self.pending = {}
+        return crossed
+
+    def crossable(self, low, high):
+        # Compra limit: executa se o preço desceu até ao limite | Venda limit: se subiu até ao limite
+        # Compra stop: ativa se subiu até ao stop | Venda stop: se desceu até ao stop
+        return (self.levels[('BUY', 'LIMIT')].pop_at_or_above(low)
+                + self.levels[('SELL', 'LIMIT')].pop_at_or_below(high)
+                + self.levels[('BUY', 'STOP')].pop_at_or_below(high)
+                + self.levels[('SELL', 'STOP')].pop_at_or_above(low))
+
+class MatchingEngine:
+    def __init__(self):
+        self.books = {}
+        self.index = {} # id -> (símbolo, lado, tipo, preço)
+        self.max_seen_id = 0
+        self._lock = threading.RLock()
+
+    def _add(self, order):
+        if order.id in self.index:
+            return
+        self.books.setdefault(order.symbol, SymbolBook()).add(order.side, order.order_type, order.price, order.id,
+                                                              _epoch(order.created_at))
+        self.index[order.id] = (order.symbol, order.side, order.order_type, order.price)
+        self.max_seen_id = max(self.max_seen_id, order.id)
+
+    def _discard(self, order_id):
+        entry = self.index.pop(order_id, None)
+        if entry:
+            symbol, side, kind, price = entry
+            self.books[symbol].remove(side, kind, price, order_id)
+
+    def sync(self):
+        # Apanha ordens criadas noutros workers (só as novas: id > último visto)
+        with self._lock:
+            rows = db.session.execute(
+                db.select(Order.id, Order.symbol, Order.side, Order.order_type, Order.price, Order.created_at)
+                .where(Order.status == 'OPEN', Order.id > self.max_seen_id)
+            ).all()
+            for row in rows:
+                self._add(row)
+
+    def add(self, order):
+        with self._lock:
+            self._add(order)
+
+    def discard(self, order_ids):
+        with self._lock:
+            for order_id in order_ids:
+                self._discard(order_id)
+
+    def symbols(self):
+        self.sync()
+        return [sym for sym, book in self.books.items() if len(book)]
+
+    def open_count(self):
+        return len(self.index)
+
+    def run(self, store=None):
+        # Uma passagem de matching. Devolve a lista de ordens executadas.
+        store = store or market_data.prices
+        with self._lock:
+            self.sync()
+            crossed = []
+            for symbol, book in self.books.items():
+                if not len(book):
+                    continue
+                window = store.take_range(symbol, CONSUMER)
+                if window is None:
+                    continue # sem preços: as pendentes esperam pelos primeiros
+                candidates = book.crossable(*window)
+                if book.pending:
+                    candidates += book.admit(lambda ts: store.range_since(symbol, ts))
+                for price, order_id in candidates:
+                    self.index.pop(order_id, None)
+                    crossed.append(order_id)
+            if not crossed:
+                return []
+            try:
+                return self._fill(crossed, store)
+            except Exception as e:
+                db.session.rollback()
+                record_error("matching_engine", e)
+                # Voltam ao livro na próxima sincronização
+                self.max_seen_id = min(self.max_seen_id, min(crossed) - 1)
+                return []
+
+    def _fill_price(self, order, store):
+        # Limit: nunca pior que o limite (melhora se o mercado já estiver melhor). Stop: preço de ativação.
+        last = store.get(order.symbol)
+        if order.order_type == 'LIMIT' and last is not None:
+            return min(order.price, last) if order.side == 'BUY' else max(order.price, last)
+        return order.price
+
+    def _fill(self, order_ids, store):
+        now = datetime.utcnow()
+        # Reclamar as ordens de forma atómica: outro worker pode já as ter executado/cancelado
+        claimed = db.session.execute(
+            db.update(Order).where(Order.id.in_(order_ids), Order.status == 'OPEN')
+            .values(status='FILLED', filled_at=now).returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if not claimed:
+            db.session.commit()
+            return []
+
+        orders = Order.query.filter(Order.id.in_(claimed)).order_by(Order.id).all()
+
+        filled, cancelled, tx_rows = [], [], []
+        done_groups = set()
+        with db.session.no_autoflush: # o estado das ordens vai no flush final, não antes de cada UPDATE
+            for order in orders:
+                if order.oco_group and order.oco_group in done_groups:
+                    order.status = 'CANCELLED' # a outra perna já foi executada nesta passagem
+                    order.filled_at = None
+                    cancelled.append(order.id)
+                    continue
+                price = self._fill_price(order, store)
+                # Saldo/posições com UPDATEs condicionais (trading.py), tudo na mesma transação
+                if order.side == 'BUY':
+                    ok = trading.debit(order.user_id, order.amount * price)
+                    if ok:
+                        trading.add_position(order.user_id, order.symbol, order.amount, price)
+                else:
+                    ok = trading.remove_position(order.user_id, order.symbol, order.amount)
+                    if ok:
+                        trading.credit(order.user_id, order.amount * price)
+                if not ok:
+                    order.status, order.filled_at = 'REJECTED', None
+                    continue
+
+                order.fill_price = price
+                tx_rows.append(trading.record(order.user_id, order.symbol, order.side, price, order.amount, now))
+                filled.append(order)
+                if order.oco_group:
+                    done_groups.add(order.oco_group)
+
+        if done_groups:
+            # A outra perna das OCO executadas (só se ainda estiver aberta)
+            cancelled += db.session.execute(
+                db.update(Order).where(Order.oco_group.in_(done_groups), Order.status == 'OPEN')
+                .values(status='CANCELLED').returning(Order.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+        if tx_rows:
+            trading.insert_transactions(tx_rows) # um INSERT em lote para todas as execuções
+        db.session.commit()
+        self.discard(cancelled)
+        return filled
+
+engine = MatchingEngine()
+
+# --- API USADA PELAS ROTAS ---
+
+def place_orders(user_id, symbol, side, order_type, amount, price, stop_price=None):
+    # Cria a(s) ordem(ns) e indexa-as no motor. Lança ValueError com a mensagem para o utilizador.
+    if side not in SIDES or order_type not in TYPES:
+        raise ValueError("Tipo de ordem inválido.")
+    if not symbol or amount <= 0 or price <= 0:
+        raise ValueError("Valores inválidos.")
+
+    if order_type == 'OCO':
+        if not stop_price or stop_price <= 0:
+            raise ValueError("OCO precisa de preço alvo e de stop.")
+        # Venda: alvo acima e stop abaixo | Compra: limite abaixo e stop acima
+        if side == 'SELL' and not price > stop_price:
+            raise ValueError("Na venda OCO o alvo tem de estar acima do stop.")
+        if side == 'BUY' and not price < stop_price:
+            raise ValueError("Na compra OCO o limite tem de estar abaixo do stop.")
+        group = uuid.uuid4().hex
+        orders = [Order(user_id=user_id, symbol=symbol, side=side, order_type='LIMIT', price=price, amount=amount, oco_group=group),
+                  Order(user_id=user_id, symbol=symbol, side=side, order_type='STOP', price=stop_price, amount=amount, oco_group=group)]
+    else:
+        orders = [Order(user_id=user_id, symbol=symbol, side=side, order_type=order_type, price=price, amount=amount)]
+
+    db.session.add_all(orders)
+    db.session.commit()
+    for order in orders:
+        engine.add(order)
+    return orders
+
+def cancel_order(order):
+    # Cancela a ordem (e a outra perna, se for OCO)
+    query = Order.query.filter(Order.status == 'OPEN')
+    if order.oco_group:
+        query = query.filter(Order.oco_group == order.oco_group)
+    else:
+        query = query.filter(Order.id == order.id)
+    ids = [o.id for o in query.all()]
+    if ids:
+        db.session.execute(db.update(Order).where(Order.id.in_(ids), Order.status == 'OPEN')
+                           .values(status='CANCELLED').execution_options(synchronize_session=False))
+        db.session.commit()
+        engine.discard(ids)
+    return ids
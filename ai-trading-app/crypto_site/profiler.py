@@ -0,0 +1,306 @@
+# profiler.py
+# Profiler por amostragem a pedido (sem dependências) para perceber em produção porque é que
+# uma rota ficou lenta, sem redeploy. Só para admins (special_role == 'ADMIN').
+#
+# Uma thread lê a cada 1/hz segundos as stacks de todas as threads do processo
+# (sys._current_frames) e conta stacks iguais ("collapsed stacks", o formato do flamegraph.pl).
+# Cada stack começa pela atribuição:
+#   route:<endpoint>   thread a servir um pedido
+#   upstream:<nome>    dentro de um metrics.track_upstream (yahoo, rss, smtp, gemini...)
+#   thread:<nome>      threads de background (job-prices, copytrade...)
+# Threads paradas à espera (threading/selectors/queue sem pedido em curso) não entram.
+#
+# Dois modos:
+#   - sessão: POST /admin/profile/start (seconds, hz) grava o pedido em job_result
+#     ('profile:control'); cada worker vê-o em até PROFILE_POLL_SECONDS, amostra até ao fim e
+#     publica o resultado em 'profile:<id>:<worker>';
+#   - um pedido: header "X-Profile: 1" (de um admin) amostra só essa thread a PROFILE_REQUEST_HZ
+#     e a resposta traz o id no header X-Profile-Id.
+# GET /admin/profile/<id>?format=collapsed|speedscope junta os workers e devolve o ficheiro
+# (collapsed para o flamegraph.pl/inferno, speedscope para https://www.speedscope.app).
+#
+# Desligado custa um teste a uma variável global por pedido e por track_upstream, mais a leitura
+# de 'profile:control' (uma linha por chave primária) a cada PROFILE_POLL_SECONDS por worker.
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import request, jsonify, abort, Response, g
+from flask_login import current_user
+from extensions import db
+from metrics import record_error
+from models import JobResult
+import metrics
+import jobs
+
+CONTROL = 'profile:control'
+HEADER = 'X-Profile'
+MAX_DEPTH = 128
+IDLE_FILES = ('threading.py', 'selectors.py', 'socketserver.py', 'queue.py', 'socket.py')
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+KEEP = timedelta(days=1) # resultados mais velhos são apagados na sessão seguinte
+
+active = 0 # nº de samplers a correr (0 = hooks desligados)
+_active_lock = threading.Lock()
+_routes = {} # thread -> endpoint do pedido em curso
+_upstreams = {} # thread -> fornecedor externo em curso (metrics.track_upstream)
+_labels = {} # code -> "ficheiro:função"
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        if path.startswith(_ROOT):
+            path = os.path.relpath(path, _ROOT)
+        elif "site-packages" in path:
+            path = path.split("site-packages" + os.sep, 1)[1]
+        else:
+            path = os.path.basename(path)
+        label = _labels[code] = f"{path}:{getattr(code, 'co_qualname', code.co_name)}"
+    return label
+
+def _stack(frame):
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        frames.append(_label(frame.f_code))
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+class Sampler:
+    # Uma sessão de amostragem neste processo; on_done(contagens) corre na thread do sampler
+    def __init__(self, hz, seconds=None, only=None, on_done=None):
+        self.interval = 1.0 / hz
+        self.seconds = seconds
+        self.only = only # ids das threads a amostrar (None = todas)
+        self.on_done = on_done
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self):
+        global active
+        with _active_lock:
+            active += 1
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for tid, frame in sys._current_frames().items():
+            if tid == me or (self.only is not None and tid not in self.only):
+                continue
+            name = names.get(tid, "?")
+            if name.startswith("profiler-"):
+                continue
+            route = _routes.get(tid)
+            if route is None and os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                continue # à espera de trabalho
+            prefix = [f"route:{route}"] if route is not None else [f"thread:{name}"]
+            upstream = _upstreams.get(tid)
+            if upstream is not None:
+                prefix.append(f"upstream:{upstream}")
+            self.counts[";".join(prefix + _stack(frame))] += 1
+        self.samples += 1
+
+    def _run(self):
+        global active
+        deadline = time.monotonic() + self.seconds if self.seconds else None
+        try:
+            while not self._stop.wait(self.interval):
+                self._sample()
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        finally:
+            with _active_lock:
+                active -= 1
+        if self.on_done is not None:
+            try:
+                self.on_done(self)
+            except Exception as e:
+                record_error("profiler", e)
+
+class SamplingProfiler:
+    def __init__(self):
+        self.app = None
+        self.poll = 2
+        self.max_seconds = 300
+        self.default_hz = 100
+        self.request_hz = 1000
+        self._seen = set() # sessões já corridas neste processo
+
+    def init_app(self, app):
+        self.app = app
+        self.poll = app.config['PROFILE_POLL_SECONDS']
+        self.max_seconds = app.config['PROFILE_MAX_SECONDS']
+        self.request_hz = app.config['PROFILE_REQUEST_HZ']
+        metrics.tag_upstreams(_upstreams)
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
+        app.add_url_rule("/admin/profile", "profile_status", _status_view)
+        app.add_url_rule("/admin/profile/start", "profile_start", _start_view, methods=["POST"])
+        app.add_url_rule("/admin/profile/<profile_id>", "profile_download", _download_view)
+
+    # --- SESSÕES (TODOS OS WORKERS) ---
+
+    def start_session(self, seconds, hz):
+        # Grava o pedido para os outros workers e começa já neste
+        session = {'id': uuid.uuid4().hex[:12], 'until': time.time() + seconds, 'hz': hz}
+        db.session.execute(db.delete(JobResult).where(JobResult.name.like("profile:%"), JobResult.name != CONTROL,
+                                                      JobResult.updated_at < datetime.utcnow() - KEEP))
+        jobs.coordinator.publish(CONTROL, session)
+        self._run_session(session)
+        return session
+
+    def _run_session(self, session):
+        if session['id'] in self._seen:
+            return
+        self._seen.add(session['id'])
+        seconds = session['until'] - time.time()
+        if seconds > 0:
+            Sampler(session['hz'], seconds, on_done=lambda s: self._publish(session['id'], s)).start()
+
+    def _publish(self, profile_id, sampler, route=None):
+        # Uma linha por worker; o nome leva um hash do dono (host:pid) para caber na chave
+        owner = jobs.coordinator.owner
+        payload = {'owner': owner, 'samples': sampler.samples, 'hz': round(1 / sampler.interval),
+                   'route': route, 'stacks': dict(sampler.counts)}
+        with self.app.app_context():
+            jobs.coordinator.publish(f"profile:{profile_id}:{hashlib.sha1(owner.encode()).hexdigest()[:8]}", payload)
+
+    def watch(self):
+        # Depois do fork (start_background_jobs): cada worker segue o 'profile:control'
+        if self.poll > 0:
+            threading.Thread(target=self._watch, name="profiler-watch", daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll)
+            with self.app.app_context():
+                try:
+                    row = db.session.get(JobResult, CONTROL)
+                    if row is not None:
+                        session = json.loads(row.payload)
+                        if session['until'] > time.time():
+                            self._run_session(session)
+                except Exception as e:
+                    record_error("profiler.watch", e)
+
+    def results(self, profile_id):
+        # [payload de cada worker] de uma sessão ou de um pedido
+        rows = db.session.execute(db.select(JobResult.payload)
+                                  .where(JobResult.name.like(f"profile:{profile_id}:%"))).scalars()
+        return [json.loads(payload) for payload in rows]
+
+sampler = SamplingProfiler()
+
+# --- UM PEDIDO (HEADER X-Profile) ---
+
+def _before_request():
+    if active:
+        _routes[threading.get_ident()] = request.endpoint or "unmatched"
+    if request.headers.get(HEADER) and _is_admin():
+        tid = threading.get_ident()
+        route = _routes[tid] = request.endpoint or "unmatched"
+        profile_id = g._profile_id = f"req-{uuid.uuid4().hex[:12]}"
+        g._profile_sampler = Sampler(sampler.request_hz, only={tid},
+                                     on_done=lambda s: sampler._publish(profile_id, s, route)).start()
+
+def _after_request(response):
+    profile_id = g.get('_profile_id')
+    if profile_id is not None:
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+def _teardown_request(exc):
+    profiled = g.pop('_profile_sampler', None)
+    if profiled is not None:
+        profiled.stop() # publica antes de devolver: o id já pode ser pedido
+    _routes.pop(threading.get_ident(), None)
+
+# --- ROTAS DE ADMIN ---
+
+def _is_admin():
+    return current_user.is_authenticated and current_user.special_role == 'ADMIN'
+
+def _require_admin():
+    if not _is_admin():
+        abort(403)
+
+def _status_view():
+    _require_admin()
+    row = db.session.get(JobResult, CONTROL)
+    session = json.loads(row.payload) if row is not None else None
+    return jsonify({'active_samplers': active, 'session': session,
+                    'running': bool(session and session['until'] > time.time())})
+
+def _start_view():
+    _require_admin()
+    try:
+        seconds = float(request.values.get('seconds', 30))
+        hz = int(request.values.get('hz', sampler.default_hz))
+    except ValueError:
+        return jsonify({'error': 'seconds e hz têm de ser números'}), 400
+    if not 0 < seconds <= sampler.max_seconds or not 1 <= hz <= 1000:
+        return jsonify({'error': f'seconds entre 0 e {sampler.max_seconds}, hz entre 1 e 1000'}), 400
+    return jsonify(sampler.start_session(seconds, hz))
+
+def collapsed(results):
+    # Junta os workers: "frame;frame;frame contagem" por linha (flamegraph.pl, inferno, speedscope)
+    total = Counter()
+    for result in results:
+        total.update(result['stacks'])
+    return "".join(f"{stack} {count}\n" for stack, count in total.most_common())
+
+def speedscope(results, name):
+    # Formato "sampled" do speedscope: frames partilhados e uma lista de stacks com pesos
+    total = Counter()
+    for result in results:
+        total.update(result['stacks'])
+    frames, index, samples, weights = [], {}, [], []
+    for stack, count in total.most_common():
+        ids = []
+        for frame in stack.split(";"):
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({'name': frame})
+            ids.append(index[frame])
+        samples.append(ids)
+        weights.append(count)
+    return {'$schema': 'https://www.speedscope.app/file-format-schema.json', 'name': name,
+            'exporter': 'flowtrade', 'shared': {'frames': frames},
+            'profiles': [{'type': 'sampled', 'name': name, 'unit': 'none', 'startValue': 0,
+                          'endValue': sum(weights), 'samples': samples, 'weights': weights}]}
+
+def _download_view(profile_id):
+    _require_admin()
+    results = sampler.results(profile_id)
+    if not results:
+        return jsonify({'error': 'Sem resultados (a sessão ainda está a correr?)'}), 404
+    fmt = request.args.get('format', 'collapsed')
+    headers = {'X-Profile-Workers': str(len(results)),
+               'X-Profile-Samples': str(sum(r['samples'] for r in results))}
+    if fmt == 'speedscope':
+        response = jsonify(speedscope(results, f"flowtrade {profile_id}"))
+        filename = f"profile-{profile_id}.speedscope.json"
+    elif fmt == 'collapsed':
+        response = Response(collapsed(results), mimetype='text/plain')
+        filename = f"profile-{profile_id}.folded"
+    else:
+        return jsonify({'error': 'format: collapsed ou speedscope'}), 400
+    response.headers.update(headers)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
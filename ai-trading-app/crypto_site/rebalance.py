@@ -0,0 +1,85 @@
+# rebalance.py
+# Rebalanceamento da carteira do paper trading para pesos-alvo, num só pedido.
+#
+# Em vez de N chamadas ao /paper_trading/trade (cada uma com o seu get_stock_price e o seu
+# commit): preços de todos os símbolos num só download, plano de compras/vendas calculado
+# vetorialmente sobre as posições e execução em lote (trading.sell_many + trading.buy_many)
+# numa única transação. Ou tudo ou nada.
+import re
+from lazy_imports import np
+import trading
+import coins
+
+MIN_TRADE_VALUE = 1.0 # diferenças abaixo disto ($) não geram trade
+CASH_ASSETS = {'USD', 'USDT', 'USDC', 'EUR', 'CASH', 'LIQUIDEZ'}
+
+def asset_symbol(name):
+    # "Bitcoin (BTC)" -> BTC, "eth-usd" -> ETH
+    return coins.canonical(name)
+
+def parse_targets(data):
+    # Aceita {"weights": {"BTC": 0.5, ...}} (frações) ou a alocação da página de estratégia
+    # {"allocation": [{"asset": "Bitcoin (BTC)", "pct": 50}, ...]} (percentagens).
+    # O que sobrar até 100% fica em saldo. Devolve {símbolo: fração}.
+    if isinstance(data.get('allocation'), list):
+        items = [(item.get('asset'), item.get('pct')) for item in data['allocation'] if isinstance(item, dict)]
+        scale = 100.0
+    elif isinstance(data.get('weights'), dict):
+        items = list(data['weights'].items())
+        scale = 1.0
+    else:
+        raise ValueError("Indica os pesos-alvo (weights) ou a alocação (allocation).")
+
+    weights = {}
+    for asset, value in items:
+        try:
+            value = float(str(value).rstrip('%')) / scale
+        except (TypeError, ValueError):
+            raise ValueError(f"Peso inválido para {asset}.")
+        symbol = asset_symbol(asset or '')
+        if not symbol or not re.fullmatch(r'[A-Z0-9]{1,15}', symbol):
+            raise ValueError(f"Ativo inválido: {asset}.")
+        if value < 0:
+            raise ValueError("Os pesos não podem ser negativos.")
+        if symbol in CASH_ASSETS:
+            continue
+        weights[symbol] = weights.get(symbol, 0.0) + value
+    if sum(weights.values()) > 1.0 + 1e-6:
+        raise ValueError("Os pesos somam mais de 100%.")
+    return weights
+
+def plan(positions, cash, weights, prices, min_trade=MIN_TRADE_VALUE):
+    # positions {símbolo: quantidade}, weights {símbolo: fração}, prices {símbolo: preço}.
+    # Devolve (vendas, compras, património) com vendas/compras = [(símbolo, quantidade, preço)].
+    # Moedas fora dos pesos são vendidas por inteiro; as compras são pagas com o saldo + vendas.
+    symbols = sorted(set(positions) | set(weights))
+    if not symbols:
+        return [], [], cash
+    px = np.array([prices[s] for s in symbols], dtype=float)
+    held = np.array([positions.get(s, 0.0) for s in symbols], dtype=float)
+    w = np.array([weights.get(s, 0.0) for s in symbols], dtype=float)
+
+    equity = cash + float(held @ px)
+    delta = (w * equity - held * px) / px
+    delta = np.where(w == 0, -held, delta) # alvo 0: fecha a posição (sem deixar pó)
+    delta = np.where(np.abs(delta) * px >= min_trade, delta, 0.0)
+
+    sell_idx = np.flatnonzero(delta < 0)
+    buy_idx = np.flatnonzero(delta > 0)
+    # Vender "quase tudo" com a tolerância do trading.py passa a vender tudo
+    sell_qty = np.where(-delta[sell_idx] >= held[sell_idx] * trading.SELL_TOLERANCE, held[sell_idx], -delta[sell_idx])
+    # Arredondamentos nunca podem pôr as compras acima do dinheiro disponível
+    available = cash + float(sell_qty @ px[sell_idx])
+    needed = float(delta[buy_idx] @ px[buy_idx])
+    scale = min(1.0, available / needed * (1 - 1e-9)) if needed > 0 else 1.0
+
+    sells = [(symbols[i], float(q), float(px[i])) for i, q in zip(sell_idx, sell_qty)]
+    buys = [(symbols[i], float(delta[i] * scale), float(px[i])) for i in buy_idx]
+    return sells, buys, equity
+
+def execute(user_id, sells, buys, timestamp=None):
+    # Vendas primeiro (o dinheiro paga as compras), tudo sem commit: se alguma parte falhar
+    # (posição mudou entretanto, saldo não chega) devolve False e o chamador faz rollback
+    if not trading.sell_many(user_id, sells, timestamp):
+        return False
+    return trading.buy_many(user_id, buys, timestamp)
@@ -0,0 +1,124 @@
+# responses.py
+# Camada de resposta das APIs JSON:
+#   - encoder orjson (quando instalado) no lugar do json da stdlib, com o mesmo resultado
+#     (chaves ordenadas, datas em formato HTTP como o Flask);
+#   - ETag + 304 para GETs com If-None-Match e gzip para corpos grandes (after_request);
+#   - @cached_json: substitui o @cache.cached nas rotas que o browser consulta repetidamente.
+#     Guarda na cache o corpo já serializado, o ETag (hash do conteúdo, estável enquanto o
+#     payload não muda, mesmo entre recargas da cache) e a versão gzip, por isso um poll
+#     só faz uma leitura da cache e, com o ETag certo, responde 304 sem tocar no corpo.
+import gzip
+import hashlib
+import json
+from functools import wraps
+from flask import current_app, request, make_response
+from flask.json.provider import DefaultJSONProvider, _default
+from extensions import cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MIN_COMPRESS = 1024 # bytes; abaixo disto o gzip não compensa
+GZIP_LEVEL = 6
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Datas passam pelo _default do Flask (http_date) para o JSON sair igual ao de antes
+    if orjson is not None:
+        OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                   | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def dump_bytes(self, obj):
+        try:
+            return orjson.dumps(obj, default=_default, option=self.OPTIONS)
+        except (TypeError, orjson.JSONEncodeError): # ex: inteiros > 64 bits
+            return super().dumps(obj, separators=(",", ":")).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs: # indent, cls... só o json da stdlib os percebe
+            return super().dumps(obj, **kwargs)
+        return self.dump_bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        body = self.dump_bytes(self._prepare_response_obj(args, kwargs)) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def _accepts_gzip():
+    return request.accept_encodings['gzip'] > 0
+
+def _compress(response):
+    response.set_data(gzip.compress(response.get_data(), GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+
+def _after_request(response):
+    # ETag/304 e gzip para qualquer resposta JSON que ainda não os tenha (ex: @cached_json)
+    if (response.mimetype != 'application/json' or response.status_code != 200
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    if request.method in ('GET', 'HEAD') and 'ETag' not in response.headers:
+        response.add_etag()
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    if response.content_length and response.content_length >= MIN_COMPRESS:
+        response.vary.add('Accept-Encoding')
+        if _accepts_gzip():
+            _compress(response)
+    return response
+
+def init_app(app):
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.after_request(_after_request)
+
+def _entry(app, payload):
+    # (etag, corpo, corpo gzip ou None): calculado uma vez por preenchimento da cache
+    if isinstance(app.json, OrjsonProvider):
+        body = app.json.dump_bytes(payload) + b"\n"
+    else:
+        body = app.json.dumps(payload, separators=(",", ":")).encode() + b"\n"
+    etag = hashlib.sha1(body).hexdigest()
+    compressed = gzip.compress(body, GZIP_LEVEL) if len(body) >= MIN_COMPRESS else None
+    return etag, body, compressed
+
+def cached_payload(path):
+    # Payload em cache de uma rota @cached_json (None se não houver), ex: para o snapshot.py
+    entry = cache.get(f"view/{path}")
+    return json.loads(entry[1]) if entry is not None else None
+
+def prime(path, payload, timeout):
+    # Põe na cache da rota @cached_json um payload vindo de fora (ex: restaurado do snapshot)
+    cache.set(f"view/{path}", _entry(current_app, payload), timeout=timeout)
+
+def cached_json(timeout=300):
+    # A view devolve o payload (dict/list); uma Response (ex: erro) passa sem ir para a cache
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = f"view/{request.path}" # mesma chave do @cache.cached (e das métricas da cache)
+            entry = cache.get(key)
+            if entry is None:
+                payload = view(*args, **kwargs)
+                if not isinstance(payload, (dict, list)):
+                    return payload
+                entry = _entry(current_app, payload)
+                cache.set(key, entry, timeout=timeout)
+            etag, body, compressed = entry
+            gzipped = compressed is not None and _accepts_gzip()
+            tag = f"{etag}-gz" if gzipped else etag
+            if request.if_none_match.contains(etag) or request.if_none_match.contains(f"{etag}-gz"):
+                response = make_response("", 304)
+            else:
+                response = current_app.response_class(compressed if gzipped else body, mimetype='application/json')
+                if gzipped:
+                    response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = 'no-cache' # revalida sempre (304 é barato)
+            if compressed is not None:
+                response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,245 @@
+# risk.py
+# Análise de risco da carteira do paper trading (página /risk): VaR/CVaR histórico e paramétrico,
+# volatilidade, beta ao BTC, matriz de correlação e simulação Monte Carlo do património futuro.
+#
+# Retornos = log-retornos diários dos fechos locais (market_data.daily_closes). A covariância do
+# universo de símbolos fica em memória e é atualizada de forma incremental: cada dia fechado novo
+# soma a sua contribuição às matrizes RᵀR / RᵀM / MᵀM e o dia que sai da janela é subtraído
+# (covariância "pairwise", moedas com histórico mais curto não cortam as outras).
+#
+# O Monte Carlo é vetorizado em NumPy (blocos de caminhos x dias x moedas) e, para muitos
+# caminhos, dividido por um pool de processos (um shard por CPU, seeds independentes).
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from statistics import NormalDist
+import multiprocessing
+from lazy_imports import np
+from extensions import db
+from models import User, Portfolio
+import market_data
+
+BENCHMARK = 'BTC'
+WINDOW_DAYS = 365
+TRADING_DAYS = 365 # cripto negoceia todos os dias
+DEFAULT_PATHS = 10000
+MAX_PATHS = 1000000 # monte_carlo() direto (bench/risk_mc.py)
+MAX_REQUEST_PATHS = 50000 # /api/risk: GET que o browser pode repetir
+MAX_HORIZON = 365
+POOL_MIN_PATHS = 200000 # abaixo disto o arranque/IPC do pool custa mais do que poupa
+POOL_WORKERS = os.cpu_count() or 1
+CHUNK_ELEMENTS = 2000000 # caminhos x dias x moedas por bloco (~16 MB em float64)
+BAND_PERCENTILES = (5, 25, 50, 75, 95)
+
+# --- COVARIÂNCIA INCREMENTAL ---
+
+class CovarianceCache:
+    def __init__(self, window=WINDOW_DAYS):
+        self.window = window
+        self._lock = threading.Lock()
+        self._reset([])
+
+    def _reset(self, symbols):
+        k = len(symbols)
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(symbols)}
+        self.rows = deque() # (dia, retornos com 0 onde falta, máscara)
+        self.last_day = None
+        self.latest = {} # último fecho conhecido (hoje: cotação ao vivo)
+        self.A = np.zeros((k, k)) # Σ r_i r_j
+        self.B = np.zeros((k, k)) # Σ r_i m_j
+        self.N = np.zeros((k, k)) # Σ m_i m_j (nº de dias com ambas)
+
+    def _accumulate(self, R, M, sign):
+        self.A += sign * (R.T @ R)
+        self.B += sign * (R.T @ M)
+        self.N += sign * (M.T @ M)
+
+    def update(self, symbols):
+        # Garante `symbols` no universo e acrescenta os dias fechados que ainda não estão nas matrizes.
+        # Um símbolo novo obriga a reconstruir (uma vez); depois cada dia novo custa O(k²).
+        today = datetime.utcnow().date()
+        with self._lock:
+            if not set(symbols) <= set(self.symbols):
+                self._reset(sorted(set(self.symbols) | set(symbols)))
+            since = self.last_day if self.last_day else today - timedelta(days=self.window + 1)
+            closes = market_data.daily_closes(self.symbols, since).reindex(columns=self.symbols)
+            if len(closes):
+                last = closes.ffill().iloc[-1]
+                self.latest = {s: float(v) for s, v in last.items() if v == v}
+            closed = closes[closes.index.date < today]
+            rets = np.log(closed).diff()
+            if self.last_day:
+                rets = rets[rets.index.date > self.last_day]
+            rets = rets.dropna(how='all')
+            if len(rets):
+                R = rets.to_numpy()
+                M = (~np.isnan(R)).astype(float)
+                R = np.nan_to_num(R)
+                self._accumulate(R, M, 1.0)
+                self.rows.extend(zip(rets.index.date, R, M))
+                self.last_day = rets.index[-1].date()
+            # Janela deslizante: tira os dias mais antigos
+            cutoff = today - timedelta(days=self.window)
+            old = []
+            while self.rows and self.rows[0][0] < cutoff:
+                old.append(self.rows.popleft())
+            if old:
+                self._accumulate(np.array([r for _, r, _ in old]), np.array([m for _, _, m in old]), -1.0)
+
+    def moments(self, symbols, psd=True):
+        # (média diária, covariância) pairwise para `symbols`; com psd=True a covariância é projetada
+        # na matriz semidefinida positiva mais próxima (necessário para o Monte Carlo)
+        idx = [self.index[s] for s in symbols]
+        with self._lock:
+            A, B, N = (X[np.ix_(idx, idx)].copy() for X in (self.A, self.B, self.N))
+        mu = np.divide(np.diag(B), np.diag(N), out=np.zeros(len(idx)), where=np.diag(N) > 0)
+        cov = np.divide(A - B * B.T / np.where(N > 0, N, 1), N - 1, out=np.zeros_like(A), where=N > 1)
+        if not psd:
+            return mu, cov
+        # Pares com pouco histórico em comum podem dar uma matriz não PSD: corta os valores próprios negativos
+        vals, vecs = np.linalg.eigh((cov + cov.T) / 2)
+        cov = (vecs * np.clip(vals, 0.0, None)) @ vecs.T
+        return mu, cov
+
+    def observations(self, symbols):
+        # Nº de dias com retorno na janela, por símbolo
+        with self._lock:
+            return {s: int(self.N[self.index[s], self.index[s]]) for s in symbols}
+
+    def returns(self, symbols):
+        # Matriz (dias x símbolos) dos retornos da janela; 0 onde a moeda ainda não tinha preço
+        idx = [self.index[s] for s in symbols]
+        with self._lock:
+            if not self.rows:
+                return np.zeros((0, len(idx)))
+            return np.array([r[idx] for _, r, _ in self.rows])
+
+covariance = CovarianceCache()
+
+# --- MONTE CARLO ---
+
+def simulate(mu, chol, values, cash, horizon, paths, seed, bands=False):
+    # Património ao fim de `horizon` dias em `paths` caminhos: r_t = mu + L z_t (log-retornos
+    # correlacionados), valor_i = v_i · exp(Σ r). Corre em blocos para limitar a memória.
+    # Com bands=True devolve também os percentis diários do primeiro bloco (para o gráfico).
+    rng = np.random.default_rng(seed)
+    k = len(values)
+    chunk = max(1000, CHUNK_ELEMENTS // max(1, horizon * k))
+    terminal = np.empty(paths)
+    band = None
+    for start in range(0, paths, chunk):
+        n = min(chunk, paths - start)
+        cum = (rng.standard_normal((n, horizon, k)) @ chol.T + mu).cumsum(axis=1)
+        equity = cash + np.exp(cum) @ values # (n, horizon)
+        terminal[start:start + n] = equity[:, -1]
+        if bands and band is None:
+            band = np.percentile(equity, BAND_PERCENTILES, axis=0)
+    return terminal, band
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    # Pool criado no primeiro uso (cada worker do gunicorn tem o seu). forkserver/spawn em vez de
+    # fork: o processo web tem threads (refresher, fan-out) que não se podem copiar a meio.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=ctx)
+    return _pool
+
+def monte_carlo(mu, cov, values, cash, horizon, paths, seed=None):
+    # Distribui os caminhos por shards com seeds independentes (SeedSequence.spawn)
+    values = np.asarray(values, dtype=float)
+    # Fator L com L Lᵀ = cov a partir dos valores próprios (a covariância pode ser singular)
+    vals, vecs = np.linalg.eigh(cov)
+    chol = vecs * np.sqrt(np.clip(vals, 0.0, None))
+    shards = POOL_WORKERS if paths >= POOL_MIN_PATHS and POOL_WORKERS > 1 else 1
+    seeds = np.random.SeedSequence(seed).spawn(shards)
+    sizes = [paths // shards + (1 if i < paths % shards else 0) for i in range(shards)]
+    if shards == 1:
+        return simulate(mu, chol, values, cash, horizon, paths, seeds[0], bands=True)
+    futures = [_get_pool().submit(simulate, mu, chol, values, cash, horizon, n, s, i == 0)
+               for i, (n, s) in enumerate(zip(sizes, seeds))]
+    results = [f.result() for f in futures]
+    return np.concatenate([t for t, _ in results]), results[0][1]
+
+# --- RELATÓRIO ---
+
+def report(user_id, paths=DEFAULT_PATHS, horizon=30, confidence=0.95, seed=None):
+    user = db.session.get(User, user_id)
+    positions = db.session.execute(
+        db.select(Portfolio.symbol, Portfolio.amount, Portfolio.avg_price).where(Portfolio.user_id == user_id)).all()
+    cash = user.virtual_balance
+    if not positions:
+        return {'empty': True, 'cash': cash}
+
+    symbols = sorted(p.symbol for p in positions)
+    covariance.update(symbols + [BENCHMARK])
+    held = {p.symbol: p.amount * covariance.latest.get(p.symbol, p.avg_price) for p in positions}
+    values = np.array([held[s] for s in symbols])
+    exposure = float(values.sum())
+    equity = cash + exposure
+
+    universe = symbols + ([BENCHMARK] if BENCHMARK not in symbols else [])
+    mu_all, cov_all = covariance.moments(universe)
+    k = len(symbols)
+    mu, cov = mu_all[:k], cov_all[:k, :k]
+    z = NormalDist().inv_cdf(confidence)
+
+    # Histórico: P&L de 1 dia da carteira atual em cada dia da janela
+    pnl = covariance.returns(symbols) @ values
+    if len(pnl):
+        var_hist = -float(np.quantile(pnl, 1 - confidence))
+        tail = pnl[pnl <= -var_hist]
+        cvar_hist = -float(tail.mean()) if len(tail) else var_hist
+    else:
+        var_hist = cvar_hist = 0.0
+
+    # Paramétrico (normal)
+    mu_p = float(values @ mu)
+    sd_p = math.sqrt(max(float(values @ cov @ values), 0.0))
+    var_param = z * sd_p - mu_p
+    cvar_param = sd_p * math.exp(-z * z / 2) / math.sqrt(2 * math.pi) / (1 - confidence) - mu_p
+    # O mesmo no horizonte do Monte Carlo (retornos i.i.d.: média x T, desvio x √T), para comparar
+    scale = math.sqrt(horizon)
+    var_param_h = z * sd_p * scale - mu_p * horizon
+    cvar_param_h = (cvar_param + mu_p) * scale - mu_p * horizon
+
+    weights = values / exposure if exposure > 0 else values
+    b = universe.index(BENCHMARK)
+    beta = float(weights @ cov_all[:k, b] / cov_all[b, b]) if cov_all[b, b] > 0 else None
+    sd = np.sqrt(np.diag(cov))
+    corr = np.divide(cov, np.outer(sd, sd), out=np.zeros_like(cov), where=np.outer(sd, sd) > 0)
+    np.fill_diagonal(corr, 1.0)
+
+    terminal, band = monte_carlo(mu, cov, values, cash, horizon, paths, seed)
+    q = np.percentile(terminal, [100 * (1 - confidence), 50])
+    mc_tail = terminal[terminal <= q[0]]
+    counts, edges = np.histogram(terminal, bins=40)
+
+    return {
+        'equity': equity, 'cash': cash, 'exposure': exposure, 'confidence': confidence,
+        'observations': int(len(pnl)),
+        'positions': [{'symbol': s, 'value': float(v), 'weight': float(w)} for s, v, w in zip(symbols, values, weights)],
+        # VaR/CVaR por método; 'horizon_days' diz a que horizonte se refere cada um
+        'horizon_days': {'historical': 1, 'parametric': 1, 'parametric_horizon': horizon, 'monte_carlo': horizon},
+        'var': {'historical': var_hist, 'parametric': var_param, 'parametric_horizon': var_param_h,
+                'monte_carlo': equity - float(q[0])},
+        'cvar': {'historical': cvar_hist, 'parametric': cvar_param, 'parametric_horizon': cvar_param_h,
+                 'monte_carlo': equity - float(mc_tail.mean()) if len(mc_tail) else 0.0},
+        'volatility': {'daily': sd_p / equity if equity else 0.0,
+                       'annual': sd_p / equity * math.sqrt(TRADING_DAYS) if equity else 0.0},
+        'beta': beta,
+        'correlation': {'symbols': symbols, 'matrix': np.round(corr, 3).tolist()},
+        'monte_carlo': {'paths': paths, 'horizon': horizon, 'median': float(q[1]),
+                        'bands': {str(p): np.round(b, 2).tolist() for p, b in zip(BAND_PERCENTILES, band)},
+                        'histogram': {'counts': counts.tolist(), 'edges': np.round(edges, 2).tolist()}},
+    }
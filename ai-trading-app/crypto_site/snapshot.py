@@ -0,0 +1,133 @@
+# snapshot.py
+# Snapshot local do estado de mercado para arranques "quentes": depois de um deploy ou de um
+# restart os workers servem logo os últimos dados conhecidos (um pouco velhos) e atualizam-nos em
+# background, em vez de a primeira vaga de utilizadores disparar ao mesmo tempo os downloads do
+# Yahoo e dos feeds RSS em todos os workers.
+#
+# Em SNAPSHOT_DIR ficam dois ficheiros:
+#   - market-<ms>.npy: barras de 1 minuto de todos os símbolos (float64, n x 6) num só array,
+#     lido com mmap (open_memmap): só as páginas tocadas saem do disco/page cache;
+#   - market.json: índice (símbolo -> posição no array, última cotação) e os payloads das rotas
+#     @cached_json de VIEWS (notícias, recomendações).
+# O .npy novo é escrito antes do índice e os dois com os.replace, por isso quem lê vê sempre um
+# par completo. A gravação é uma tarefa do jobs.coordinator com um líder por nó (local=True), a
+# cada SNAPSHOT_INTERVAL segundos; cada worker restaura ao arrancar (start_background_jobs).
+#
+# Depois de restaurar: as cotações mantêm o timestamp original (quem exige preços frescos não as
+# usa), os movers contam a idade do snapshot e o 1º pedido atualiza-os em background, e as
+# rotas em cache expiram com jitter para os workers não irem todos aos feeds no mesmo segundo.
+import glob
+import json
+import os
+import random
+import time
+from lazy_imports import np
+from metrics import record_error
+import market_data
+import movers
+import responses
+
+VERSION = 1
+VIEWS = ('/api/news', '/get_recommendations') # rotas @cached_json guardadas no snapshot
+VIEW_TTL = 300 # timeout dessas rotas; restauradas ficam entre metade e o total (jitter)
+
+class MarketSnapshot:
+    def __init__(self):
+        self.app = None
+        self.directory = None
+        self.max_age = 900
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config['SNAPSHOT_DIR']
+        self.max_age = app.config['SNAPSHOT_MAX_AGE']
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.directory, "market.json")
+
+    def _read_index(self):
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get('version') == VERSION else None
+
+    def _write(self, path, write):
+        # Escrita atómica: ficheiro temporário na mesma pasta + os.replace
+        tmp = os.path.join(self.directory, f".{os.path.basename(path)}.tmp")
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+
+    # --- GRAVAÇÃO ---
+
+    def save(self):
+        # Grava o estado deste processo; o que ele não tem (ex: notícias que só outro worker pediu)
+        # fica como estava no snapshot anterior. Devolve o nº de símbolos gravados.
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self._read_index() or {}
+        now = time.time()
+        fresh = lambda at: at is not None and now - at <= self.max_age
+        index = {'version': VERSION, 'saved_at': now, 'bars': None, 'bars_at': None, 'symbols': [],
+                 'views': {path: item for path, item in previous.get('views', {}).items() if fresh(item['at'])}}
+        if fresh(previous.get('bars_at')):
+            index.update(bars=previous['bars'], bars_at=previous['bars_at'], symbols=previous['symbols'])
+
+        exported = market_data.prices.export()
+        if exported:
+            blocks, symbols, offset = [], [], 0
+            for sym, (bars, (price, ts)) in sorted(exported.items()):
+                blocks.append(bars)
+                symbols.append([sym, offset, len(bars), price, ts])
+                offset += len(bars)
+            name = f"market-{int(now * 1000)}.npy"
+            self._write(os.path.join(self.directory, name), lambda f: np.save(f, np.concatenate(blocks)))
+            index.update(bars=name, bars_at=now, symbols=symbols)
+
+        for path in VIEWS:
+            payload = responses.cached_payload(path)
+            if payload:
+                index['views'][path] = {'at': now, 'payload': payload}
+
+        if not index['bars'] and not index['views']:
+            return 0
+        self._write(self._index_path, lambda f: f.write(json.dumps(index, separators=(",", ":")).encode()))
+        # Arrays antigos: quem ainda os tem em mmap continua a lê-los (o ficheiro só some no close)
+        for old in glob.glob(os.path.join(self.directory, "market-*.npy")):
+            if os.path.basename(old) != index['bars']:
+                os.remove(old)
+        return len(index['symbols'])
+
+    # --- RESTAURO ---
+
+    def load(self):
+        # Restaura neste processo o que tiver menos de SNAPSHOT_MAX_AGE segundos. Símbolos que já
+        # têm dados vivos não são tocados. Devolve o nº de símbolos restaurados.
+        index = self._read_index()
+        if index is None:
+            return 0
+        now = time.time()
+        restored = 0
+        if index['bars'] and now - index['bars_at'] <= self.max_age:
+            try:
+                # = np.load(mmap_mode='r'); o np.load aqui seria o LazyModule.load
+                bars = np.lib.format.open_memmap(os.path.join(self.directory, index['bars']), mode='r')
+            except (OSError, ValueError) as e:
+                record_error("snapshot.load", e)
+                bars = None
+            if bars is not None:
+                for sym, start, count, price, ts in index['symbols']:
+                    ring = market_data.prices.ring(sym)
+                    if ring is None or not ring.count:
+                        market_data.prices.restore(sym, bars[start:start + count], (price, ts))
+                        restored += 1
+                movers.tracker.backdate(index['bars_at'])
+        with self.app.app_context():
+            for path, item in index['views'].items():
+                if path in VIEWS and now - item['at'] <= self.max_age:
+                    responses.prime(path, item['payload'], timeout=int(VIEW_TTL * random.uniform(0.5, 1.0)))
+        return restored
+
+market = MarketSnapshot()
@@ -0,0 +1,210 @@
+# trading.py
+# Operações de saldo/posições do paper trading feitas com UPDATEs atómicos na BD.
+#
+# Nada de ler o saldo para o Python, mexer e voltar a gravar: cada alteração é um único
+# "UPDATE ... SET virtual_balance = virtual_balance - :custo WHERE virtual_balance >= :custo"
+# ou um upsert em (user_id, symbol). Assim dois pedidos do mesmo utilizador, ou vários
+# workers do gunicorn, não perdem atualizações nem deixam saldos/posições negativos.
+#
+# As funções não fazem commit (exceto buy/sell com commit=True) para poderem ser agrupadas
+# numa única transação pelo chamador (ex: motor de ordens, copy trade).
+# Quem muda o saldo avisa a cache de utilizadores (usercache.users.changed), que o ORM não vê.
+from datetime import datetime
+from sqlalchemy import bindparam
+from extensions import db
+from models import User, Portfolio, Transaction, Order, LedgerCheckpoint
+from usercache import users as user_cache
+
+DUST = 0.000001 # posições abaixo disto são apagadas
+SELL_TOLERANCE = 0.99999 # permite vender "tudo" apesar de arredondamentos
+
+# Statements construídos uma só vez (o motor de ordens chama isto milhares de vezes por passagem)
+_users = User.__table__
+_positions = Portfolio.__table__
+_transactions = Transaction.__table__
+
+_DEBIT = (_users.update()
+          .where(_users.c.id == bindparam('uid'), _users.c.virtual_balance >= bindparam('value'))
+          .values(virtual_balance=_users.c.virtual_balance - bindparam('value')))
+_CREDIT = (_users.update()
+           .where(_users.c.id == bindparam('uid'))
+           .values(virtual_balance=_users.c.virtual_balance + bindparam('value')))
+_REDUCE = (_positions.update()
+           .where(_positions.c.user_id == bindparam('uid'), _positions.c.symbol == bindparam('sym'),
+                  _positions.c.amount >= bindparam('qty') * SELL_TOLERANCE)
+           .values(amount=_positions.c.amount - bindparam('qty')))
+_DROP_DUST = (_positions.delete()
+              .where(_positions.c.user_id == bindparam('uid'), _positions.c.symbol == bindparam('sym'),
+                     _positions.c.amount <= DUST))
+_NEW_AVG = ((_positions.c.amount * _positions.c.avg_price + bindparam('qty') * bindparam('px'))
+            / (_positions.c.amount + bindparam('qty')))
+_upserts = {} # dialeto -> statement
+
+def _upsert_for(dialect):
+    stmt = _upserts.get(dialect)
+    if stmt is not None:
+        return stmt
+    values = {'user_id': bindparam('uid'), 'symbol': bindparam('sym'),
+              'amount': bindparam('qty'), 'avg_price': bindparam('px')}
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(_positions).values(values).on_conflict_do_update(
+            index_elements=['user_id', 'symbol'],
+            set_={'avg_price': _NEW_AVG, 'amount': _positions.c.amount + bindparam('qty')})
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        # No MySQL as atribuições correm por ordem: o avg_price tem de vir antes do amount
+        stmt = insert(_positions).values(values).on_duplicate_key_update(
+            [('avg_price', _NEW_AVG), ('amount', _positions.c.amount + bindparam('qty'))])
+    else:
+        stmt = False # sem upsert nativo: UPDATE e, se não existir, INSERT
+    _upserts[dialect] = stmt
+    return stmt
+
+def _dialect():
+    return db.session.get_bind(mapper=Portfolio.__mapper__).dialect
+
+def debit(user_id, cost):
+    # Retira `cost` do saldo só se houver saldo suficiente. Devolve True/False.
+    user_cache.changed(user_id)
+    return db.session.execute(_DEBIT, {'uid': user_id, 'value': cost}).rowcount == 1
+
+def credit(user_id, value):
+    user_cache.changed(user_id)
+    db.session.execute(_CREDIT, {'uid': user_id, 'value': value})
+
+def add_position(user_id, symbol, amount, price):
+    # Upsert em (user_id, symbol): soma a quantidade e recalcula o preço médio na própria BD
+    params = {'uid': user_id, 'sym': symbol, 'qty': amount, 'px': price}
+    stmt = _upsert_for(_dialect().name)
+    if stmt is not False:
+        db.session.execute(stmt, params)
+        return
+    updated = db.session.execute(
+        _positions.update()
+        .where(_positions.c.user_id == bindparam('uid'), _positions.c.symbol == bindparam('sym'))
+        .values(avg_price=_NEW_AVG, amount=_positions.c.amount + bindparam('qty')), params)
+    if updated.rowcount == 0:
+        db.session.execute(db.insert(Portfolio).values(user_id=user_id, symbol=symbol, amount=amount, avg_price=price))
+
+def remove_position(user_id, symbol, amount):
+    # Retira `amount` da posição só se existir quantidade suficiente. Devolve a quantidade
+    # efetivamente retirada (0 se falhou); vender ~tudo fecha a posição.
+    params = {'uid': user_id, 'sym': symbol, 'qty': amount}
+    if db.session.execute(_REDUCE, params).rowcount != 1:
+        return 0.0
+    db.session.execute(_DROP_DUST, params)
+    return amount
+
+def upsert_positions(rows):
+    # Vários upserts numa só ida à BD (executemany). rows = [(user_id, símbolo, quantidade, preço)]
+    stmt = _upsert_for(_dialect().name)
+    if stmt is False:
+        for uid, sym, qty, px in rows:
+            add_position(uid, sym, qty, px)
+    elif rows:
+        db.session.execute(stmt, [{'uid': uid, 'sym': sym, 'qty': qty, 'px': px} for uid, sym, qty, px in rows])
+
+def credit_many(values):
+    # Créditos de vários utilizadores num executemany. values = [(user_id, valor)]
+    if values:
+        user_cache.changed(*(uid for uid, _ in values))
+        db.session.execute(_CREDIT, [{'uid': uid, 'value': value} for uid, value in values])
+
+def buy_many(user_id, fills, timestamp=None):
+    # Compra um cabaz inteiro: 1 débito condicional do total + upserts em lote + transações em lote.
+    # Número de idas à BD constante, seja qual for o tamanho do cabaz. Devolve False se o saldo não chegar.
+    fills = [(sym, qty, px) for sym, qty, px in fills if qty > 0]
+    if not fills:
+        return True
+    if not debit(user_id, sum(qty * px for _, qty, px in fills)):
+        return False
+    upsert_positions([(user_id, sym, qty, px) for sym, qty, px in fills])
+    insert_transactions([record(user_id, sym, 'BUY', px, qty, timestamp) for sym, qty, px in fills])
+    return True
+
+def sell_many(user_id, fills, timestamp=None):
+    # Vende várias moedas de uma vez: 1 UPDATE condicional para todas as posições (quantidade por
+    # símbolo num CASE), pó apagado de uma vez, 1 crédito do total e transações em lote.
+    # Tudo ou nada: devolve False se faltar quantidade numa delas (o chamador faz rollback).
+    fills = [(sym, qty, px) for sym, qty, px in fills if qty > 0]
+    if not fills:
+        return True
+    qty = db.case({sym: q for sym, q, _ in fills}, value=_positions.c.symbol)
+    mine = (_positions.c.user_id == user_id) & _positions.c.symbol.in_([sym for sym, _, _ in fills])
+    reduced = db.session.execute(
+        _positions.update().where(mine, _positions.c.amount >= qty * SELL_TOLERANCE)
+        .values(amount=_positions.c.amount - qty)).rowcount
+    if reduced != len(fills):
+        return False
+    db.session.execute(_positions.delete().where(mine, _positions.c.amount <= DUST))
+    credit(user_id, sum(q * px for _, q, px in fills))
+    insert_transactions([record(user_id, sym, 'SELL', px, q, timestamp) for sym, q, px in fills])
+    return True
+
+def liquidate(user_id, prices=None, timestamp=None):
+    # Vende todas as posições do utilizador (ao preço de `prices` ou, sem cotação, ao preço médio).
+    # As linhas são apagadas e lidas no mesmo statement (DELETE ... RETURNING), por isso uma
+    # compra concorrente nunca é "vendida" sem ficar registada. Devolve [(símbolo, qtd, preço)].
+    prices = prices or {}
+    mine = _positions.c.user_id == user_id
+    if _dialect().delete_returning:
+        rows = db.session.execute(
+            _positions.delete().where(mine).returning(_positions.c.symbol, _positions.c.amount, _positions.c.avg_price)).all()
+    else:
+        rows = db.session.execute(
+            db.select(_positions.c.symbol, _positions.c.amount, _positions.c.avg_price).where(mine).with_for_update()).all()
+        db.session.execute(_positions.delete().where(mine))
+    sold = [(sym, qty, prices.get(sym, avg)) for sym, qty, avg in rows]
+    if sold:
+        credit(user_id, sum(qty * px for _, qty, px in sold))
+        insert_transactions([record(user_id, sym, 'SELL', px, qty, timestamp) for sym, qty, px in sold])
+    return sold
+
+def reset_account(user_id, balance=10000.0):
+    # Apaga posições, transações, ordens e o checkpoint do ledger e repõe o saldo.
+    # Devolve os ids das ordens que estavam abertas.
+    open_ids = db.session.execute(db.select(Order.id).where(Order.user_id == user_id, Order.status == 'OPEN')).scalars().all()
+    for model in (Order, Portfolio, Transaction, LedgerCheckpoint):
+        db.session.execute(db.delete(model).where(model.user_id == user_id).execution_options(synchronize_session=False))
+    user_cache.changed(user_id)
+    db.session.execute(db.update(User).where(User.id == user_id).values(virtual_balance=balance)
+                       .execution_options(synchronize_session=False))
+    return open_ids
+
+def insert_transactions(rows):
+    # Bulk insert direto na tabela (sem o caminho ORM: milhares de linhas por lote no fan-out)
+    if rows:
+        db.session.execute(_transactions.insert(), rows)
+
+def record(user_id, symbol, side, price, amount, timestamp=None):
+    # Linha para a tabela de transações (inserida em lote pelo chamador)
+    return {'user_id': user_id, 'symbol': symbol, 'type': side, 'price': price, 'amount': amount,
+            'total_value': amount * price, 'timestamp': timestamp or datetime.utcnow()}
+
+def buy(user_id, symbol, amount, price, commit=True):
+    # Compra a mercado. Devolve False (sem alterar nada) se o saldo não chegar.
+    if not debit(user_id, amount * price):
+        if commit:
+            db.session.rollback() # liberta já o lock de escrita
+        return False
+    add_position(user_id, symbol, amount, price)
+    insert_transactions([record(user_id, symbol, 'BUY', price, amount)])
+    if commit:
+        db.session.commit()
+    return True
+
+def sell(user_id, symbol, amount, price, commit=True):
+    # Venda a mercado. Devolve False (sem alterar nada) se não houver moedas suficientes.
+    if not remove_position(user_id, symbol, amount):
+        if commit:
+            db.session.rollback()
+        return False
+    credit(user_id, amount * price)
+    insert_transactions([record(user_id, symbol, 'SELL', price, amount)])
+    if commit:
+        db.session.commit()
+    return True
@@ -0,0 +1,214 @@
+# usercache.py
+# Cache do utilizador autenticado e das quotas do plano, para os pedidos não irem à BD só para
+# saber quem é o utilizador (load_user corre em todos os pedidos) ou quantos alertas/favoritos tem.
+#
+# UserCache guarda as colunas do User (sem a password, que é carregada só quando for lida) e as
+# contagens de watchlist/alertas ativos durante USER_CACHE_TTL segundos. O User volta à sessão com
+# merge(load=False): um objeto persistente sem SELECT, com lazy loading normal nas relações.
+# Invalidação:
+#   - writes pelo ORM (User, Watchlist, PriceAlert) são apanhados no flush e a entrada é apagada
+#     depois do commit; os UPDATEs diretos ao saldo (trading.py, copy trade) avisam com changed();
+#   - entre workers (a cache é por processo): um cliente que escreveu tem na sessão o instante da
+#     escrita (dbrouting.WRITE_MARK) e uma entrada mais antiga que isso é ignorada, por isso quem
+#     faz um trade ou muda de plano vê logo o resultado em qualquer worker. Alterações feitas por
+#     outros (seguidores do copy trade, ordens executadas em background) aparecem no máximo ao
+#     fim do TTL nos outros workers.
+#
+# QuotaCounter conta as análises de AI do dia em memória e grava-as na BD em lote a cada
+# QUOTA_FLUSH_SECONDS (UPDATE ... SET ai_usage_count = ai_usage_count + :n), em vez de um commit
+# por análise e outro para o reset diário. A verificação do limite lê a utilização gravada da BD
+# (não a da cache do utilizador) e soma as pendentes deste processo; as pendentes dos outros
+# workers não se veem. Com N workers um utilizador pode por isso passar o limite em no máximo
+# (N-1) x as análises que faz em QUOTA_FLUSH_SECONDS (com 0 cada análise é gravada logo).
+import atexit
+import threading
+import time
+from datetime import date
+from flask import session, has_app_context, has_request_context
+from sqlalchemy import bindparam, case, event, func, or_
+from sqlalchemy.orm import Session, make_transient_to_detached
+from extensions import db, cache
+from metrics import record_error
+from models import User, Watchlist, PriceAlert
+import dbrouting
+
+_COLUMNS = [c.key for c in User.__table__.columns if c.key != 'password']
+_PENDING = 'usercache_changed' # Session.info: ids alterados na transação em curso
+
+def _key(user_id):
+    return f"user/{user_id}"
+
+def _written_at():
+    # Instante da última escrita deste cliente (0 fora de pedidos)
+    return session.get(dbrouting.WRITE_MARK, 0) if has_request_context() else 0
+
+class UserCache:
+    def __init__(self):
+        self.ttl = 30
+
+    def init_app(self, app):
+        self.ttl = app.config['USER_CACHE_TTL']
+
+    def _entry(self, user_id):
+        if not self.ttl:
+            return None
+        entry = cache.get(_key(user_id))
+        if entry is not None and entry['at'] < _written_at():
+            return None
+        return entry
+
+    def get(self, user_id):
+        # User para o Flask-Login: da cache (sem SELECT) ou da BD
+        entry = self._entry(user_id)
+        if entry is None:
+            user = db.session.get(User, user_id)
+            if user is not None and self.ttl:
+                cache.set(_key(user_id), {'at': time.time(), 'user': {c: getattr(user, c) for c in _COLUMNS}},
+                          timeout=self.ttl)
+            return user
+        user = User(**entry['user'])
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def count(self, user_id, kind):
+        # Nº de favoritos ('watchlist') ou de alertas ativos ('alerts'), para os limites do plano
+        entry = self._entry(user_id)
+        if entry is not None and kind in entry:
+            return entry[kind]
+        if kind == 'watchlist':
+            query = db.select(func.count()).select_from(Watchlist).where(Watchlist.user_id == user_id)
+        else:
+            query = (db.select(func.count()).select_from(PriceAlert)
+                     .where(PriceAlert.user_id == user_id, PriceAlert.is_active.is_(True)))
+        value = db.session.execute(query).scalar()
+        if entry is not None:
+            entry[kind] = value
+            cache.set(_key(user_id), entry, timeout=self.ttl)
+        return value
+
+    def changed(self, *user_ids):
+        # Regista utilizadores alterados fora do ORM; a entrada cai depois do commit
+        db.session.info.setdefault(_PENDING, set()).update(user_ids)
+
+    def invalidate(self, *user_ids):
+        if user_ids:
+            cache.delete_many(*[_key(uid) for uid in user_ids])
+
+users = UserCache()
+
+@event.listens_for(Session, "after_flush")
+def _collect(sess, flush_context):
+    changed = sess.info.setdefault(_PENDING, set())
+    for obj in (*sess.new, *sess.dirty, *sess.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, (Watchlist, PriceAlert)):
+            changed.add(obj.user_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate(sess):
+    changed = sess.info.pop(_PENDING, None)
+    if changed and has_app_context():
+        users.invalidate(*changed)
+
+@event.listens_for(Session, "after_rollback")
+def _discard(sess):
+    sess.info.pop(_PENDING, None)
+
+# --- QUOTA DE AI ---
+
+_users = User.__table__
+# Soma ao dia em curso; se a última utilização gravada é de outro dia, começa do zero.
+# Não recua o dia se outro worker já gravou uma data mais recente (lote antigo à meia-noite).
+_ADD_USAGE = (_users.update()
+              .where(_users.c.id == bindparam('uid'),
+                     or_(_users.c.last_ai_usage.is_(None), _users.c.last_ai_usage <= bindparam('day')))
+              .values(ai_usage_count=case((_users.c.last_ai_usage == bindparam('day'),
+                                           _users.c.ai_usage_count + bindparam('n')),
+                                          (bindparam('n') > 0, bindparam('n')), else_=0), # n < 0: refund
+                      last_ai_usage=bindparam('day')))
+
+class QuotaCounter:
+    def __init__(self):
+        self.app = None
+        self.interval = 5
+        self._pending = {} # (user_id, dia) -> análises ainda não gravadas
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config['QUOTA_FLUSH_SECONDS']
+        app.after_request(self._flush_due)
+        atexit.register(self._flush_at_exit)
+
+    def _saved(self, user_id, today):
+        # Utilização gravada, lida da BD: a cópia na cache do utilizador pode ter até USER_CACHE_TTL
+        count, day = db.session.execute(
+            db.select(_users.c.ai_usage_count, _users.c.last_ai_usage).where(_users.c.id == user_id)).one()
+        return (count or 0) if day == today else 0
+
+    def used(self, user):
+        # Análises de hoje: as gravadas (se a data for de hoje) mais as pendentes neste processo
+        today = date.today()
+        return self._saved(user.id, today) + self._pending.get((user.id, today), 0)
+
+    def add(self, user_id):
+        key = (user_id, date.today())
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+        if not self.interval:
+            self.flush()
+        return key
+
+    def charge(self, user_id, limit):
+        # Conta uma análise só se ainda houver quota hoje (verificação e soma juntas neste processo).
+        # Devolve a chave para o refund(), ou None se o limite já foi atingido.
+        key = (user_id, date.today())
+        saved = self._saved(*key)
+        with self._lock:
+            if saved + self._pending.get(key, 0) >= limit:
+                return None
+            self._pending[key] = self._pending.get(key, 0) + 1
+        if not self.interval:
+            self.flush()
+        return key
+
+    def refund(self, key):
+        # Anula uma análise cobrada que falhou (pode correr fora de um pedido: grava no próximo flush)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) - 1
+
+    def flush(self):
+        # Grava os contadores pendentes (um executemany numa ligação própria, fora da sessão do pedido)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        rows = [{'uid': uid, 'day': day, 'n': n} for (uid, day), n in pending.items()]
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(_ADD_USAGE, rows)
+        except Exception:
+            with self._lock: # devolve ao contador para a próxima tentativa
+                for key, n in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + n
+            raise
+        users.invalidate(*{uid for uid, _ in pending})
+        return len(rows)
+
+    def _flush_due(self, response):
+        if self._pending and time.monotonic() - self._last_flush >= self.interval:
+            try:
+                self.flush()
+            except Exception as e:
+                record_error("quota_flush", e)
+        return response
+
+    def _flush_at_exit(self):
+        if self._pending:
+            with self.app.app_context():
+                self.flush()
+
+ai_quota = QuotaCounter()
@@ -1,20 +1,28 @@
 # utils.py
 import os
-import requests
-import feedparser
-import yfinance as yf
-from google import genai
-from google.genai import types
-from extensions import cache
+import threading
+from lazy_imports import yf, requests, genai
+from metrics import track_upstream, record_error
+import archive
+import coins
+import movers
 
 # Configuração da AI
+# O cliente é criado só no primeiro uso (e por worker, nunca no master antes do fork)
 API_KEY = os.getenv("GENAI_API_KEY")
-client = None
-if API_KEY:
-    try:
-        client = genai.Client(api_key=API_KEY)
-    except:
-        print("Erro ao iniciar AI")
+_client = None
+_client_lock = threading.Lock()
+
+def get_ai_client():
+    global _client
+    if _client is None and API_KEY:
+        with _client_lock:
+            if _client is None:
+                try:
+                    _client = genai.Client(api_key=API_KEY)
+                except Exception as e:
+                    record_error("genai_client", e)
+    return _client
 
 def smart_format(value):
     if value is None: return "$0.00"
@@ -65,7 +73,8 @@ def get_user_badges(user):
 
     # --- 3. BADGES DE CONQUISTAS (Gamification) ---
     # Primeiro Trade
-    if user.transactions and len(user.transactions) > 0:
+    trades = archive.store.count(user.id) # COUNT + metadados do arquivo (sem carregar as linhas)
+    if trades > 0:
         badges.append({
             'icon': 'fa-rocket', 
             'color': '#3498db', 
@@ -74,7 +83,7 @@ def get_user_badges(user):
         })
 
     # Veterano (+10 Trades)
-    if user.transactions and len(user.transactions) >= 10:
+    if trades >= 10:
         badges.append({
             'icon': 'fa-medal', 
             'color': '#9b59b6', 
@@ -98,107 +107,75 @@ def get_stock_price(symbol):
     try:
         # Tenta pegar preço rápido
         ticker = yf.Ticker(symbol)
-        price = ticker.fast_info.last_price
+        with track_upstream('yahoo'):
+            price = ticker.fast_info.last_price
         return price
     except:
         return None
 
+def lookup_price(symbol):
+    # Como o get_stock_price, mas distingue as falhas: (preço, False), (None, True) se o Yahoo
+    # respondeu sem dados para o símbolo (desconhecido) e (None, False) se a chamada falhou
+    try:
+        ticker = yf.Ticker(symbol)
+        with track_upstream('yahoo'):
+            price = ticker.fast_info.last_price
+    except KeyError: # resposta sem os campos do preço: o Yahoo não conhece o símbolo
+        return None, True
+    except Exception as e:
+        record_error("lookup_price", e)
+        return None, False
+    if price is None or price != price: # None/NaN
+        return None, True
+    return price, False
+
 def get_market_sentiment():
     try:
-        response = requests.get("https://api.alternative.me/fng/?limit=1", timeout=5)
-        data = response.json()
+        with track_upstream('feargreed'):
+            response = requests.get("https://api.alternative.me/fng/?limit=1", timeout=5)
+            data = response.json()
         value = int(data['data'][0]['value'])
         classification = data['data'][0]['value_classification']
         return {"value": value, "text": classification}
-    except:
+    except Exception as e:
+        record_error("get_market_sentiment", e)
         return {"value": 50, "text": "Neutral (Offline)"}
 
-def get_market_movers():
-    tickers = ['BTC-USD', 'ETH-USD', 'SOL-USD', 'XRP-USD', 'DOGE-USD', 'ADA-USD', 'AVAX-USD', 'LINK-USD', 'SHIB-USD', 'DOT-USD']
-    movers_data = []
-    try:
-        tickers_str = " ".join(tickers)
-        data = yf.download(tickers_str, period="2d", progress=False)['Close']
-        for t in tickers:
-            try:
-                # Tratar caso de indexação do yfinance
-                if len(tickers) == 1:
-                     current = data.iloc[-1]
-                     prev = data.iloc[-2]
-                else:
-                    current = data[t].iloc[-1]
-                    prev = data[t].iloc[-2]
-                
-                change = ((current - prev) / prev) * 100
-                symbol = t.replace('-USD', '')
-                movers_data.append({'symbol': symbol, 'change': change, 'price': current})
-            except: continue
-            
-        movers_data.sort(key=lambda x: x['change'], reverse=True)
-        # Gainers (Top 3), Losers (Bottom 3 ordenados do pior para o melhor visualmente)
-        return movers_data[:3], sorted(movers_data[-3:], key=lambda x: x['change'])
-    except:
-        return [], []
+# Maiores moedas por capitalização (sem stablecoins), pela ordem do coins.KNOWN
+TOP_CRYPTOS = [symbol for symbol, _ in coins.KNOWN if symbol not in coins.STABLECOINS]
+
+def get_market_movers(k=3):
+    # Top gainers e losers (do pior para o melhor) das últimas 24h: leituras O(K) do movers.tracker,
+    # que os ticks do feed de preços mantêm ordenado
+    movers.tracker.ensure_fresh()
+    return movers.tracker.gainers(k), movers.tracker.losers(k)
 
-@cache.memoize(timeout=120)
 def get_top_cryptos(limit=5):
-    # Lista segura e estável
-    top_tickers = [
-        'BTC-USD', 'ETH-USD', 'SOL-USD', 'BNB-USD', 'XRP-USD', 
-        'DOGE-USD', 'ADA-USD', 'AVAX-USD', 'TRX-USD', 'LINK-USD', 
-        'DOT-USD', 'LTC-USD', 'BCH-USD', 'SHIB-USD', 'ADA-USD'
-    ]
-    limit = min(limit, len(top_tickers))
-    selected = top_tickers[:limit]
+    movers.tracker.ensure_fresh()
     data = []
-    try:
-        tickers = yf.Tickers(" ".join(selected))
-        for symbol in selected:
-            try:
-                ticker_obj = tickers.tickers.get(symbol)
-                if not ticker_obj: continue
-                info = ticker_obj.fast_info
-                
-                price = info.last_price
-                prev_close = info.previous_close
-                if price is None or prev_close is None: continue
-                
-                change_pct = ((price - prev_close) / prev_close) * 100
-                clean_symbol = symbol.replace("-USD", "")
-                
-                supported_icons = ['BTC', 'ETH', 'SOL', 'BNB', 'XRP', 'DOGE', 'ADA', 'AVAX', 'LTC', 'BCH', 'DOT', 'LINK']
-                if clean_symbol in supported_icons:
-                    icon_class = f"fa-brands fa-{clean_symbol.lower()}"
-                else:
-                    icon_class = "fa-solid fa-coins"
-
-                data.append({
-                    "symbol": clean_symbol,
-                    "price": smart_format(price),
-                    "change": f"{change_pct:+.2f}%",
-                    "change_raw": change_pct,
-                    "icon": icon_class,
-                    "color": "text-green" if change_pct >= 0 else "text-red"
-                })
-            except: continue
-    except: pass
+    for symbol in TOP_CRYPTOS[:limit]:
+        quote = movers.tracker.quote(symbol)
+        if quote is None: continue
+        change_pct = quote['change']
+        data.append({
+            "symbol": symbol,
+            "price": smart_format(quote['price']),
+            "change": f"{change_pct:+.2f}%",
+            "change_raw": change_pct,
+            "icon": quote['icon'],
+            "color": "text-green" if change_pct >= 0 else "text-red"
+        })
     return data
 
 def get_quick_ticker_data():
-    tickers = ['BTC-USD', 'ETH-USD', 'SOL-USD']
     data = []
-    try:
-        for t in tickers:
-            stock = yf.Ticker(t)
-            price = stock.fast_info.last_price
-            prev = stock.fast_info.previous_close
-            change = ((price - prev) / prev) * 100
-            data.append({
-                "symbol": t.replace("-USD", ""),
-                "price": smart_format(price),
-                "change": f"{abs(change):.2f}",
-                "color": "green" if change >= 0 else "red",
-                "sign": "+" if change >= 0 else "-"
-            })
-    except: pass
+    for quote in get_top_cryptos(limit=3):
+        change = quote['change_raw']
+        data.append({
+            "symbol": quote['symbol'],
+            "price": quote['price'],
+            "change": f"{abs(change):.2f}",
+            "color": "green" if change >= 0 else "red",
+            "sign": "+" if change >= 0 else "-"
+        })
     return data
\ No newline at end of file